@@ -0,0 +1,257 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from archive.binary import ArchiveFile, save_transcription
+from archive.search import to_iso_date
+from asr.analytics import compute_analytics, count_words
+from asr.transcription import Transcription
+
+# per-meeting values summed up by month
+TOTALS = ["duration", "speech_time", "turns", "words", "interruptions"]
+
+
+def count_words_in_blob(blob: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Words of the utf-8 texts blob[offsets[i]:offsets[i + 1]] without decoding
+    them: a word starts at a non-space byte following a space or a text start.
+    """
+    if len(offsets) < 2:
+        return np.zeros(0, dtype=np.int64)
+    blob = blob[offsets[0] : offsets[-1]]
+    offsets = offsets.astype(np.int64) - int(offsets[0])
+    # ASCII whitespace and control bytes, utf-8 letters are all above them
+    space = blob <= 32
+    after_space = np.empty(len(blob), dtype=bool)
+    after_space[1:] = space[:-1]
+    after_space[offsets[:-1][offsets[:-1] < len(blob)]] = True
+    word_starts = np.flatnonzero(after_space & ~space)
+    return np.diff(np.searchsorted(word_starts, offsets))
+
+
+def archive_file_analytics(archive_file: ArchiveFile) -> Dict[str, Any]:
+    """compute_analytics() straight from the columns, the texts stay undecoded."""
+    return compute_analytics(
+        archive_file.column("result_start"),
+        archive_file.column("result_end"),
+        archive_file.column("result_speaker"),
+        count_words_in_blob(
+            archive_file.column("texts"), archive_file.column("result_text")
+        ),
+        archive_file.column("diarization_start"),
+        archive_file.column("diarization_end"),
+        archive_file.column("diarization_speaker"),
+        archive_file.header["speaker_names"],
+    )
+
+
+def transcript_analytics(transcript: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    compute_analytics() of Summary.to_dict()["transcript"] or a saved
+    Transcription. Only merged turns are saved, so they are the diarization too.
+    """
+    names = sorted({row["speaker"] for row in transcript})
+    speaker_ids = {name: i for i, name in enumerate(names)}
+    starts = np.array([row["start"] for row in transcript], dtype=np.float64)
+    ends = np.array([row["end"] for row in transcript], dtype=np.float64)
+    speakers = np.array([speaker_ids[row["speaker"]] for row in transcript])
+    words = count_words([row["text"] for row in transcript])
+    return compute_analytics(
+        starts, ends, speakers, words, starts, ends, speakers, names
+    )
+
+
+def file_analytics(path) -> Dict[str, Any]:
+    """
+    Analytics of an archived .azr or JSON summary or transcription, with
+    the meeting id, the path and the meeting date, the file's modification
+    time when it was saved without one.
+    """
+    date = None
+    if path.endswith(".azr"):
+        with ArchiveFile(path) as archive_file:
+            analytics = archive_file_analytics(archive_file)
+            date = archive_file.header.get("summary", {}).get("creation_date")
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "analytics" in data:
+            # saved summaries come with the analytics of the full diarization
+            date = data.get("creation_date")
+            analytics = dict(data["analytics"])
+        else:
+            if isinstance(data, dict):
+                date = data.get("creation_date")
+                data = data.get("transcript") or []
+            analytics = transcript_analytics(data)
+    if date is None:
+        date = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    analytics["meeting_id"] = os.path.splitext(os.path.basename(path))[0]
+    analytics["path"] = path
+    analytics["date"] = to_iso_date(date)
+    return analytics
+
+
+def scan_archive(paths: Iterable[str], verbose=False) -> List[Dict[str, Any]]:
+    meetings = []
+    for path in paths:
+        meetings.append(file_analytics(path))
+        if verbose and len(meetings) % 1000 == 0:
+            print(f"Scanned {len(meetings)} meetings")
+    return meetings
+
+
+def aggregate_by_month(meetings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Totals and ratios of the meetings of every month, oldest first."""
+    if not meetings:
+        return []
+    months, month_ids = np.unique(
+        [meeting["date"][:7] for meeting in meetings], return_inverse=True
+    )
+    n_months = len(months)
+
+    def total(values):
+        return np.bincount(month_ids, weights=values, minlength=n_months)
+
+    totals = {
+        field: total([meeting[field] for meeting in meetings]) for field in TOTALS
+    }
+    overlap_time = total(
+        [meeting["overlap_ratio"] * meeting["speech_time"] for meeting in meetings]
+    )
+    counts = np.bincount(month_ids, minlength=n_months)
+    speakers = [{} for _ in range(n_months)]
+    for month_id, meeting in zip(month_ids, meetings):
+        for name, stats in meeting["speakers"].items():
+            month_stats = speakers[month_id].setdefault(
+                name, {"meetings": 0, "talk_time": 0.0, "turns": 0, "words": 0}
+            )
+            month_stats["meetings"] += 1
+            for field in ("talk_time", "turns", "words"):
+                month_stats[field] += stats[field]
+
+    def ratio(numerator, denominator):
+        return np.divide(
+            numerator,
+            denominator,
+            out=np.zeros(n_months),
+            where=denominator > 0,
+        )
+
+    speech_time, duration = totals["speech_time"], totals["duration"]
+    overlap_ratio = ratio(overlap_time, speech_time)
+    silence_ratio = ratio(duration - speech_time, duration)
+    words_per_minute = ratio(totals["words"], speech_time / 60)
+    interruptions_per_hour = ratio(totals["interruptions"], duration / 3600)
+    return [
+        {
+            "month": str(month),
+            "meetings": int(counts[i]),
+            "duration": float(duration[i]),
+            "speech_time": float(speech_time[i]),
+            "overlap_ratio": float(overlap_ratio[i]),
+            "silence_ratio": float(silence_ratio[i]),
+            "turns": int(totals["turns"][i]),
+            "words": int(totals["words"][i]),
+            "words_per_minute": float(words_per_minute[i]),
+            "interruptions": int(totals["interruptions"][i]),
+            "interruptions_per_hour": float(interruptions_per_hour[i]),
+            "speakers": speakers[i],
+        }
+        for i, month in enumerate(months)
+    ]
+
+
+def make_synthetic_transcription(n_turns, n_speakers, rng: random.Random):
+    """A meeting-like transcription: speakers take turns, sometimes over each other."""
+    speakers = [f"SPEAKER_{i:02d}" for i in range(n_speakers)]
+    words = "да нет база миграция релиз сервер клиент бюджет срок задача".split()
+    result = []
+    position = 0.0
+    for _ in range(n_turns):
+        start = position + rng.uniform(-1.5, 2.0)
+        end = max(start, position) + rng.uniform(1, 30)
+        text = " ".join(rng.choices(words, k=int((end - start) * 2.5)))
+        result.append((round(start, 2), round(end, 2), text, rng.choice(speakers)))
+        position = end
+    return Transcription.from_aligned(
+        [(start, end, text) for start, end, text, _ in result],
+        [(start, end, speaker) for start, end, _, speaker in result],
+        result,
+        speakers,
+        dict(zip(speakers, Transcription.COLORS)),
+    )
+
+
+def benchmark(n_meetings, n_turns, directory=None):
+    """Scan n_meetings synthetic .azr meetings spread over a year."""
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+        start = time.perf_counter()
+        paths = []
+        now = time.time()
+        for i in range(n_meetings):
+            path = os.path.join(tmp_dir, f"meeting_{i}.azr")
+            transcription = make_synthetic_transcription(
+                n_turns, rng.randint(2, 8), rng
+            )
+            save_transcription(transcription, path)
+            mtime = now - rng.uniform(0, 365 * 24 * 3600)
+            os.utime(path, (mtime, mtime))
+            paths.append(path)
+        print(f"Wrote {n_meetings} meetings in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        meetings = scan_archive(paths)
+        months = aggregate_by_month(meetings)
+        elapsed = time.perf_counter() - start
+    print(
+        f"Scanned {n_meetings} meetings of {n_turns} turns and aggregated "
+        f"{len(months)} months in {elapsed:.2f}s "
+        f"({elapsed / n_meetings * 1000:.2f}ms per meeting)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scan_parser = subparsers.add_parser(
+        "scan", help="Aggregate archived .azr or JSON meetings by month"
+    )
+    scan_parser.add_argument("paths", nargs="+")
+    scan_parser.add_argument("--output", help="Save the months and meetings as JSON")
+    benchmark_parser = subparsers.add_parser("benchmark")
+    benchmark_parser.add_argument("--meetings", type=int, default=2000)
+    benchmark_parser.add_argument("--turns", type=int, default=500)
+    benchmark_parser.add_argument("--dir", help="Where to write the test archive")
+    args = parser.parse_args()
+    if args.command == "benchmark":
+        benchmark(args.meetings, args.turns, args.dir)
+    else:
+        start = time.perf_counter()
+        meetings = scan_archive(args.paths, verbose=True)
+        months = aggregate_by_month(meetings)
+        for month in months:
+            print(
+                f"{month['month']}: {month['meetings']} meetings, "
+                f"{month['duration'] / 3600:.1f} h, "
+                f"silence {month['silence_ratio']:.0%}, "
+                f"overlap {month['overlap_ratio']:.0%}, "
+                f"{month['words_per_minute']:.0f} words/min, "
+                f"{month['interruptions_per_hour']:.1f} interruptions/h"
+            )
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"months": months, "meetings": meetings},
+                    f,
+                    ensure_ascii=False,
+                    indent=4,
+                )
+        print(f"Scanned {len(meetings)} meetings in {time.perf_counter() - start:.1f}s")
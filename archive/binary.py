@@ -0,0 +1,284 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from typing import List
+
+import numpy as np
+
+from asr.transcription import Transcription
+from summarization.summary import Summary
+
+MAGIC = b"AZRB"
+FORMAT_VERSION = 1
+# magic, version, reserved, header length
+PREAMBLE = struct.Struct("<4sHHI")
+ALIGNMENT = 8
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _pack_texts(texts, blob):
+    """Append utf-8 texts to the blob, return their offsets (one more than texts)."""
+    offsets = np.empty(len(texts) + 1, dtype=np.uint64)
+    offsets[0] = position = len(blob)
+    for i, text in enumerate(texts):
+        encoded = text.encode("utf-8")
+        blob += encoded
+        position += len(encoded)
+        offsets[i + 1] = position
+    return offsets
+
+
+def _columns(transcription: Transcription):
+    result = transcription.result
+    segments = transcription.texts_with_timestamps
+    diarization = transcription.timestamps_speakers
+    names = sorted(
+        {speaker for *_, speaker in result} | {speaker for *_, speaker in diarization}
+    )
+    speaker_ids = {name: i for i, name in enumerate(names)}
+    blob = bytearray()
+    start = np.array([r[0] for r in result], dtype=np.float64)
+    end = np.array([r[1] for r in result], dtype=np.float64)
+    # time index: turns ordered by start, with the running maximum of their
+    # ends, so the turns overlapping a range are found by binary search
+    order = np.argsort(start, kind="stable").astype(np.uint32)
+    columns = {
+        "result_start": start,
+        "result_end": end,
+        "result_speaker": np.array(
+            [speaker_ids[r[3]] for r in result], dtype=np.uint32
+        ),
+        "result_text": _pack_texts([r[2] for r in result], blob),
+        "segment_start": np.array([s[0] for s in segments], dtype=np.float64),
+        "segment_end": np.array([s[1] for s in segments], dtype=np.float64),
+        "segment_text": _pack_texts([s[2] for s in segments], blob),
+        "diarization_start": np.array([d[0] for d in diarization], dtype=np.float64),
+        "diarization_end": np.array([d[1] for d in diarization], dtype=np.float64),
+        "diarization_speaker": np.array(
+            [speaker_ids[d[2]] for d in diarization], dtype=np.uint32
+        ),
+        "index_order": order,
+        "index_start": start[order],
+        "index_max_end": np.maximum.accumulate(end[order]),
+        "texts": np.frombuffer(bytes(blob), dtype=np.uint8),
+    }
+    header = {
+        "speaker_names": names,
+        "speakers": list(transcription.speakers),
+        "speaker2color": transcription.speaker2color,
+    }
+    return header, columns
+
+
+def _write(path, header, columns):
+    sections = {}
+    offset = 0
+    for name, array in columns.items():
+        sections[name] = [offset, len(array), array.dtype.str]
+        offset = _align(offset + array.nbytes)
+    header = dict(header, version=FORMAT_VERSION, sections=sections)
+    encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_offset = _align(PREAMBLE.size + len(encoded))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(encoded)))
+        f.write(encoded)
+        for name, array in columns.items():
+            f.seek(data_offset + sections[name][0])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def save_transcription(transcription: Transcription, path):
+    header, columns = _columns(transcription)
+    _write(path, dict(header, kind="transcription"), columns)
+
+
+def save_summary(summary: Summary, path):
+    header, columns = _columns(summary.transcription)
+    header["kind"] = "summary"
+    header["summary"] = {
+        "title": summary.title,
+        "short_summary": summary.short_summary,
+        "structured_summary": summary.structured_summary,
+        "keywords": summary.keywords,
+        "creation_date": summary.get_creation_date(),
+    }
+    _write(path, header, columns)
+
+
+class ArchiveFile:
+    """
+    Reads a file written by save_transcription() or save_summary(). The
+    arrays are views of the memory-mapped file, so opening it reads only
+    the header and slice() touches only the pages of the requested turns.
+
+    Layout, little-endian: magic "AZRB", format version (uint16), reserved
+    (uint16), header length (uint32), JSON header, then 8-byte aligned
+    columns listed in header["sections"] as [offset, length, dtype].
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, header_length = PREAMBLE.unpack_from(self._mmap)
+        assert magic == MAGIC, f"{path} is not an archive file"
+        assert version <= FORMAT_VERSION, (
+            f"{path} has format version {version}, "
+            f"only {FORMAT_VERSION} and older are supported"
+        )
+        self.header = json.loads(
+            self._mmap[PREAMBLE.size : PREAMBLE.size + header_length].decode("utf-8")
+        )
+        self._data_offset = _align(PREAMBLE.size + header_length)
+        self._columns = {}
+
+    def close(self):
+        """
+        Arrays returned by column() stay valid after closing: while any of
+        them is alive the mapping is left to be unmapped with the last one.
+        """
+        self._columns = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.header["sections"]["result_start"][1]
+
+    def column(self, name) -> np.ndarray:
+        if name not in self._columns:
+            offset, length, dtype = self.header["sections"][name]
+            self._columns[name] = np.frombuffer(
+                self._mmap,
+                dtype=np.dtype(dtype),
+                count=length,
+                offset=self._data_offset + offset,
+            )
+        return self._columns[name]
+
+    def _texts(self, name, indices=None):
+        offsets = self.column(name)
+        texts = self.column("texts")
+        if indices is None:
+            indices = range(len(offsets) - 1)
+        return [
+            texts[offsets[i] : offsets[i + 1]].tobytes().decode("utf-8")
+            for i in indices
+        ]
+
+    def _result(self, indices=None):
+        names = self.header["speaker_names"]
+        columns = [self.column(f"result_{name}") for name in ("start", "end")]
+        speakers = self.column("result_speaker")
+        if indices is None:
+            indices = range(len(self))
+        texts = self._texts("result_text", indices)
+        return [
+            (float(columns[0][i]), float(columns[1][i]), text, names[speakers[i]])
+            for i, text in zip(indices, texts)
+        ]
+
+    def load_transcription(self) -> Transcription:
+        names = self.header["speaker_names"]
+        segment_texts = self._texts("segment_text")
+        segments = list(
+            zip(
+                self.column("segment_start").tolist(),
+                self.column("segment_end").tolist(),
+                segment_texts,
+            )
+        )
+        diarization = [
+            (start, end, names[speaker])
+            for start, end, speaker in zip(
+                self.column("diarization_start").tolist(),
+                self.column("diarization_end").tolist(),
+                self.column("diarization_speaker").tolist(),
+            )
+        ]
+        return Transcription.from_aligned(
+            segments,
+            diarization,
+            self._result(),
+            list(self.header["speakers"]),
+            dict(self.header["speaker2color"]),
+        )
+
+    def load_summary(self) -> Summary:
+        assert self.header["kind"] == "summary", f"{self.path} holds no summary"
+        data = dict(self.header["summary"])
+        creation_date = data.pop("creation_date")
+        summary = Summary(transcription=self.load_transcription(), **data)
+        summary._creation_date = creation_date
+        return summary
+
+    def find(self, start_sec: float, end_sec: float) -> List[int]:
+        """Indices of the turns overlapping [start_sec, end_sec], in transcript order."""
+        index_start = self.column("index_start")
+        first = np.searchsorted(self.column("index_max_end"), start_sec, "left")
+        last = np.searchsorted(index_start, end_sec, "right")
+        order = self.column("index_order")[first:last]
+        end = self.column("result_end")[order]
+        return np.sort(order[end >= start_sec]).tolist()
+
+    def slice(self, start_sec: float, end_sec: float) -> Transcription:
+        """The turns overlapping [start_sec, end_sec] as a Transcription of their own."""
+        result = self._result(self.find(start_sec, end_sec))
+        speakers = sorted({speaker for *_, speaker in result})
+        speaker2color = self.header["speaker2color"]
+        return Transcription.from_aligned(
+            [(start, end, text) for start, end, text, _ in result],
+            [(start, end, speaker) for start, end, _, speaker in result],
+            result,
+            speakers,
+            {s: speaker2color[s] for s in speakers if s in speaker2color},
+        )
+
+
+def load_transcription(path) -> Transcription:
+    with ArchiveFile(path) as archive_file:
+        return archive_file.load_transcription()
+
+
+def load_summary(path) -> Summary:
+    with ArchiveFile(path) as archive_file:
+        return archive_file.load_summary()
+
+
+if __name__ == "__main__":
+    # converts JSON summaries or transcriptions to the binary format
+    parser = argparse.ArgumentParser()
+    parser.add_argument("json_paths", nargs="+")
+    parser.add_argument(
+        "--kind", choices=["summary", "transcription"], default="summary"
+    )
+    parser.add_argument("--output-dir", help="Defaults to the directory of each file")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    for path in args.json_paths:
+        output_path = os.path.splitext(path)[0] + ".azr"
+        if args.output_dir:
+            output_path = os.path.join(args.output_dir, os.path.basename(output_path))
+        if args.kind == "summary":
+            save_summary(Summary.from_json(path), output_path)
+        else:
+            save_transcription(Transcription.from_json(path), output_path)
+    print(
+        f"Converted {len(args.json_paths)} files in {time.perf_counter() - start:.1f}s"
+    )
@@ -0,0 +1,288 @@
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from config import config
+from summarization.keywords import WORD_PATTERN, stem
+from summarization.summary import Summary
+
+# matches in titles and keywords say more about a meeting than a passing remark
+KIND_WEIGHTS = {
+    "title": 3.0,
+    "keyword": 3.0,
+    "topic": 2.0,
+    "short_summary": 1.5,
+    "point": 1.5,
+    "turn": 1.0,
+}
+CREATION_DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id INTEGER PRIMARY KEY,
+    meeting_id TEXT NOT NULL UNIQUE,
+    title TEXT,
+    date TEXT,
+    speakers TEXT,
+    keywords TEXT,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS meetings_date ON meetings (date);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    meeting INTEGER NOT NULL REFERENCES meetings (id),
+    kind TEXT NOT NULL,
+    weight REAL NOT NULL,
+    speaker TEXT,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_meeting ON entries (meeting);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    text, content='entries', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='3'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def to_iso_date(value):
+    if value is None or isinstance(value, str) and not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    try:
+        return to_iso_date(datetime.datetime.strptime(value, CREATION_DATE_FORMAT))
+    except ValueError:
+        # already ISO, possibly without the time
+        return value
+
+
+def build_query(text):
+    """
+    Turn plain words into an FTS5 query matching all of them in any form:
+    every word is reduced to its stem and matched as a prefix.
+    """
+    terms = [stem(word.lower()) for word in WORD_PATTERN.findall(text)]
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+class ArchiveIndex:
+    """
+    Full-text index over archived summaries in SQLite FTS5. Titles, keywords,
+    topics, points, short summaries and transcript turns are indexed as
+    separate entries, so a match points to the speaker and time it was said.
+    Meetings are added one by one, adding a meeting again replaces it.
+    """
+
+    def __init__(self, path=config.archive.index_path):
+        self.path = path
+        index_dir = os.path.dirname(path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def get_entries(data: Dict[str, Any]):
+        """(kind, speaker, start, end, text) of everything searchable in a summary."""
+        entries = [("title", None, None, None, data.get("title") or "")]
+        entries.extend(
+            ("keyword", None, None, None, keyword)
+            for keyword in data.get("keywords") or []
+        )
+        entries.append(("short_summary", None, None, None, data.get("short_summary")))
+        for topic in data.get("structured_summary") or []:
+            entries.append(("topic", None, None, None, topic["topic"]))
+            entries.extend(
+                ("point", None, None, None, point) for point in topic["points"]
+            )
+        entries.extend(
+            ("turn", turn["speaker"], turn["start"], turn["end"], turn["text"])
+            for turn in data.get("transcript") or []
+        )
+        return [entry for entry in entries if entry[-1]]
+
+    def _remove(self, meeting_id):
+        row = self._connection.execute(
+            "SELECT id FROM meetings WHERE meeting_id = ?", (meeting_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        self._connection.execute("DELETE FROM entries WHERE meeting = ?", (row["id"],))
+        self._connection.execute("DELETE FROM meetings WHERE id = ?", (row["id"],))
+        return True
+
+    def _add(self, meeting_id, data, path=None):
+        self._remove(meeting_id)
+        cursor = self._connection.execute(
+            "INSERT INTO meetings (meeting_id, title, date, speakers, keywords, path) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                meeting_id,
+                data.get("title"),
+                to_iso_date(data.get("creation_date")),
+                json.dumps(sorted(data.get("speakers") or []), ensure_ascii=False),
+                json.dumps(data.get("keywords") or [], ensure_ascii=False),
+                path,
+            ),
+        )
+        self._connection.executemany(
+            "INSERT INTO entries (meeting, kind, weight, speaker, start, end, text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (cursor.lastrowid, kind, KIND_WEIGHTS[kind], speaker, start, end, text)
+                for kind, speaker, start, end, text in self.get_entries(data)
+            ],
+        )
+
+    def add(self, meeting_id, summary: Union[Summary, Dict[str, Any]], path=None):
+        """Index a Summary or the output of Summary.to_dict()."""
+        if isinstance(summary, Summary):
+            summary = summary.to_dict()
+        with self._lock, self._connection:
+            self._add(meeting_id, summary, path)
+
+    def add_files(self, paths: Iterable[str]):
+        """Index summary JSON files in one transaction, the file name is the meeting id."""
+        added = 0
+        with self._lock, self._connection:
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                meeting_id = os.path.splitext(os.path.basename(path))[0]
+                self._add(meeting_id, data, path)
+                added += 1
+        return added
+
+    def remove(self, meeting_id):
+        with self._lock, self._connection:
+            return self._remove(meeting_id)
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM meetings"
+            ).fetchone()
+        return count
+
+    def search(
+        self,
+        query: str,
+        speakers: Optional[List[str]] = None,
+        date_from=None,
+        date_to=None,
+        kinds: Optional[List[str]] = None,
+        limit: int = 20,
+        raw: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Ranked matches of all query words in any word form. raw=True passes
+        the query to FTS5 as is, e.g. for phrases, OR and NEAR. speakers
+        restricts the matches to what they said, date_from and date_to
+        (dates, datetimes or ISO strings) to meetings in that range.
+        """
+        match = query if raw else build_query(query)
+        if not match:
+            return []
+        conditions = ["entries_fts MATCH ?"]
+        params: List[Any] = [match]
+        if speakers:
+            conditions.append(f"e.speaker IN ({', '.join('?' * len(speakers))})")
+            params.extend(speakers)
+        if kinds:
+            assert all(
+                kind in KIND_WEIGHTS for kind in kinds
+            ), f"kinds should be among {list(KIND_WEIGHTS)}"
+            conditions.append(f"e.kind IN ({', '.join('?' * len(kinds))})")
+            params.extend(kinds)
+        if date_from is not None:
+            conditions.append("m.date >= ?")
+            params.append(to_iso_date(date_from))
+        if date_to is not None:
+            # a bare date includes the whole day
+            date_to = to_iso_date(date_to)
+            conditions.append(
+                "m.date <= ?" if len(date_to) > 10 else "m.date < date(?, '+1 day')"
+            )
+            params.append(date_to)
+        params.append(limit)
+        sql = (
+            "SELECT m.meeting_id, m.title, m.date, m.path, e.kind, e.speaker, "
+            "e.start, e.end, e.text, "
+            "snippet(entries_fts, 0, '[', ']', '…', 16) AS snippet, "
+            "bm25(entries_fts) * e.weight AS rank "
+            "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+            "JOIN meetings m ON m.id = e.meeting "
+            f"WHERE {' AND '.join(conditions)} "
+            "ORDER BY rank LIMIT ?"
+        )
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_meetings(self, query: str, limit: int = 10, **kwargs):
+        """Best match of every meeting, for "the meeting where X discussed Y"."""
+        meetings = {}
+        for match in self.search(query, limit=limit * 20, **kwargs):
+            meetings.setdefault(match["meeting_id"], match)
+            if len(meetings) == limit:
+                break
+        return list(meetings.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="Add summary JSON files")
+    index_parser.add_argument("summary_paths", nargs="+")
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--speaker", action="append")
+    query_parser.add_argument("--from", dest="date_from")
+    query_parser.add_argument("--to", dest="date_to")
+    query_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    index = ArchiveIndex()
+    start = time.perf_counter()
+    if args.command == "index":
+        added = index.add_files(args.summary_paths)
+        print(
+            f"Indexed {added} meetings in {time.perf_counter() - start:.1f}s, "
+            f"{len(index)} in total"
+        )
+    else:
+        matches = index.search(
+            args.query,
+            speakers=args.speaker,
+            date_from=args.date_from,
+            date_to=args.date_to,
+            limit=args.limit,
+        )
+        for match in matches:
+            where = match["speaker"] or match["kind"]
+            if match["start"] is not None:
+                where += f" {match['start']} - {match['end']}"
+            print(f"{match['date']} {match['title']} | {where}: {match['snippet']}")
+        print(f"{len(matches)} matches in {(time.perf_counter() - start) * 1000:.1f}ms")
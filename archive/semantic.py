@@ -0,0 +1,354 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+from asr.transcription import Transcription
+from config import config
+from summarization.summary import Summary
+
+CHUNK_ROWS = 16384
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU embeddings, needs the optional sentence-transformers package."""
+
+    def __init__(
+        self,
+        model_name=config.archive.embedding_model,
+        batch_size=config.archive.embedding_batch_size,
+        query_prefix=config.archive.query_prefix,
+        passage_prefix=config.archive.passage_prefix,
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "Semantic search requires sentence-transformers: "
+                "pip install sentence-transformers"
+            )
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.query_prefix = query_prefix
+        self.passage_prefix = passage_prefix
+
+    def _embed(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+
+    def embed_passages(self, texts: List[str]) -> np.ndarray:
+        return self._embed([self.passage_prefix + text for text in texts])
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._embed([self.query_prefix + text])[0]
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def nearest_centroids(matrix, centroids):
+    """Index of the closest centroid of every row, computed in chunks."""
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), CHUNK_ROWS):
+        chunk = np.asarray(matrix[start : start + CHUNK_ROWS], dtype=np.float32)
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, 1)
+    return assignments
+
+
+def train_centroids(sample, n_lists, iterations=10, seed=0):
+    """Spherical k-means: centroids of unit vectors compared by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(sample))
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+        # an empty list keeps its centroid
+        filled = counts > 0
+        centroids[filled] = normalize(sums[filled])
+    return centroids
+
+
+class SemanticIndex:
+    """
+    Embeddings of transcript turns and structured summary points of archived
+    meetings. The vectors are unit-normalized float16 rows appended to one
+    file and memory-mapped for queries, their meeting, speaker, time range
+    and text are kept in SQLite under the same row numbers. Adding a meeting
+    appends to both, the matrix is never rewritten.
+
+    Queries score the whole matrix chunk by chunk. Past ivf_min_rows rows the
+    rows are clustered once (IVF) and queries only score the rows of the
+    ivf_probes closest clusters. Later rows are assigned to a cluster as they
+    are appended.
+    """
+
+    def __init__(
+        self,
+        directory=config.archive.embeddings_dir,
+        embedder=None,
+        min_turn_words=config.archive.min_turn_words,
+        ivf_min_rows=config.archive.ivf_min_rows,
+        ivf_lists=config.archive.ivf_lists,
+        ivf_probes=config.archive.ivf_probes,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._embedder = embedder
+        self.min_turn_words = min_turn_words
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.assignments_path = os.path.join(directory, "assignments.i32")
+        self.centroids_path = os.path.join(directory, "centroids.npy")
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(directory, "rows.sqlite"), timeout=30, check_same_thread=False
+        )
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "id INTEGER PRIMARY KEY, meeting_id TEXT NOT NULL, kind TEXT NOT NULL, "
+                "speaker TEXT, start REAL, end REAL, text TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS rows_meeting ON rows (meeting_id)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+            )
+        (self.size,) = self._connection.execute("SELECT COUNT(*) FROM rows").fetchone()
+        dim = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'dim'"
+        ).fetchone()
+        self.dim = dim[0] if dim else None
+        self.centroids = (
+            np.load(self.centroids_path)
+            if os.path.isfile(self.centroids_path)
+            else None
+        )
+        self._truncate_files()
+        self._matrix = None
+        self._assignments = None
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = SentenceTransformerEmbedder()
+        return self._embedder
+
+    def _truncate_files(self):
+        # vectors are written before their rows are committed, an interrupted
+        # append leaves vectors without rows behind
+        if self.dim is not None and os.path.isfile(self.vectors_path):
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(self.size * self.dim * 2)
+        if self.centroids is not None and os.path.isfile(self.assignments_path):
+            with open(self.assignments_path, "r+b") as f:
+                f.truncate(self.size * 4)
+
+    def get_matrix(self):
+        if self._matrix is None or len(self._matrix) != self.size:
+            self._matrix = np.memmap(
+                self.vectors_path,
+                dtype=np.float16,
+                mode="r",
+                shape=(self.size, self.dim),
+            )
+        return self._matrix
+
+    def get_assignments(self):
+        if self._assignments is None or len(self._assignments) != self.size:
+            self._assignments = np.memmap(
+                self.assignments_path, dtype=np.int32, mode="r", shape=(self.size,)
+            )
+        return self._assignments
+
+    def get_rows(
+        self, obj: Union[Summary, Transcription, Dict[str, Any], List[Dict[str, Any]]]
+    ):
+        """(kind, speaker, start, end, text) of the turns and points to embed."""
+        structured_summary = []
+        if isinstance(obj, Summary):
+            structured_summary = obj.structured_summary
+            turns = obj.transcription.result
+        elif isinstance(obj, Transcription):
+            turns = obj.result
+        else:
+            if isinstance(obj, dict):
+                structured_summary = obj.get("structured_summary") or []
+                obj = obj.get("transcript") or []
+            turns = [(r["start"], r["end"], r["text"], r["speaker"]) for r in obj]
+        rows = [
+            ("turn", speaker, start, end, text)
+            for start, end, text, speaker in turns
+            # backchannels such as "да, понятно" match everything
+            if len(text.split()) >= self.min_turn_words
+        ]
+        rows.extend(
+            ("point", None, None, None, f"{topic['topic']}: {point}")
+            for topic in structured_summary
+            for point in topic["points"]
+        )
+        return rows
+
+    def __contains__(self, meeting_id):
+        return (
+            self._connection.execute(
+                "SELECT 1 FROM rows WHERE meeting_id = ? LIMIT 1", (meeting_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def add(self, meeting_id, obj) -> int:
+        """Embed and append a meeting, returns the number of added rows."""
+        with self._lock:
+            if meeting_id in self:
+                return 0
+            rows = self.get_rows(obj)
+            if not rows:
+                return 0
+            vectors = normalize(
+                np.asarray(self.embedder.embed_passages([row[-1] for row in rows]))
+            )
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT INTO meta VALUES ('dim', ?)", (self.dim,)
+                    )
+            assert (
+                vectors.shape[1] == self.dim
+            ), f"Embedding size {vectors.shape[1]} does not match the index ({self.dim})"
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            if self.centroids is not None:
+                with open(self.assignments_path, "ab") as f:
+                    f.write(nearest_centroids(vectors, self.centroids).tobytes())
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(self.size + i, meeting_id, *row) for i, row in enumerate(rows)],
+                )
+            self.size += len(rows)
+            if self.centroids is None and self.size >= self.ivf_min_rows:
+                self.train_ivf()
+        return len(rows)
+
+    def train_ivf(self, sample_size=None):
+        """Cluster the rows and assign every row to its closest cluster."""
+        matrix = self.get_matrix()
+        # ~256 rows per list are enough for k-means to place the centroids
+        sample_size = min(self.size, sample_size or self.ivf_lists * 256)
+        rng = np.random.default_rng(0)
+        sample = np.asarray(
+            matrix[np.sort(rng.choice(self.size, sample_size, replace=False))],
+            dtype=np.float32,
+        )
+        centroids = train_centroids(sample, self.ivf_lists)
+        nearest_centroids(matrix, centroids).tofile(self.assignments_path)
+        np.save(self.centroids_path, centroids)
+        self.centroids = centroids
+        self._assignments = None
+
+    def _candidates(self, query_vector, probes):
+        if self.centroids is None:
+            return None
+        probes = probes or self.ivf_probes
+        closest = np.argsort(self.centroids @ query_vector)[::-1][:probes]
+        return np.flatnonzero(np.isin(self.get_assignments(), closest))
+
+    def search(self, query: str, k: int = 10, probes=None) -> List[Dict[str, Any]]:
+        """The k turns and points closest in meaning to the query."""
+        if self.size == 0:
+            return []
+        query_vector = normalize(np.asarray(self.embedder.embed_query(query)))
+        query_vector = query_vector.astype(np.float32)
+        matrix = self.get_matrix()
+        candidates = self._candidates(query_vector, probes)
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        total = self.size if candidates is None else len(candidates)
+        for start in range(0, total, CHUNK_ROWS):
+            if candidates is None:
+                ids = np.arange(start, min(start + CHUNK_ROWS, total))
+                chunk = matrix[start : start + CHUNK_ROWS]
+            else:
+                ids = candidates[start : start + CHUNK_ROWS]
+                chunk = matrix[ids]
+            scores = np.asarray(chunk, dtype=np.float32) @ query_vector
+            best_ids = np.concatenate([best_ids, ids])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_ids) > k:
+                top = np.argpartition(-best_scores, k)[:k]
+                best_ids, best_scores = best_ids[top], best_scores[top]
+        order = np.argsort(-best_scores)
+        best_ids, best_scores = best_ids[order], best_scores[order]
+        ids = [int(i) for i in best_ids]
+        rows = {
+            row[0]: row
+            for row in self._connection.execute(
+                "SELECT id, meeting_id, kind, speaker, start, end, text FROM rows "
+                f"WHERE id IN ({', '.join('?' * len(ids))})",
+                ids,
+            )
+        }
+        return [
+            {
+                "meeting_id": rows[i][1],
+                "kind": rows[i][2],
+                "speaker": rows[i][3],
+                "start": rows[i][4],
+                "end": rows[i][5],
+                "text": rows[i][6],
+                "score": float(score),
+            }
+            for i, score in zip(ids, best_scores)
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="Add summary JSON files")
+    index_parser.add_argument("summary_paths", nargs="+")
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("query")
+    query_parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    index = SemanticIndex()
+    start = time.perf_counter()
+    if args.command == "index":
+        added = 0
+        for path in args.summary_paths:
+            meeting_id = os.path.splitext(os.path.basename(path))[0]
+            with open(path, "r", encoding="utf-8") as f:
+                added += index.add(meeting_id, json.load(f))
+        print(
+            f"Added {added} rows in {time.perf_counter() - start:.1f}s, "
+            f"{index.size} in total"
+        )
+    else:
+        for match in index.search(args.query, k=args.k):
+            where = match["speaker"] or match["kind"]
+            if match["start"] is not None:
+                where += f" {match['start']} - {match['end']}"
+            print(
+                f"{match['score']:.3f} {match['meeting_id']} | {where}: {match['text']}"
+            )
+        print(f"Searched {index.size} rows in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,166 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def union_intervals(starts: np.ndarray, ends: np.ndarray):
+    """
+    Merge intervals sorted by start into disjoint blocks, return their bounds
+    and the index of the first interval of every block.
+    """
+    if len(starts) == 0:
+        return starts, ends, np.empty(0, dtype=np.int64)
+    max_end = np.maximum.accumulate(ends)
+    new_block = np.empty(len(starts), dtype=bool)
+    new_block[0] = True
+    new_block[1:] = starts[1:] > max_end[:-1]
+    first = np.flatnonzero(new_block)
+    return starts[first], np.maximum.reduceat(ends, first), first
+
+
+def speaker_blocks(starts, ends, speakers):
+    """
+    Union of the intervals of every speaker. Shifting each speaker's times
+    past the previous speaker's keeps the groups apart in one global union,
+    the bounds and speakers of the blocks are then taken from the unshifted
+    intervals.
+    """
+    if len(starts) == 0:
+        empty = np.empty(0)
+        return empty, empty, np.empty(0, dtype=np.int64)
+    order = np.lexsort((starts, speakers))
+    starts, ends, speakers = starts[order], ends[order], speakers[order]
+    shift = speakers * (ends.max() - starts.min() + 1)
+    _, _, first = union_intervals(starts + shift, ends + shift)
+    return starts[first], np.maximum.reduceat(ends, first), speakers[first]
+
+
+def compute_analytics(
+    turn_starts,
+    turn_ends,
+    turn_speakers,
+    turn_words,
+    segment_starts,
+    segment_ends,
+    segment_speakers,
+    speaker_names: List[str],
+) -> Dict[str, Any]:
+    """
+    Talk time, turns, words per minute and interruptions per speaker, and the
+    overlap and silence ratios of a meeting. Turns are the aligned transcript
+    (Transcription.result), segments are the diarization
+    (Transcription.timestamps_speakers). Speakers are indices into
+    speaker_names. Times are in seconds.
+    """
+    n_speakers = len(speaker_names)
+    turn_starts = np.asarray(turn_starts, dtype=np.float64)
+    turn_ends = np.asarray(turn_ends, dtype=np.float64)
+    turn_speakers = np.asarray(turn_speakers, dtype=np.int64)
+    turn_words = np.asarray(turn_words, dtype=np.int64)
+    segment_starts = np.asarray(segment_starts, dtype=np.float64)
+    segment_ends = np.asarray(segment_ends, dtype=np.float64)
+    segment_speakers = np.asarray(segment_speakers, dtype=np.int64)
+
+    starts, ends, speakers = speaker_blocks(
+        segment_starts, segment_ends, segment_speakers
+    )
+    talk_time = np.bincount(speakers, weights=ends - starts, minlength=n_speakers)
+
+    # sweep over the speaker blocks: how many people speak between two events
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts)), -np.ones(len(ends))])
+    # at equal times an end comes first, touching blocks do not overlap
+    order = np.lexsort((deltas, times))
+    times, active = times[order], np.cumsum(deltas[order])[:-1]
+    spans = np.diff(times)
+    speech_time = spans[active >= 1].sum()
+    overlap_time = spans[active >= 2].sum()
+    duration = float(times[-1] - times[0]) if len(times) else 0.0
+
+    # a segment starting while another speaker's segment is still going on
+    order = np.argsort(segment_starts, kind="stable")
+    starts, ends = segment_starts[order], segment_ends[order]
+    speakers = segment_speakers[order]
+    interrupts = (speakers[1:] != speakers[:-1]) & (starts[1:] < ends[:-1])
+    interruptions = np.bincount(speakers[1:][interrupts], minlength=n_speakers)
+
+    turns = np.bincount(turn_speakers, minlength=n_speakers)
+    words = np.bincount(turn_speakers, weights=turn_words, minlength=n_speakers)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        words_per_minute = np.where(talk_time > 0, words / (talk_time / 60), 0.0)
+
+    return {
+        "duration": duration,
+        "speech_time": float(speech_time),
+        "overlap_ratio": float(overlap_time / speech_time) if speech_time else 0.0,
+        "silence_ratio": float(1 - speech_time / duration) if duration else 0.0,
+        "turns": int(turns.sum()),
+        "words": int(words.sum()),
+        "words_per_minute": (
+            float(words.sum() / (speech_time / 60)) if speech_time else 0.0
+        ),
+        "interruptions": int(interruptions.sum()),
+        "speakers": {
+            name: {
+                "talk_time": float(talk_time[i]),
+                "talk_share": (
+                    float(talk_time[i] / talk_time.sum()) if talk_time.sum() else 0.0
+                ),
+                "turns": int(turns[i]),
+                "words": int(words[i]),
+                "words_per_minute": float(words_per_minute[i]),
+                "interruptions": int(interruptions[i]),
+            }
+            for i, name in enumerate(speaker_names)
+        },
+    }
+
+
+def count_words(texts) -> np.ndarray:
+    return np.fromiter(
+        map(len, map(str.split, texts)), dtype=np.int64, count=len(texts)
+    )
+
+
+def meeting_analytics(transcription) -> Dict[str, Any]:
+    """compute_analytics() of a Transcription."""
+    result = transcription.result
+    diarization = transcription.timestamps_speakers
+    names = sorted(
+        {speaker for *_, speaker in result} | {speaker for *_, speaker in diarization}
+    )
+    speaker_ids = {name: i for i, name in enumerate(names)}
+    return compute_analytics(
+        [r[0] for r in result],
+        [r[1] for r in result],
+        [speaker_ids[r[3]] for r in result],
+        count_words([r[2] for r in result]),
+        [d[0] for d in diarization],
+        [d[1] for d in diarization],
+        [speaker_ids[d[2]] for d in diarization],
+        names,
+    )
+
+
+def format_minutes(seconds):
+    return f"{seconds / 60:.1f} мин"
+
+
+def analytics_to_lines(analytics: Dict[str, Any]) -> List[str]:
+    """Human-readable lines for the reports."""
+    lines = [
+        f"Длительность: {format_minutes(analytics['duration'])}, "
+        f"тишина {analytics['silence_ratio']:.0%}, "
+        f"перекрытия речи {analytics['overlap_ratio']:.0%}, "
+        f"{analytics['words_per_minute']:.0f} слов/мин"
+    ]
+    speakers = sorted(
+        analytics["speakers"].items(), key=lambda item: -item[1]["talk_time"]
+    )
+    lines.extend(
+        f"{name}: {format_minutes(stats['talk_time'])} ({stats['talk_share']:.0%}), "
+        f"реплик {stats['turns']}, {stats['words_per_minute']:.0f} слов/мин, "
+        f"перебиваний {stats['interruptions']}"
+        for name, stats in speakers
+    )
+    return lines
@@ -21,8 +21,9 @@ def get_timestamps_speakers(diarization):
 
 
 class Diarizer:
-    def __init__(self, model=config.asr.diarization_model, **kwargs):
-        device = "cuda" if torch.cuda.is_available else "cpu"
+    def __init__(self, model=config.asr.diarization_model, device=None, **kwargs):
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
         self.pipeline = Pipeline.from_pretrained(
             model, use_auth_token=config.auth.hf_token
         ).to(torch.device(device))
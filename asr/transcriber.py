@@ -3,8 +3,6 @@ import argparse
 
 sys.path.append("automatic_zoom_reports")
 
-from asr.diarization import Diarizer
-from asr.recognition import Recognizer
 from asr.transcription import Transcription
 from asr.utils import extract_audio
 from config import config
@@ -18,17 +16,66 @@ class Transcriber:
         recognizer_model_dir=None,
         language=config.asr.language,
         diarizer_model=config.asr.diarization_model,
+        diarizer_device=None,
+        lazy=False,
     ):
-        if recognizer is None:
-            self.recognizer = Recognizer(
-                model_dir=recognizer_model_dir, language=language
+        self.recognizer_model_dir = recognizer_model_dir
+        self.language = language
+        self.diarizer_model = diarizer_model
+        self.diarizer_device = diarizer_device
+        self._recognizer = recognizer
+        self._diarizer = diarizer
+        if not lazy:
+            self.load()
+
+    @property
+    def recognizer(self):
+        # pisets and pyannote are imported on first use, so a process that
+        # only diarizes never pays for loading Whisper (and vice versa)
+        if self._recognizer is None:
+            from asr.recognition import Recognizer
+
+            self._recognizer = Recognizer(
+                model_dir=self.recognizer_model_dir, language=self.language
+            )
+        return self._recognizer
+
+    @recognizer.setter
+    def recognizer(self, recognizer):
+        self._recognizer = recognizer
+
+    @property
+    def diarizer(self):
+        if self._diarizer is None:
+            from asr.diarization import Diarizer
+
+            self._diarizer = Diarizer(
+                model=self.diarizer_model, device=self.diarizer_device
             )
-        else:
-            self.recognizer = recognizer
-        if diarizer is None:
-            self.diarizer = Diarizer(model=diarizer_model)
-        else:
-            self.diarizer = diarizer
+        return self._diarizer
+
+    @diarizer.setter
+    def diarizer(self, diarizer):
+        self._diarizer = diarizer
+
+    def load(self, recognition=True, diarization=True):
+        if recognition:
+            self.recognizer
+        if diarization:
+            self.diarizer
+        return self
+
+    def loaded_models(self):
+        return {
+            "recognizer": self._recognizer is not None,
+            "diarizer": self._diarizer is not None,
+        }
+
+    def recognize(self, input_path):
+        return self.recognizer.recognize(input_path)
+
+    def diarize(self, input_path):
+        return self.diarizer.diarize(input_path)
 
     def transcribe(self, input_path, from_video=False, verbose=True):
         VIDEO_FORMATS = ["mp4", "mkv", "avi"]
@@ -39,10 +86,10 @@ class Transcriber:
             input_path = extract_audio(input_path)
         if verbose:
             print("Recognizing audio...")
-        texts_with_timestamps = self.recognizer.recognize(input_path)
+        texts_with_timestamps = self.recognize(input_path)
         if verbose:
             print("Identifying speakers...")
-        diarization = self.diarizer.diarize(input_path)
+        diarization = self.diarize(input_path)
         return Transcription(texts_with_timestamps, diarization)
 
 
@@ -74,21 +74,22 @@ def align_transcripts_with_speakers(
 
 
 class Transcription:
+    COLORS = [
+        "red",
+        "green",
+        "blue",
+        "orange",
+        "pink",
+        "purple",
+        "brown",
+        "gray",
+    ]
+
     def __init__(
         self,
         texts_with_timestamps: List[Tuple[float, float, str]],
         timestamps_speakers: List[Tuple[float, float, str]],
     ):
-        self.COLORS = [
-            "red",
-            "green",
-            "blue",
-            "orange",
-            "pink",
-            "purple",
-            "brown",
-            "gray",
-        ]
         self.texts_with_timestamps = texts_with_timestamps
         self.timestamps_speakers = timestamps_speakers
         self.speakers = list(
@@ -100,6 +101,24 @@ class Transcription:
         )
         self.round_timestamps()
 
+    @classmethod
+    def from_aligned(
+        cls,
+        texts_with_timestamps: List[Tuple[float, float, str]],
+        timestamps_speakers: List[Tuple[float, float, str]],
+        result: List[Tuple[float, float, str, str]],
+        speakers: List[str],
+        speaker2color: Dict[str, str],
+    ):
+        """Restore a saved transcription as is, without aligning it again."""
+        transcription = cls.__new__(cls)
+        transcription.texts_with_timestamps = texts_with_timestamps
+        transcription.timestamps_speakers = timestamps_speakers
+        transcription.speakers = speakers
+        transcription.speaker2color = speaker2color
+        transcription.result = result
+        return transcription
+
     def round_timestamps(self, precision: int = 2):
         for i in range(len(self.result)):
             start, end, text, speaker = self.result[i]
@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import gc
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+
+sys.path.append("automatic_zoom_reports")
+
+from asr.transcriber import Transcriber
+from asr.utils import extract_audio
+
+VIDEO_FORMATS = ["mp4", "mkv", "avi"]
+
+# Set in the parent before the workers are forked. Children inherit the
+# already loaded models through copy-on-write pages instead of loading them again.
+_transcriber = None
+
+
+def share_model_memory(obj, max_depth=4):
+    """
+    Put every torch module reachable from obj into inference mode and move
+    its weights to shared memory, so forked workers never write to those pages.
+    """
+    try:
+        import torch
+    except ImportError:
+        return 0
+
+    shared = 0
+    seen = set()
+    stack = [(obj, 0)]
+    while stack:
+        current, depth = stack.pop()
+        if id(current) in seen or depth > max_depth:
+            continue
+        seen.add(id(current))
+        if isinstance(current, torch.nn.Module):
+            current.eval()
+            for parameter in current.parameters():
+                parameter.requires_grad_(False)
+            current.share_memory()
+            shared += 1
+            continue
+        if isinstance(current, (list, tuple)):
+            children = current
+        elif isinstance(current, dict):
+            children = current.values()
+        elif hasattr(current, "__dict__"):
+            children = vars(current).values()
+        else:
+            continue
+        for child in children:
+            if not isinstance(child, (str, bytes, int, float, bool, type(None))):
+                stack.append((child, depth + 1))
+    return shared
+
+
+def read_memory_usage(pid):
+    """
+    Return RSS and PSS of a process in bytes. PSS splits shared pages
+    between the processes that map them, so the sum over a pool is the real footprint.
+    """
+    usage = {"rss": 0, "pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip().lower()
+                if key in usage:
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+@contextlib.contextmanager
+def hidden_cuda_devices():
+    """
+    Hide the GPUs while models load: pisets picks the device itself, and CUDA
+    initialized in the parent cannot be used by forked workers.
+    """
+    previous = os.environ.get("CUDA_VISIBLE_DEVICES")
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["CUDA_VISIBLE_DEVICES"]
+        else:
+            os.environ["CUDA_VISIBLE_DEVICES"] = previous
+
+
+def _init_worker(num_threads):
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _run_task(task, input_path, from_video):
+    if from_video or input_path.split(".")[-1] in VIDEO_FORMATS:
+        # extract_audio writes to a fixed path by default, which would be shared by all workers
+        audio_path = os.path.join(tempfile.gettempdir(), f"audio_{os.getpid()}.wav")
+        input_path = extract_audio(input_path, audio_path)
+    if task == "recognize":
+        return _transcriber.recognize(input_path)
+    if task == "diarize":
+        return _transcriber.diarize(input_path)
+    return _transcriber.transcribe(input_path, verbose=False)
+
+
+class TranscriberPool:
+    """
+    Loads the recognition and diarization models once in the parent process
+    and forks workers that share the weights.
+    """
+
+    TASKS = ["transcribe", "recognize", "diarize"]
+
+    def __init__(
+        self,
+        n_workers=os.cpu_count(),
+        transcriber=None,
+        recognition=True,
+        diarization=True,
+        threads_per_worker=1,
+        **transcriber_kwargs,
+    ):
+        global _transcriber
+        if "fork" not in mp.get_all_start_methods():
+            raise RuntimeError("TranscriberPool requires the 'fork' start method")
+        # CUDA cannot be used after fork, so shared weights live on the CPU
+        self._check_no_cuda()
+        if transcriber is None:
+            transcriber_kwargs.setdefault("diarizer_device", "cpu")
+            transcriber = Transcriber(lazy=True, **transcriber_kwargs)
+        with hidden_cuda_devices():
+            transcriber.load(recognition=recognition, diarization=diarization)
+        self._check_no_cuda()
+        share_model_memory(transcriber)
+        _transcriber = self.transcriber = transcriber
+        self.n_workers = n_workers
+        # Objects created so far are never collected again: the collector would
+        # otherwise touch their headers in every child and unshare the pages.
+        # The freeze is process-wide, so close() undoes it only if it was ours
+        self._owns_freeze = gc.get_freeze_count() == 0
+        gc.freeze()
+        self.pool = mp.get_context("fork").Pool(
+            processes=n_workers,
+            initializer=_init_worker,
+            initargs=(threads_per_worker,),
+        )
+
+    @staticmethod
+    def _check_no_cuda():
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_initialized():
+            raise RuntimeError(
+                "CUDA is initialized in the parent process, forked workers cannot use it"
+            )
+
+    def _check_task(self, task):
+        assert task in self.TASKS, f"task should be one of {self.TASKS}"
+        loaded = self.transcriber.loaded_models()
+        if task in ("transcribe", "recognize") and not loaded["recognizer"]:
+            raise ValueError("The pool was created with recognition=False")
+        if task in ("transcribe", "diarize") and not loaded["diarizer"]:
+            raise ValueError("The pool was created with diarization=False")
+
+    def submit(self, input_path, from_video=False, task="transcribe"):
+        self._check_task(task)
+        return self.pool.apply_async(_run_task, (task, input_path, from_video))
+
+    def map(self, input_paths, from_video=False, task="transcribe"):
+        self._check_task(task)
+        return self.pool.starmap(
+            _run_task, [(task, path, from_video) for path in input_paths]
+        )
+
+    def memory_report(self):
+        parent = read_memory_usage(os.getpid())
+        # the pool's own processes, not every child of the caller
+        workers = [read_memory_usage(p.pid) for p in self.pool._pool]
+        return {
+            "parent": parent,
+            "workers": workers,
+            "total_rss": parent["rss"] + sum(w["rss"] for w in workers),
+            "total_pss": parent["pss"] + sum(w["pss"] for w in workers),
+        }
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        if self._owns_freeze:
+            gc.unfreeze()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_paths", nargs="+", help="Paths to input audio files")
+    parser.add_argument("--n-workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--task", choices=TranscriberPool.TASKS, default="transcribe"
+    )
+    args = parser.parse_args()
+    with TranscriberPool(
+        n_workers=args.n_workers,
+        recognition=args.task != "diarize",
+        diarization=args.task != "recognize",
+    ) as pool:
+        results = pool.map(args.input_paths, task=args.task)
+        report = pool.memory_report()
+    for path, result in zip(args.input_paths, results):
+        print(path)
+        print(result)
+    print(
+        f"Workers: {args.n_workers}, "
+        f"total PSS: {report['total_pss'] / 2**20:.0f} MB, "
+        f"parent PSS: {report['parent']['pss'] / 2**20:.0f} MB"
+    )
@@ -15,10 +15,158 @@ def get_config() -> AttrDict:
     asr.diarization_model = "pyannote/speaker-diarization-3.1"
     asr.language = "ru"
 
+    config.download = download = AttrDict()
+    download.cache_dir = "media_cache"
+    download.max_workers = 4
+
     config.llm = llm = AttrDict()
     llm.model = "gpt-4o-mini"
     llm.prompts_dir = "llm/prompts"
     llm.token_usage_report_path = "llm/token_usage.json"
+    llm.token_usage_flush_interval = 5
+    llm.max_concurrency = 4
+    llm.use_combined_agent = False
+    # request JSON-schema constrained replies from the structured summary and
+    # keyword agents, turn off for backends without response_format support
+    llm.json_schema_output = True
+    # invalid replies are sent back for a format fix at most this many times
+    llm.max_repairs = 2
+    # "transcript_first" puts the transcript before the agent instructions,
+    # so provider-side prompt caching applies to all agents of a meeting
+    llm.prompt_layout = "system_first"
+    llm.warm_prefix_cache = True
+    # "auto" estimates the tokens and cost locally and picks the first strategy
+    # within config.budget, raising BudgetExceededError when none fits
+    llm.strategy = "full"
+    # USD per 1M tokens
+    llm.prices = {"gpt-4o-mini": {"prompt": 0.15, "completion": 0.6}}
+    llm.base_url = os.environ.get("OPENAI_BASE_URL")
+    # name of the backend in config.backends used by default
+    llm.backend = "openai"
+    # per-agent overrides by agent class name, e.g. to keep a sensitive step local:
+    # {"KeywordAgent": {"backend": "local", "model": "qwen2.5-7b-instruct"}}
+    llm.agents = {}
+
+    config.budget = budget = AttrDict()
+    budget.max_request_tokens = 100000
+    budget.max_meeting_tokens = 400000
+    budget.max_meeting_cost = 1.0
+    budget.expected_completion_tokens = 400
+    budget.token_cache_size = 200000
+
+    # "openai" is the API configured above. "openai_compatible" is any server
+    # with the same API, e.g. llama.cpp server or vLLM. "llama_cpp" runs
+    # a GGUF model in-process and needs llama-cpp-python
+    config.backends = backends = AttrDict()
+    backends.openai = {"type": "openai"}
+    backends.local = {
+        "type": "openai_compatible",
+        "base_url": os.environ.get("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8080/v1"),
+        "api_key": "local",
+        "model": "local-model",
+        # CPU inference of a long transcript can take minutes
+        "timeout": 600,
+        "json_schema_output": True,
+    }
+    backends.in_process = {
+        "type": "llama_cpp",
+        "model_path": "models/model.gguf",
+        "model": "in-process",
+        "n_ctx": 16384,
+        "json_schema_output": True,
+    }
+
+    config.map_reduce = map_reduce = AttrDict()
+    map_reduce.chunk_tokens = 8000
+    map_reduce.max_workers = 8
+    map_reduce.fan_in = 6
+    map_reduce.max_keywords = 7
+
+    config.keywords = keywords = AttrDict()
+    # "llm" asks KeywordAgent, "local" ranks the words of the transcript
+    # by TF-IDF against the archived meetings without any request
+    keywords.method = "llm"
+    keywords.idf_path = "llm/keyword_idf.sqlite"
+    keywords.max_keywords = 7
+    keywords.min_word_length = 4
+    # with pymorphy3 or pymorphy2 installed, otherwise words are grouped by stem
+    keywords.lemmatize = True
+    keywords.extra_stopwords = []
+
+    config.live = live = AttrDict()
+    # seconds of meeting time between updates of the running summary
+    live.update_interval = 300
+    # an update is skipped while fewer new tokens have been said
+    live.min_new_tokens = 200
+
+    config.archive = archive = AttrDict()
+    archive.index_path = "archive_data/search.sqlite"
+    archive.embeddings_dir = "archive_data/embeddings"
+    # multilingual and small enough for CPU, needs sentence-transformers
+    archive.embedding_model = "intfloat/multilingual-e5-small"
+    archive.embedding_batch_size = 64
+    # e5 models expect these prefixes
+    archive.query_prefix = "query: "
+    archive.passage_prefix = "passage: "
+    # shorter turns, such as "да, понятно", are not embedded
+    archive.min_turn_words = 4
+    # past this many rows queries scan only the ivf_probes closest of ivf_lists clusters
+    archive.ivf_min_rows = 1000000
+    archive.ivf_lists = 1024
+    archive.ivf_probes = 16
+
+    config.compaction = compaction = AttrDict()
+    # when enabled, "auto" never sends the uncompacted transcript
+    compaction.enabled = False
+    compaction.remove_disfluencies = True
+    compaction.collapse_repeats = True
+    # short turns like "да" or "хорошо" are often answers, so only pure
+    # backchannels are listed and dropping them is opt-in
+    compaction.drop_backchannels = False
+    # single repeated words are often meant, e.g. "очень очень" or "20 20"
+    compaction.min_ngram = 2
+    compaction.max_ngram = 6
+    compaction.max_backchannel_words = 3
+    # regular expressions matched against whole words. Phrases like "как бы"
+    # or "это самое" are left alone, they are filler only in some sentences
+    compaction.fillers = ["э+", "э+м+", "м{2,}", "хм+"]
+    compaction.backchannels = ["ага", "угу", "мгм"]
+
+    config.cache = cache = AttrDict()
+    cache.enabled = True
+    cache.path = "llm/response_cache.sqlite"
+    cache.ttl = 30 * 24 * 60 * 60
+    cache.max_entries = 10000
+    cache.memory_entries = 256
+
+    config.http = http = AttrDict()
+    http.http2 = True
+    http.max_connections = 20
+    http.max_keepalive_connections = 10
+    http.keepalive_expiry = 60
+    http.timeout = 120
+    http.connect_timeout = 10
+
+    config.rate_limit = rate_limit = AttrDict()
+    # LLM calls go through a shared scheduler that retries them itself,
+    # so the client's own retries are turned off when it is enabled
+    rate_limit.enabled = True
+    rate_limit.requests_per_minute = 500
+    rate_limit.tokens_per_minute = 200000
+    rate_limit.max_retries = 6
+    rate_limit.base_delay = 1
+    rate_limit.max_delay = 60
+    # "interactive" or "backfill", interactive requests are sent first
+    rate_limit.default_priority = "interactive"
+
+    config.batch = batch = AttrDict()
+    batch.jobs_dir = "llm/batches"
+    batch.poll_interval = 60
+    batch.completion_window = "24h"
+    # the provider accepts at most this many requests in one batch
+    batch.max_requests = 50000
+    # failed or invalid requests are resubmitted until they have been tried this often
+    batch.max_attempts = 3
     return config
 
 
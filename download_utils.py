@@ -1,7 +1,16 @@
-import locale
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import yt_dlp
 
+from config import config
+
+YOUTUBE_ID_PATTERN = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/)|youtu\.be/)([\w-]{11})"
+)
+
 
 def download_video_from_youtube(link, name="%(title)s"):
     ydl_opts = {
@@ -11,5 +20,87 @@ def download_video_from_youtube(link, name="%(title)s"):
         info_dict = ydl.extract_info(link, download=True)
         downloaded_file_path = ydl.prepare_filename(info_dict)
     print(f"Видео {downloaded_file_path} успешно загружено!")
-    locale.getpreferredencoding = lambda: "UTF-8"
     return downloaded_file_path
+
+
+def get_video_id(link):
+    match = YOUTUBE_ID_PATTERN.search(link)
+    return match.group(1) if match else None
+
+
+def get_cached_audio_path(video_id, cache_dir=config.download.cache_dir):
+    path = os.path.join(cache_dir, f"{video_id}.wav")
+    return path if os.path.isfile(path) else None
+
+
+def get_audio_ydl_opts(cache_dir, sample_rate=16000, temp_suffix=""):
+    # Only the audio stream is fetched and converted to the 16 kHz mono PCM wav
+    # that both the recognizer and the diarizer read without another conversion
+    return {
+        "format": "bestaudio/best",
+        "outtmpl": os.path.join(cache_dir, f"%(id)s{temp_suffix}.%(ext)s"),
+        "postprocessors": [{"key": "FFmpegExtractAudio", "preferredcodec": "wav"}],
+        "postprocessor_args": {
+            "ffmpegextractaudio": ["-ar", str(sample_rate), "-ac", "1"]
+        },
+        "quiet": True,
+        "noprogress": True,
+    }
+
+
+def download_audio(
+    link,
+    cache_dir=config.download.cache_dir,
+    sample_rate=16000,
+    ydl_opts=None,
+    verbose=True,
+):
+    os.makedirs(cache_dir, exist_ok=True)
+    video_id = get_video_id(link)
+    if video_id is not None:
+        cached_path = get_cached_audio_path(video_id, cache_dir)
+        if cached_path:
+            if verbose:
+                print(f"Using cached audio {cached_path}")
+            return cached_path
+    # converted under a temporary name and moved in place when complete, so an
+    # interrupted conversion never leaves a truncated file that looks cached
+    temp_suffix = f".tmp-{uuid.uuid4().hex}"
+    opts = get_audio_ydl_opts(cache_dir, sample_rate, temp_suffix)
+    opts.update(ydl_opts or {})
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info_dict = ydl.extract_info(link, download=False)
+        cached_path = get_cached_audio_path(info_dict["id"], cache_dir)
+        if cached_path:
+            if verbose:
+                print(f"Using cached audio {cached_path}")
+            return cached_path
+        info_dict = ydl.process_ie_result(info_dict, download=True)
+    downloads = info_dict.get("requested_downloads") or [{}]
+    audio_path = downloads[0].get("filepath") or os.path.join(
+        cache_dir, f"{info_dict['id']}{temp_suffix}.wav"
+    )
+    if temp_suffix in os.path.basename(audio_path):
+        final_path = audio_path.replace(temp_suffix, "")
+        os.replace(audio_path, final_path)
+        audio_path = final_path
+    if verbose:
+        print(f"Audio {audio_path} downloaded")
+    return audio_path
+
+
+def download_audio_batch(
+    links, max_workers=config.download.max_workers, verbose=True, **kwargs
+):
+    unique_links = list(dict.fromkeys(links))
+
+    def download(link):
+        try:
+            return download_audio(link, verbose=verbose, **kwargs)
+        except Exception as e:
+            print(f"Failed to download {link}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = dict(zip(unique_links, executor.map(download, unique_links)))
+    return [paths[link] for link in links]
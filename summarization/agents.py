@@ -1,44 +1,155 @@
+import json
 from abc import ABC, abstractmethod
+from warnings import warn
 
+from config import config
 from summarization.llm import LLM
-from summarization.output_validation import (validate, validate_keywords,
+from summarization.output_validation import (validate_keywords,
                                              validate_structured_summary)
-from summarization.parsing_utils import (parse_structured_summary,
+from summarization.parsing_utils import (IncrementalArrayParser,
+                                         parse_combined_summary,
+                                         parse_keywords,
+                                         parse_structured_summary,
                                          process_keywords)
 
+REPAIR_SYSTEM_PROMPT = "Тебе дан ответ, который не прошел проверку формата, и описание ошибки. Исправь формат ответа, не меняя его содержания. Верни только исправленный ответ."
+
 
 class BaseAgent(ABC):
-    def __init__(self, token_usage_report_path):
+    # JSON schema of the reply. Agents with a schema request constrained output
+    # and get their invalid replies repaired
+    output_schema = None
+
+    def __init__(self, token_usage_report_path, client=None, backend=None):
         self.system_prompt = self.get_system_prompt()
-        self.llm = LLM(token_usage_report_path, self.system_prompt)
+        sampling_params = self.get_sampling_params()
+        self.llm = LLM(
+            token_usage_report_path,
+            self.system_prompt,
+            client=client,
+            agent_name=type(self).__name__,
+            sampling_params=sampling_params,
+            backend=backend,
+        )
+        self.repair_llm = None
+        if self.output_schema is not None:
+            # tracked separately, so repair counts and their cost show up in reports
+            self.repair_llm = LLM(
+                token_usage_report_path,
+                REPAIR_SYSTEM_PROMPT,
+                model_name=self.llm.model_name,
+                agent_name=f"{type(self).__name__}Repair",
+                sampling_params=sampling_params,
+                prompt_layout="system_first",
+                backend=self.llm.backend,
+            )
 
     @abstractmethod
     def get_system_prompt(self):
         pass
 
+    def get_sampling_params(self):
+        if self.output_schema is None or not config.llm.json_schema_output:
+            return None
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": type(self).__name__,
+                    "strict": True,
+                    "schema": self.output_schema,
+                },
+            }
+        }
+
+    def parse(self, output):
+        return output
+
+    def validate_output(self, result):
+        return True, ""
+
+    def get_repair_prompt(self, output, message):
+        schema = json.dumps(self.output_schema, ensure_ascii=False)
+        return f"JSON-схема ответа: {schema}\nОшибка: {message}\nОтвет:\n{output}"
+
+    def repair(self, output, max_repairs=config.llm.max_repairs):
+        """
+        Parse the output and, while it is invalid, ask for a fixed one.
+        Repair requests contain only the broken output and the error, not the
+        transcript. Returns the last output, its parsed result and validity.
+        """
+        result = self.parse(output)
+        is_valid, message = self.validate_output(result)
+        repairs = 0
+        while not is_valid and self.repair_llm is not None and repairs < max_repairs:
+            repairs += 1
+            output = self.repair_llm.get_response(
+                self.get_repair_prompt(output, message)
+            )
+            result = self.parse(output)
+            is_valid, message = self.validate_output(result)
+        if not is_valid:
+            warn(message)
+        return output, result, is_valid
+
     def reply(self, text):
-        return self.llm.get_response(text)
+        response = self.llm.get_response_with_usage(text)
+        output, prompt_tokens, completion_tokens, _ = response
+        repaired, result, is_valid = self.repair(output)
+        if self.llm.cache is not None and (repaired is not output or not is_valid):
+            # the cache keeps the reply the request ended with, so a hit
+            # needs no repairs, and never keeps one that failed validation
+            key = self.llm.get_cache_key(text)
+            if is_valid:
+                self.llm.cache.put(key, repaired, prompt_tokens, completion_tokens)
+            else:
+                self.llm.cache.delete(key)
+        return result
+
+    def stream(self, text):
+        """Yield the raw completion in pieces as they arrive."""
+        return self.llm.stream_response(text)
 
 
 class TitleAgent(BaseAgent):
-    def __init__(self, token_usage_report_path):
-        super().__init__(token_usage_report_path)
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
 
     def get_system_prompt(self):
         return "Тебе дана расшифровка встречи. Сформулируй тему встречи во фразе из 1-7 слов. Например, 'Обсуждение стратегии развития'."
 
 
 class ShortSummaryAgent(BaseAgent):
-    def __init__(self, token_usage_report_path):
-        super().__init__(token_usage_report_path)
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
 
     def get_system_prompt(self):
         return "Тебе дана расшифровка встречи. Опиши содержание встречи в 2-5 предложениях."
 
 
 class StructuredSummaryAgent(BaseAgent):
-    def __init__(self, token_usage_report_path):
-        super().__init__(token_usage_report_path)
+    output_schema = {
+        "type": "object",
+        "properties": {
+            "topics": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "topic": {"type": "string"},
+                        "points": {"type": "array", "items": {"type": "string"}},
+                    },
+                    "required": ["topic", "points"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["topics"],
+        "additionalProperties": False,
+    }
+
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
 
     def get_system_prompt(self):
         return """Тебе дана расшифровка встречи. Выдели от 1 до 7 тем, которые обсуждались на встрече и подпункты, обсуждавшиеся в каждой из тем.
@@ -49,22 +160,172 @@ class StructuredSummaryAgent(BaseAgent):
 ...}
 ]"""
 
-    def reply(self, text):
-        output = self.llm.get_response(text)
-        structured_summary = parse_structured_summary(output)
-        validate(structured_summary, validate_structured_summary)
-        return structured_summary
+    def parse(self, output):
+        return parse_structured_summary(output)
+
+    def validate_output(self, result):
+        return validate_structured_summary(result)
+
+    def stream_topics(self, text):
+        """Yield every topic as soon as its object is closed in the stream."""
+        parser = IncrementalArrayParser()
+        for piece in self.stream(text):
+            for topic in parser.feed(piece):
+                is_valid, message = validate_structured_summary([topic])
+                if is_valid:
+                    yield topic
+                else:
+                    warn(message)
 
 
 class KeywordAgent(BaseAgent):
-    def __init__(self, token_usage_report_path):
-        super().__init__(token_usage_report_path)
+    output_schema = {
+        "type": "object",
+        "properties": {"keywords": {"type": "array", "items": {"type": "string"}}},
+        "required": ["keywords"],
+        "additionalProperties": False,
+    }
+
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
 
     def get_system_prompt(self):
         return """Тебе дана расшифровка встречи. Выдели от 3 до 7 ключевых слов, относящихся ко встрече. Ключевые слова должны быть разделены запятой."""
 
+    def parse(self, output):
+        return parse_keywords(output)
+
+    def validate_output(self, result):
+        return validate_keywords(result)
+
+
+class MergeShortSummaryAgent(BaseAgent):
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
+
+    def get_system_prompt(self):
+        return "Тебе даны краткие содержания последовательных частей одной встречи. Объедини их в описание всей встречи из 2-5 предложений."
+
+
+class MergeStructuredSummaryAgent(StructuredSummaryAgent):
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
+
+    def get_system_prompt(self):
+        return """Тебе даны саммари по темам для последовательных частей одной встречи в формате json. Объедини их в саммари всей встречи: выдели от 1 до 7 тем, объединив повторяющиеся, и для каждой темы от 2 до 7 подпунктов. Верни результаты в том же формате json:
+Пример выхода:
+[
+{"topic":"*тема 1*", "points":["*подпункт 1*", "*подпункт 2*"],
+...}
+]"""
+
+
+class MergeTitleAgent(BaseAgent):
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
+
+    def get_system_prompt(self):
+        return "Тебе даны краткие содержания частей встречи. Сформулируй тему встречи во фразе из 1-7 слов. Например, 'Обсуждение стратегии развития'."
+
+
+class CombinedAgent(BaseAgent):
+    """
+    Requests the title, both summaries and the keywords in one completion,
+    so the transcript is sent once instead of four times.
+    """
+
+    FIELDS = ["title", "short_summary", "structured_summary", "keywords"]
+
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
+
+    def get_system_prompt(self):
+        return """Тебе дана расшифровка встречи. Верни результат в формате json с полями:
+"title" - тема встречи во фразе из 1-7 слов, например, 'Обсуждение стратегии развития';
+"short_summary" - содержание встречи в 2-5 предложениях;
+"structured_summary" - от 1 до 7 тем, которые обсуждались на встрече, и от 2 до 7 подпунктов, обсуждавшихся в каждой из тем;
+"keywords" - от 3 до 7 ключевых слов, относящихся ко встрече.
+Пример выхода:
+{"title": "*тема встречи*", "short_summary": "*содержание встречи*",
+"structured_summary": [{"topic":"*тема 1*", "points":["*подпункт 1*", "*подпункт 2*"]}, ...],
+"keywords": ["*ключевое слово 1*", "*ключевое слово 2*", ...]}"""
+
+    @staticmethod
+    def validate_fields(data):
+        """Keep only the fields that pass validation."""
+        fields = {}
+        for name in ("title", "short_summary"):
+            if isinstance(data.get(name), str) and data[name].strip():
+                fields[name] = data[name].strip()
+        if validate_structured_summary(data.get("structured_summary"))[0]:
+            fields["structured_summary"] = data["structured_summary"]
+        keywords = data.get("keywords")
+        if isinstance(keywords, str):
+            keywords = process_keywords(keywords)
+        if (
+            isinstance(keywords, list)
+            and all(isinstance(kw, str) for kw in keywords)
+            and validate_keywords(keywords)[0]
+        ):
+            fields["keywords"] = keywords
+        return fields
+
     def reply(self, text):
-        output = self.llm.get_response(text)
-        keywords = process_keywords(output)
-        validate(keywords, validate_keywords)
-        return keywords
+        output, prompt_tokens, _, from_cache = self.llm.get_response_with_usage(text)
+        fields = self.validate_fields(parse_combined_summary(output))
+        # a cache hit has already recorded the whole request as saved
+        if len(fields) > 1 and not from_cache:
+            # every valid field beyond the first would have been a separate request
+            self.llm.token_usage.record(
+                self.llm.model_name,
+                agent=self.llm.agent_name,
+                saved_prompt_tokens=prompt_tokens * (len(fields) - 1),
+            )
+        return fields
+
+
+class IncrementalUpdateAgent(CombinedAgent):
+    """
+    Updates the running summary of a live meeting from the previous summary
+    and the new part of the transcript only.
+    """
+
+    output_schema = {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "short_summary": {"type": "string"},
+            "structured_summary": StructuredSummaryAgent.output_schema["properties"][
+                "topics"
+            ],
+            "keywords": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": CombinedAgent.FIELDS,
+        "additionalProperties": False,
+    }
+
+    def __init__(self, token_usage_report_path, client=None, backend=None):
+        super().__init__(token_usage_report_path, client=client, backend=backend)
+
+    def get_system_prompt(self):
+        return """Тебе дано текущее саммари идущей встречи в формате json и новый фрагмент ее расшифровки. Обнови саммари с учетом нового фрагмента, сохранив важное из предыдущих частей. Верни результат в формате json с полями:
+"title" - тема встречи во фразе из 1-7 слов;
+"short_summary" - содержание встречи в 2-5 предложениях;
+"structured_summary" - от 1 до 7 тем, которые обсуждались на встрече, и от 2 до 7 подпунктов в каждой из тем;
+"keywords" - от 3 до 7 ключевых слов, относящихся ко встрече.
+Пример выхода:
+{"title": "*тема встречи*", "short_summary": "*содержание встречи*",
+"structured_summary": [{"topic":"*тема 1*", "points":["*подпункт 1*", "*подпункт 2*"]}, ...],
+"keywords": ["*ключевое слово 1*", "*ключевое слово 2*", ...]}"""
+
+    def parse(self, output):
+        return self.validate_fields(parse_combined_summary(output))
+
+    def validate_output(self, result):
+        missing = [name for name in self.FIELDS if name not in result]
+        if missing:
+            return False, f"Missing or invalid fields: {', '.join(missing)}"
+        return True, ""
+
+    # parse, validate and repair like the per-field agents
+    reply = BaseAgent.reply
@@ -0,0 +1,156 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+class Backend(ABC):
+    """
+    Sends chat completion requests built by LLM.get_request_body() and returns
+    OpenAI ChatCompletion objects, or ChatCompletionChunk iterators for streams,
+    so the rest of the pipeline does not depend on where the model runs.
+    """
+
+    # remote APIs go through the shared rate-limit scheduler
+    rate_limited = False
+
+    def __init__(self, name, model=None, supports_json_schema=True):
+        self.name = name
+        self.model = model
+        self.supports_json_schema = supports_json_schema
+
+    @abstractmethod
+    def create(self, body):
+        pass
+
+
+class OpenAIBackend(Backend):
+    """The OpenAI API or any OpenAI-compatible server, such as llama.cpp server or vLLM."""
+
+    def __init__(
+        self, name, client, model=None, supports_json_schema=True, rate_limited=True
+    ):
+        super().__init__(name, model, supports_json_schema)
+        self.client = client
+        self.rate_limited = rate_limited
+
+    def create(self, body):
+        return self.client.chat.completions.create(**body)
+
+
+class InProcessBackend(Backend):
+    """
+    Runs a model in this process. generate(messages, stream=False, **params)
+    returns the completion text, or an iterator of text pieces when streaming.
+    Requests are serialized, since one model instance serves all agents.
+    """
+
+    def __init__(
+        self,
+        name,
+        generate,
+        count_tokens,
+        model="in-process",
+        supports_json_schema=False,
+    ):
+        super().__init__(name, model, supports_json_schema)
+        self.generate = generate
+        self.count_tokens = count_tokens
+        self._lock = threading.Lock()
+
+    def _usage(self, messages, completion):
+        prompt_tokens = sum(self.count_tokens(m["content"]) for m in messages)
+        completion_tokens = self.count_tokens(completion)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def create(self, body):
+        params = dict(body)
+        messages = params.pop("messages")
+        model = params.pop("model", self.model)
+        stream = params.pop("stream", False)
+        params.pop("stream_options", None)
+        if stream:
+            return self._stream(messages, model, params)
+        with self._lock:
+            completion = self.generate(messages, **params)
+        return ChatCompletion.model_validate(
+            {
+                "id": f"in-process-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": completion},
+                    }
+                ],
+                "usage": self._usage(messages, completion),
+            }
+        )
+
+    def _chunk(self, model, content=None, usage=None):
+        choices = []
+        if content is not None:
+            choices = [{"index": 0, "delta": {"content": content}}]
+        return ChatCompletionChunk.model_validate(
+            {
+                "id": "in-process",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+                "usage": usage,
+            }
+        )
+
+    def _stream(self, messages, model, params):
+        pieces = []
+        with self._lock:
+            result = self.generate(messages, stream=True, **params)
+            if isinstance(result, str):
+                result = [result]
+            for piece in result:
+                pieces.append(piece)
+                yield self._chunk(model, content=piece)
+        yield self._chunk(model, usage=self._usage(messages, "".join(pieces)))
+
+
+def load_llama_cpp(model_path, **kwargs):
+    """
+    Return a generate function for InProcessBackend backed by a GGUF model
+    loaded with the optional llama-cpp-python package.
+    """
+    try:
+        from llama_cpp import Llama
+    except ImportError:
+        raise ImportError(
+            "The llama_cpp backend requires llama-cpp-python: pip install llama-cpp-python"
+        )
+    model = Llama(model_path=model_path, verbose=False, **kwargs)
+
+    def generate(messages, stream=False, response_format=None, **params):
+        if response_format and response_format["type"] == "json_schema":
+            # llama.cpp constrains the output with a grammar built from the schema
+            params["response_format"] = {
+                "type": "json_object",
+                "schema": response_format["json_schema"]["schema"],
+            }
+        result = model.create_chat_completion(
+            messages=messages, stream=stream, **params
+        )
+        if not stream:
+            return result["choices"][0]["message"]["content"]
+        return (
+            chunk["choices"][0]["delta"].get("content") or ""
+            for chunk in result
+            if chunk["choices"]
+        )
+
+    return generate
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Union
+
+from openai.types.chat import ChatCompletion
+
+from asr.transcription import Transcription, load_transcription_and_transcript
+from config import config
+from summarization.summarizer import Summarizer
+from summarization.summary import Summary
+
+FINAL_STATUSES = ["completed", "failed", "expired", "cancelled"]
+ENDPOINT = "/v1/chat/completions"
+
+
+class BatchJob:
+    """
+    Summarizes many transcripts through the provider's batch endpoint instead of
+    synchronous requests. The job directory holds everything needed to resume:
+        requests.jsonl  every agent request of every meeting, one line each
+        transcripts/    the transcripts, to build the summaries
+        state.json      submitted batches, completions and errors by request id
+    Failed requests are resubmitted in the next batch.
+    """
+
+    def __init__(
+        self,
+        job_dir,
+        summarizer: Summarizer,
+        poll_interval=config.batch.poll_interval,
+        completion_window=config.batch.completion_window,
+        max_requests=config.batch.max_requests,
+        max_attempts=config.batch.max_attempts,
+    ):
+        self.job_dir = job_dir
+        self.summarizer = summarizer
+        self.client = summarizer.title_agent.llm.client
+        assert self.client is not None, "Batch jobs need a backend with the OpenAI API"
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests = max_requests
+        self.max_attempts = max_attempts
+        self.requests_path = os.path.join(job_dir, "requests.jsonl")
+        self.state_path = os.path.join(job_dir, "state.json")
+        os.makedirs(os.path.join(job_dir, "transcripts"), exist_ok=True)
+        if os.path.isfile(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"requests": {}, "batches": [], "results": {}, "errors": {}}
+
+    @property
+    def agents(self):
+        agents = {
+            "title": self.summarizer.title_agent,
+            "short_summary": self.summarizer.short_summary_agent,
+            "structured_summary": self.summarizer.structured_summary_agent,
+            "keywords": self.summarizer.keyword_agent,
+        }
+        return {name: agents[name] for name in self.summarizer.llm_fields}
+
+    @staticmethod
+    def get_request_id(meeting_id, name):
+        return f"{meeting_id}:{name}"
+
+    @staticmethod
+    def split_request_id(request_id):
+        meeting_id, _, name = request_id.rpartition(":")
+        return meeting_id, name
+
+    def save_state(self):
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.job_dir, suffix=".tmp", delete=False, encoding="utf-8"
+        ) as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(f.name, self.state_path)
+
+    def _transcript_path(self, meeting_id):
+        return os.path.join(self.job_dir, "transcripts", f"{meeting_id}.json")
+
+    def add(
+        self,
+        meeting_id,
+        transcription: Union[Transcription, List[Dict[str, Any]], str],
+        strategy="full",
+    ):
+        """
+        Write the agent requests of a meeting to the job file. Requests already
+        in the job are skipped and cached completions are used right away.
+        """
+        assert strategy in ("full", "compressed"), (
+            "Batch requests are independent, only the full or compressed "
+            "transcript can be sent"
+        )
+        transcription, transcript = load_transcription_and_transcript(transcription)
+        with open(self._transcript_path(meeting_id), "w", encoding="utf-8") as f:
+            json.dump(transcript, f, ensure_ascii=False)
+        dialog = self.summarizer.get_dialog(transcription, strategy)
+        lines = []
+        for name, agent in self.agents.items():
+            request_id = self.get_request_id(meeting_id, name)
+            if request_id in self.state["requests"]:
+                continue
+            llm = agent.llm
+            self.state["requests"][request_id] = {
+                "attempts": 0,
+                "cache_key": llm.get_cache_key(dialog),
+            }
+            if llm.cache is not None:
+                cached = llm.cache.get(self.state["requests"][request_id]["cache_key"])
+                if cached is not None:
+                    completion, prompt_tokens, completion_tokens = cached
+                    llm.token_usage.record(
+                        llm.model_name,
+                        agent=llm.agent_name,
+                        cache_hits=1,
+                        saved_prompt_tokens=prompt_tokens,
+                        saved_completion_tokens=completion_tokens,
+                    )
+                    self.state["results"][request_id] = completion
+                    continue
+            lines.append(
+                {
+                    "custom_id": request_id,
+                    "method": "POST",
+                    "url": ENDPOINT,
+                    "body": llm.get_request_body(dialog),
+                }
+            )
+        with open(self.requests_path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self.save_state()
+
+    def _running_request_ids(self):
+        return {
+            request_id
+            for batch in self.state["batches"]
+            if batch["status"] not in FINAL_STATUSES
+            for request_id in batch["request_ids"]
+        }
+
+    def pending(self):
+        """Ids of the requests without a result that can still be submitted."""
+        running = self._running_request_ids()
+        return [
+            request_id
+            for request_id, request in self.state["requests"].items()
+            if request_id not in self.state["results"]
+            and request_id not in running
+            and request["attempts"] < self.max_attempts
+        ]
+
+    def submit(self):
+        """Upload the pending requests in batches of at most max_requests."""
+        pending = set(self.pending())
+        if not pending:
+            return []
+        with open(self.requests_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if json.loads(line)["custom_id"] in pending]
+        batch_ids = []
+        for start in range(0, len(lines), self.max_requests):
+            chunk = lines[start : start + self.max_requests]
+            input_file = self.client.files.create(
+                file=("requests.jsonl", "".join(chunk).encode("utf-8")),
+                purpose="batch",
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=ENDPOINT,
+                completion_window=self.completion_window,
+            )
+            request_ids = [json.loads(line)["custom_id"] for line in chunk]
+            for request_id in request_ids:
+                self.state["requests"][request_id]["attempts"] += 1
+            self.state["batches"].append(
+                {"id": batch.id, "status": batch.status, "request_ids": request_ids}
+            )
+            # saved after every batch, so a crash never resubmits a batch
+            self.save_state()
+            batch_ids.append(batch.id)
+        return batch_ids
+
+    def _read_file(self, file_id):
+        if not file_id:
+            return []
+        content = self.client.files.content(file_id).text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def _process_output(self, line):
+        request_id = line["custom_id"]
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or response.get("body", {}).get("error")
+            return request_id, None, str(error)
+        completion = ChatCompletion.model_validate(response["body"])
+        _, name = self.split_request_id(request_id)
+        agent = self.agents[name]
+        agent.llm.report_token_usage(completion)
+        output = completion.choices[0].message.content
+        # an invalid reply is fixed with a short synchronous request
+        # instead of sending the transcript again in the next batch
+        output, _, is_valid = agent.repair(output)
+        if not is_valid:
+            return request_id, None, "invalid output"
+        if agent.llm.cache is not None:
+            agent.llm.cache.put(
+                self.state["requests"][request_id]["cache_key"],
+                output,
+                completion.usage.prompt_tokens,
+                completion.usage.completion_tokens,
+            )
+        return request_id, output, None
+
+    def poll(self):
+        """Update the running batches and collect the results of finished ones."""
+        running = False
+        for batch in self.state["batches"]:
+            if batch["status"] in FINAL_STATUSES:
+                continue
+            remote = self.client.batches.retrieve(batch["id"])
+            if remote.status not in FINAL_STATUSES:
+                batch["status"] = remote.status
+                running = True
+                continue
+            lines = self._read_file(remote.output_file_id)
+            lines += self._read_file(remote.error_file_id)
+            for line in lines:
+                request_id, output, error = self._process_output(line)
+                if output is not None:
+                    self.state["results"][request_id] = output
+                    self.state["errors"].pop(request_id, None)
+                else:
+                    self.state["errors"][request_id] = error
+            answered = {line["custom_id"] for line in lines}
+            for request_id in batch["request_ids"]:
+                if request_id not in answered:
+                    self.state["errors"][request_id] = f"batch {remote.status}"
+            batch["status"] = remote.status
+            self.save_state()
+        return running
+
+    def wait(self, verbose=False):
+        while self.poll():
+            if verbose:
+                print(self.progress())
+            time.sleep(self.poll_interval)
+
+    def progress(self):
+        return {
+            "requests": len(self.state["requests"]),
+            "done": len(self.state["results"]),
+            "running": len(self._running_request_ids()),
+            "failed": len(
+                [r for r in self.state["errors"] if r not in self.state["results"]]
+            ),
+        }
+
+    def run(self, verbose=False):
+        """Submit and wait until every request has a result or runs out of attempts."""
+        while True:
+            self.wait(verbose=verbose)
+            if not self.submit():
+                break
+            if verbose:
+                print(self.progress())
+        return self.summaries()
+
+    def summaries(self) -> Dict[str, Summary]:
+        """Summaries of the meetings whose requests have all succeeded."""
+        agents = self.agents
+        outputs = {}
+        for request_id, output in self.state["results"].items():
+            meeting_id, name = self.split_request_id(request_id)
+            outputs.setdefault(meeting_id, {})[name] = agents[name].parse(output)
+        summaries = {}
+        for meeting_id, results in outputs.items():
+            if len(results) < len(agents):
+                continue
+            with open(self._transcript_path(meeting_id), "r", encoding="utf-8") as f:
+                transcript = json.load(f)
+            if self.summarizer.keyword_extractor is not None:
+                results["keywords"] = self.summarizer.keyword_extractor.extract(
+                    Transcription.from_dict(transcript), document_id=meeting_id
+                )
+            summaries[meeting_id] = Summary(transcription=transcript, **results)
+        return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("transcription_paths", nargs="*")
+    parser.add_argument("--job", required=True, help="Job name, rerun to resume")
+    parser.add_argument("--strategy", choices=["full", "compressed"], default="full")
+    args = parser.parse_args()
+    job = BatchJob(
+        os.path.join(config.batch.jobs_dir, args.job),
+        Summarizer(config.llm.token_usage_report_path),
+    )
+    for path in args.transcription_paths:
+        meeting_id = os.path.splitext(os.path.basename(path))[0]
+        job.add(meeting_id, Transcription.from_json(path), args.strategy)
+    job.submit()
+    summaries = job.run(verbose=True)
+    for meeting_id, summary in summaries.items():
+        summary.save_json(os.path.join(job.job_dir, f"{meeting_id}_summary.json"))
+    print(job.progress())
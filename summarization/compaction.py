@@ -0,0 +1,164 @@
+import re
+import string
+from typing import Dict, Iterable, List, Tuple
+
+from asr.transcription import Transcription
+from config import config
+from summarization.llm import estimate_tokens
+
+PUNCTUATION = string.punctuation + "«»…—–"
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?…])\s+")
+
+
+def get_speaker_aliases(speakers: Iterable[str]) -> Dict[str, str]:
+    """Map speaker labels to short codes in order of appearance: A, B, ..., Z, A1, ..."""
+    aliases = {}
+    for speaker in speakers:
+        if speaker not in aliases:
+            index = len(aliases)
+            letter = string.ascii_uppercase[index % 26]
+            aliases[speaker] = letter + (str(index // 26) if index >= 26 else "")
+    return aliases
+
+
+def get_filler_pattern(fillers: List[str] = config.compaction.fillers):
+    alternatives = "|".join(fillers)
+    # commas around a filler go with it: "мы, как бы, успеем" -> "мы успеем"
+    return re.compile(rf",?\s*(?<!\w)(?:{alternatives})(?!\w),?", re.IGNORECASE)
+
+
+def normalize_word(word: str) -> str:
+    return word.strip(PUNCTUATION).lower()
+
+
+def remove_fillers(text: str, filler_pattern) -> Tuple[str, int]:
+    text, removed = filler_pattern.subn(" ", text)
+    if removed:
+        text = re.sub(r"\s+([,.!?…])", r"\1", text)
+        text = re.sub(r"\s{2,}", " ", text).strip(" ,")
+    return text, removed
+
+
+def collapse_repeated_sentences(text: str) -> Tuple[str, int]:
+    """
+    Drop sentences identical to the previous one, which catches long ASR
+    hallucination loops such as the same phrase recognized over and over.
+    """
+    sentences, collapsed = [], 0
+    previous = None
+    for sentence in SENTENCE_SPLIT_PATTERN.split(text):
+        normalized = " ".join(normalize_word(w) for w in sentence.split())
+        if normalized and normalized == previous:
+            collapsed += 1
+            continue
+        sentences.append(sentence)
+        previous = normalized
+    return " ".join(sentences), collapsed
+
+
+def collapse_repeated_ngrams(
+    text: str,
+    max_ngram: int = config.compaction.max_ngram,
+    min_ngram: int = config.compaction.min_ngram,
+) -> Tuple[str, int]:
+    """
+    Keep one copy of immediately repeated word n-grams:
+    "я думаю что я думаю что мы" becomes "я думаю что мы". N-grams with
+    numbers are kept, "20 процентов 20 процентов" may be two figures.
+    """
+    words = text.split()
+    normalized = [normalize_word(w) for w in words]
+    result, collapsed = [], 0
+    i = 0
+    while i < len(words):
+        for n in range(min(max_ngram, (len(words) - i) // 2), min_ngram - 1, -1):
+            ngram = normalized[i : i + n]
+            if (
+                any(ngram)
+                and not any(any(c.isdigit() for c in word) for word in ngram)
+                and ngram == normalized[i + n : i + 2 * n]
+            ):
+                j = i + n
+                while normalized[j : j + n] == ngram:
+                    j += n
+                    collapsed += 1
+                # the last copy keeps the punctuation that ends the phrase
+                result.extend(words[j - n : j])
+                i = j
+                break
+        else:
+            result.append(words[i])
+            i += 1
+    return " ".join(result), collapsed
+
+
+def is_backchannel(
+    text: str,
+    backchannels: List[str] = config.compaction.backchannels,
+    max_words: int = config.compaction.max_backchannel_words,
+) -> bool:
+    words = [normalize_word(w) for w in text.split()]
+    words = [w for w in words if w]
+    return 0 < len(words) <= max_words and all(w in backchannels for w in words)
+
+
+def compact_transcript(
+    transcription: Transcription,
+    remove_disfluencies: bool = config.compaction.remove_disfluencies,
+    collapse_repeats: bool = config.compaction.collapse_repeats,
+    drop_backchannels: bool = config.compaction.drop_backchannels,
+    count_tokens=estimate_tokens,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Prepare the dialog for the agents: alias speaker labels to short codes
+    with a legend, remove filler words, collapse repeated segments, drop
+    backchannel turns such as "ага" and merge the turns left adjacent.
+    Returns the compacted dialog and statistics, including the removed tokens.
+    """
+    filler_pattern = get_filler_pattern()
+    stats = {
+        "removed_fillers": 0,
+        "collapsed_repeats": 0,
+        "dropped_turns": 0,
+    }
+    turns = []
+    previous_text = None
+    for _, _, text, speaker in transcription.result:
+        if remove_disfluencies:
+            text, removed = remove_fillers(text, filler_pattern)
+            stats["removed_fillers"] += removed
+        if collapse_repeats:
+            text, sentences = collapse_repeated_sentences(text)
+            text, ngrams = collapse_repeated_ngrams(text)
+            stats["collapsed_repeats"] += sentences + ngrams
+        normalized = " ".join(normalize_word(w) for w in text.split())
+        if (
+            not normalized
+            or (collapse_repeats and normalized == previous_text)
+            or (drop_backchannels and is_backchannel(text))
+        ):
+            stats["dropped_turns"] += 1
+            continue
+        previous_text = normalized
+        if turns and turns[-1][0] == speaker:
+            turns[-1][1] += " " + text
+        else:
+            turns.append([speaker, text])
+
+    aliases = get_speaker_aliases(speaker for speaker, _ in turns)
+    legend = ", ".join(f"{alias} - {speaker}" for speaker, alias in aliases.items())
+    lines = [f"Участники: {legend}"]
+    lines.extend(f"{aliases[speaker]}: {text}" for speaker, text in turns)
+    dialog = "\n".join(lines)
+
+    stats["original_tokens"] = count_tokens(
+        transcription.to_str(include_timestamps=False)
+    )
+    stats["compacted_tokens"] = count_tokens(dialog)
+    stats["removed_tokens"] = stats["original_tokens"] - stats["compacted_tokens"]
+    return dialog, stats
+
+
+def compact_dialog(transcription: Transcription, **kwargs) -> str:
+    dialog, _ = compact_transcript(transcription, **kwargs)
+    return dialog
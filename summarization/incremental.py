@@ -0,0 +1,162 @@
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from asr.transcription import Transcription
+from config import config
+from summarization.agents import IncrementalUpdateAgent
+from summarization.llm import estimate_tokens
+from summarization.summary import Summary
+from summarization.token_usage import track_meeting
+
+
+class IncrementalSummarizer:
+    """
+    Summarizes a meeting while it is going on. Transcript segments are added
+    as they arrive, and every update_interval seconds of meeting time the
+    running summary is updated from its previous state and the new segments
+    only. The final Summary then costs one more request for the last
+    segments instead of a pass over the whole transcript.
+
+    Updates run in a background thread one at a time, so add_segment() never
+    waits for the LLM. on_update(state) is called after every update, e.g.
+    to send a live notification.
+    """
+
+    def __init__(
+        self,
+        token_usage_report_path,
+        meeting_id=None,
+        update_interval=config.live.update_interval,
+        min_new_tokens=config.live.min_new_tokens,
+        on_update: Optional[Callable[[Dict], None]] = None,
+        client=None,
+        backend=None,
+        count_tokens=estimate_tokens,
+    ):
+        self.agent = IncrementalUpdateAgent(
+            token_usage_report_path, client=client, backend=backend
+        )
+        self.meeting_id = meeting_id
+        self.update_interval = update_interval
+        self.min_new_tokens = min_new_tokens
+        self.on_update = on_update
+        self.count_tokens = count_tokens
+        self.state = {
+            "title": "",
+            "short_summary": "",
+            "structured_summary": [],
+            "keywords": [],
+        }
+        self.segments: List[Tuple[float, float, str, str]] = []
+        self.updates = 0
+        self._pending = []
+        self._pending_tokens = 0
+        self._last_update_time = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = []
+
+    def add_segment(self, start: float, end: float, text: str, speaker: str):
+        """Add a recognized segment, updating the summary in the background when due."""
+        with self._lock:
+            segment = (start, end, text, speaker)
+            self.segments.append(segment)
+            self._pending.append(segment)
+            self._pending_tokens += self.count_tokens(f"{speaker}: {text}")
+            if (
+                end - self._last_update_time < self.update_interval
+                or self._pending_tokens < self.min_new_tokens
+            ):
+                return
+            pending = self._take_pending(end)
+        context = contextvars.copy_context()
+        self._futures.append(
+            self._executor.submit(context.run, self._background_update, pending)
+        )
+
+    def add_segments(self, segments):
+        for start, end, text, speaker in segments:
+            self.add_segment(start, end, text, speaker)
+
+    def _take_pending(self, time):
+        pending = self._pending
+        self._pending, self._pending_tokens = [], 0
+        self._last_update_time = time
+        return pending
+
+    def get_update_prompt(self, segments, final=False):
+        dialog = "\n".join(f"{speaker}: {text}" for _, _, text, speaker in segments)
+        parts = [
+            "Текущее саммари:\n" + json.dumps(self.state, ensure_ascii=False),
+            "Новый фрагмент расшифровки:\n" + (dialog or "Новых реплик нет."),
+        ]
+        if final:
+            parts.append("Встреча закончилась, верни итоговое саммари всей встречи.")
+        return "\n\n".join(parts)
+
+    def _update(self, segments, final=False):
+        with track_meeting(self.meeting_id):
+            fields = self.agent.reply(self.get_update_prompt(segments, final=final))
+        # a field that failed validation keeps its previous value
+        self.state = {**self.state, **fields}
+        self.updates += 1
+        if self.on_update is not None:
+            self.on_update(dict(self.state))
+        return self.state
+
+    def _background_update(self, segments):
+        try:
+            self._update(segments)
+        except Exception as e:
+            print(f"Live summary update failed, retrying with the next one: {e}")
+            # the segments go back ahead of the ones added meanwhile
+            with self._lock:
+                self._pending = segments + self._pending
+                self._pending_tokens += sum(
+                    self.count_tokens(f"{speaker}: {text}")
+                    for _, _, text, speaker in segments
+                )
+
+    def wait(self):
+        """Block until the scheduled updates are done, failed ones included."""
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def get_transcription(self) -> Transcription:
+        return Transcription(
+            [(start, end, text) for start, end, text, _ in self.segments],
+            [(start, end, speaker) for start, end, _, speaker in self.segments],
+        )
+
+    def finalize(self) -> Summary:
+        """Fold the remaining segments into the state with one request and build the Summary."""
+        self.wait()
+        with self._lock:
+            end = self.segments[-1][1] if self.segments else 0.0
+            pending = self._take_pending(end)
+        self._executor.shutdown()
+        state = self._update(pending, final=True)
+        return Summary(
+            title=state["title"],
+            short_summary=state["short_summary"],
+            structured_summary=state["structured_summary"],
+            keywords=state["keywords"],
+            transcription=self.get_transcription(),
+        )
+
+
+if __name__ == "__main__":
+    # replays a finished transcription as if it was being recognized live
+    transcription = Transcription.from_json("asr/results/transcription_merged.json")
+    summarizer = IncrementalSummarizer(
+        config.llm.token_usage_report_path,
+        on_update=lambda state: print(
+            f"[update] {state['title']}: {state['keywords']}"
+        ),
+    )
+    summarizer.add_segments(transcription.result)
+    print(summarizer.finalize())
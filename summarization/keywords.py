@@ -0,0 +1,263 @@
+import argparse
+import contextlib
+import functools
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Union
+
+from asr.transcription import Transcription
+from config import config
+
+WORD_PATTERN = re.compile(r"[a-zа-яё][a-zа-яё0-9\-]*", re.IGNORECASE)
+# parts of speech that can be keywords, None covers latin words and abbreviations
+KEYWORD_POS = {"NOUN", None}
+# inflection endings stripped when pymorphy is not installed, longest first
+ENDINGS = sorted(
+    """
+    иями ями ами иях ях ах ией ей ой ий ый ая яя ое ее ые ие ого его ому ему
+    ых их ым им ую юю ом ем ов ев ия ию ии а я о е у ю ы и ь
+    """.split(),
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+# infinitive, reflexive and present tense endings of verbs, which are dropped
+# when pymorphy is not installed; endings shared with common nouns are left out,
+# e.g. -ет (бюджет), -ал (канал), -ила (правила)
+VERB_ENDINGS = """
+    ться тся лся лась лось лись ать ять еть ить уть ыть аем яем уем ём им
+    ешь ишь ают яют уют ят
+    """.split()
+# longer than MIN_STEM_LENGTH, so short nouns such as «режим» and «память» stay
+MIN_VERB_STEM_LENGTH = 4
+STOPWORDS = frozenset("""
+    этот эта это эти этого этой этом этих этим этими того тому том тогда тоже
+    также такой такая такое такие таких такого такую когда потом потому поэтому
+    чтобы который которая которое которые которых котором которого будет будут
+    будем было были была быть есть если только очень можно нужно надо сейчас
+    здесь где кто как так вот даже просто давайте давай говорю говорит сказал
+    сказать думаю думать знаю знать значит вообще короче типа наверное может
+    могу можем мочь хочу хотим хотеть хотел делать сделать смотреть посмотреть
+    весь всех всем всего всё все свой свои своих себя себе него нее неё них ними
+    нами вами меня мной тебя тебе какой какие какая каких какое сколько почему
+    зачем через после перед между около более менее много мало больше меньше
+    ещё еще уже ничего никто нибудь сегодня завтра вчера кстати например вроде
+    ладно хорошо понятно конечно окей спасибо пожалуйста здравствуйте привет
+    коллеги слышно видно минуту секунду вопрос вопросы случае должен должны
+    какой-то что-то кто-то где-то когда-то как-то чего чем нему ними одна один
+    одно одни другой другие первый второй сам сама сами самый там тут туда сюда
+    """.split())
+
+
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[: -len(ending)]
+    return word
+
+
+def looks_like_verb(word):
+    return any(
+        word.endswith(ending) and len(word) - len(ending) >= MIN_VERB_STEM_LENGTH
+        for ending in VERB_ENDINGS
+    )
+
+
+def load_lemmatizer():
+    """
+    Return word -> (lemma, part of speech) with pymorphy3 or pymorphy2,
+    or None when neither is installed.
+    """
+    try:
+        import pymorphy3 as pymorphy
+    except ImportError:
+        try:
+            import pymorphy2 as pymorphy
+        except ImportError:
+            return None
+    morph = pymorphy.MorphAnalyzer()
+
+    @functools.lru_cache(maxsize=100000)
+    def lemmatize(word):
+        parse = morph.parse(word)[0]
+        return parse.normal_form, parse.tag.POS
+
+    return lemmatize
+
+
+class DocumentFrequencies:
+    """
+    Number of archived meetings each term occurs in, stored in SQLite and
+    held in memory. add() counts one more meeting, so the IDF is updated
+    incrementally instead of being recomputed over the archive.
+    """
+
+    def __init__(self, path=config.keywords.idf_path):
+        self.path = path
+        self._lock = threading.Lock()
+        idf_dir = os.path.dirname(path)
+        if idf_dir:
+            os.makedirs(idf_dir, exist_ok=True)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id TEXT PRIMARY KEY, added_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS terms ("
+                "term TEXT PRIMARY KEY, df INTEGER NOT NULL)"
+            )
+            (self.documents,) = connection.execute(
+                "SELECT COUNT(*) FROM documents"
+            ).fetchone()
+            self.df = dict(connection.execute("SELECT term, df FROM terms"))
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def add(self, document_id, terms: Iterable[str]) -> bool:
+        """Count the terms of a document, returns False if it was already added."""
+        terms = set(terms)
+        with self._lock, contextlib.closing(self._connect()) as connection:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO documents VALUES (?, ?)",
+                    (document_id, time.time()),
+                )
+                if cursor.rowcount == 0:
+                    return False
+                connection.executemany(
+                    "INSERT INTO terms VALUES (?, 1) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in terms],
+                )
+            self.documents += 1
+            for term in terms:
+                self.df[term] = self.df.get(term, 0) + 1
+        return True
+
+    def idf(self, term):
+        # smoothed, so an empty archive ranks by term frequency alone
+        return math.log((1 + self.documents) / (1 + self.df.get(term, 0))) + 1
+
+
+class LocalKeywordExtractor:
+    """
+    Zero-token alternative to KeywordAgent: ranks the words of a meeting by
+    TF-IDF against the archived meetings. Words are lemmatized with pymorphy
+    when it is installed and only nouns are kept, otherwise words that look
+    like verbs are dropped and the rest are grouped by their stem and shown
+    in their most frequent form.
+    """
+
+    def __init__(
+        self,
+        idf_path=config.keywords.idf_path,
+        max_keywords=config.keywords.max_keywords,
+        min_word_length=config.keywords.min_word_length,
+        lemmatize=config.keywords.lemmatize,
+        extra_stopwords: List[str] = config.keywords.extra_stopwords,
+    ):
+        self.document_frequencies = DocumentFrequencies(idf_path)
+        self.max_keywords = max_keywords
+        self.min_word_length = min_word_length
+        self.lemmatizer = load_lemmatizer() if lemmatize else None
+        self.stopwords = STOPWORDS | {word.lower() for word in extra_stopwords}
+
+    def get_terms(self, text):
+        """Return the term counts and the spellings of every term."""
+        counts = Counter()
+        spellings = defaultdict(Counter)
+        for match in WORD_PATTERN.finditer(text):
+            word = match.group().lower().strip("-")
+            if len(word) < self.min_word_length or word in self.stopwords:
+                continue
+            if self.lemmatizer is not None:
+                lemma, pos = self.lemmatizer(word)
+                if pos not in KEYWORD_POS or lemma in self.stopwords:
+                    continue
+                term = spelling = lemma
+            elif looks_like_verb(word):
+                continue
+            else:
+                term, spelling = stem(word), word
+            counts[term] += 1
+            spellings[term][spelling] += 1
+        return counts, spellings
+
+    @staticmethod
+    def get_text(transcription: Union[Transcription, str]) -> str:
+        if isinstance(transcription, Transcription):
+            return "\n".join(text for _, _, text, _ in transcription.result)
+        # a dialog: the speaker labels are not part of the content
+        return "\n".join(
+            line.partition(": ")[2] or line for line in transcription.splitlines()
+        )
+
+    @staticmethod
+    def get_document_id(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def add(self, transcription: Union[Transcription, str], document_id=None) -> bool:
+        """Add a meeting to the IDF statistics without extracting its keywords."""
+        text = self.get_text(transcription)
+        counts, _ = self.get_terms(text)
+        return self.document_frequencies.add(
+            document_id or self.get_document_id(text), counts
+        )
+
+    def extract(
+        self,
+        transcription: Union[Transcription, str],
+        document_id=None,
+        update=True,
+    ) -> List[str]:
+        """
+        Return up to max_keywords keywords. With update=True the meeting is
+        added to the IDF statistics, once per document_id, which defaults to
+        the hash of the text.
+        """
+        text = self.get_text(transcription)
+        counts, spellings = self.get_terms(text)
+        if update:
+            self.document_frequencies.add(
+                document_id or self.get_document_id(text), counts
+            )
+        idf = self.document_frequencies.idf
+        scores: Dict[str, float] = {
+            term: (1 + math.log(count)) * idf(term) for term, count in counts.items()
+        }
+        ranked = sorted(scores, key=lambda term: (-scores[term], term))
+        return [
+            spellings[term].most_common(1)[0][0] for term in ranked[: self.max_keywords]
+        ]
+
+    def reply(self, dialog: str) -> List[str]:
+        # same interface as KeywordAgent
+        return self.extract(dialog)
+
+
+if __name__ == "__main__":
+    # precompute the IDF statistics from archived transcriptions
+    parser = argparse.ArgumentParser()
+    parser.add_argument("transcription_paths", nargs="+")
+    args = parser.parse_args()
+    extractor = LocalKeywordExtractor()
+    start = time.perf_counter()
+    added = 0
+    for path in args.transcription_paths:
+        meeting_id = os.path.splitext(os.path.basename(path))[0]
+        added += extractor.add(Transcription.from_json(path), document_id=meeting_id)
+    print(
+        f"Added {added} of {len(args.transcription_paths)} meetings in "
+        f"{time.perf_counter() - start:.1f}s, "
+        f"{extractor.document_frequencies.documents} meetings in total"
+    )
@@ -1,9 +1,406 @@
+import contextlib
+import hashlib
+import importlib.util
 import json
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 
-from openai import OpenAI
+import httpx
+from openai import DEFAULT_MAX_RETRIES, OpenAI
 
 from config import config
+from summarization.backends import InProcessBackend, OpenAIBackend, load_llama_cpp
+from summarization.rate_limit import get_scheduler
+from summarization.token_usage import get_token_usage_tracker
+
+PROMPT_LAYOUTS = ["system_first", "transcript_first"]
+# System message shared by every agent in the transcript_first layout. Together
+# with the transcript it forms an identical prefix the provider can cache
+SHARED_SYSTEM_PROMPT = "Ты помогаешь составлять отчеты о встречах. Сначала дана расшифровка встречи, затем задание к ней."
+
+
+class BudgetExceededError(ValueError):
+    pass
+
+
+def load_encoding(model):
+    """
+    Return the tiktoken encoding of the model, or None if it is unavailable.
+    tiktoken downloads the encoding on first use and keeps it in
+    TIKTOKEN_CACHE_DIR, so machines without internet access need a copy of it.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # the encoding files could not be downloaded or read
+        print(f"Falling back to approximate token counts: {e}")
+        return None
+
+
+class TokenCounter:
+    """
+    Counts tokens locally. Transcripts are counted line by line and line
+    counts are cached, so the same dialog sent to several agents, or
+    re-chunked for map-reduce, is only tokenized once. Uncached lines are
+    encoded in one multithreaded batch.
+    """
+
+    def __init__(
+        self, model=config.llm.model, cache_size=config.budget.token_cache_size
+    ):
+        self.model = model
+        self.cache_size = cache_size
+        self.encoding = load_encoding(model)
+        self._line_counts = {}
+        # the agents count their prompts from several threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def approximate_count(text):
+        # about three characters per token for Russian text with OpenAI tokenizers
+        return len(text) // 3 + 1
+
+    def _count_lines(self, lines):
+        unique = set(lines)
+        uncached = [line for line in unique if line not in self._line_counts]
+        if not uncached:
+            return
+        if len(self._line_counts) + len(uncached) > self.cache_size:
+            self._line_counts = {}
+            uncached = list(unique)
+        if self.encoding is None:
+            counts = [self.approximate_count(line) for line in uncached]
+        else:
+            counts = map(len, self.encoding.encode_ordinary_batch(uncached))
+        self._line_counts.update(zip(uncached, counts))
+
+    def count(self, text):
+        lines = text.split("\n")
+        with self._lock:
+            self._count_lines(lines)
+            line_counts = self._line_counts
+        # a newline is about one token of its own
+        return sum(line_counts[line] for line in lines) + len(lines) - 1
+
+
+_token_counters = {}
+_token_counters_lock = threading.Lock()
+
+
+def get_token_counter(model=config.llm.model):
+    with _token_counters_lock:
+        if model not in _token_counters:
+            _token_counters[model] = TokenCounter(model)
+        return _token_counters[model]
+
+
+def estimate_tokens(text, model=config.llm.model):
+    return get_token_counter(model).count(text)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Cost in USD from config.llm.prices, 0 for models without a price."""
+    prices = config.llm.prices.get(model)
+    if prices is None:
+        return 0.0
+    return (
+        prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]
+    ) / 1e6
+
+
+class ConnectionStats:
+    """
+    Counts HTTP requests and newly opened TCP connections of the shared client.
+    Every request that did not open a connection reused a pooled one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    def trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": max(self.requests - self.new_connections, 0),
+            }
+
+
+connection_stats = ConnectionStats()
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_client(
+    api_key=config.auth.openai_api_key,
+    base_url=config.llm.base_url,
+    http2=config.http.http2,
+    max_connections=config.http.max_connections,
+    max_keepalive_connections=config.http.max_keepalive_connections,
+    keepalive_expiry=config.http.keepalive_expiry,
+    timeout=config.http.timeout,
+    connect_timeout=config.http.connect_timeout,
+    max_retries=0 if config.rate_limit.enabled else DEFAULT_MAX_RETRIES,
+):
+    # HTTP/2 needs the optional h2 package, fall back to pooled HTTP/1.1 without it
+    http2 = http2 and importlib.util.find_spec("h2") is not None
+    timeout = httpx.Timeout(timeout, connect=connect_timeout)
+    http_client = httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+        event_hooks={"request": [connection_stats.on_request]},
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=max_retries,
+        http_client=http_client,
+    )
+
+
+def get_client():
+    """
+    Return the process-wide client shared by every LLM, so all agents and
+    meetings reuse the same connection pool.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_client()
+        return _client
+
+
+def set_client(client):
+    global _client
+    with _client_lock:
+        _client = client
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def create_backend(name, settings=None):
+    """Create a backend from its settings, by default config.backends[name]."""
+    settings = dict(settings or config.backends[name])
+    backend_type = settings.pop("type")
+    model = settings.pop("model", None)
+    supports_json_schema = settings.pop("json_schema_output", True)
+    if backend_type == "openai":
+        return OpenAIBackend(
+            name, get_client(), model=model, supports_json_schema=supports_json_schema
+        )
+    if backend_type == "openai_compatible":
+        # local servers are not rate limited by the scheduler, the client retries itself
+        client = create_client(http2=False, max_retries=DEFAULT_MAX_RETRIES, **settings)
+        return OpenAIBackend(
+            name,
+            client,
+            model=model,
+            supports_json_schema=supports_json_schema,
+            rate_limited=False,
+        )
+    if backend_type == "llama_cpp":
+        generate = load_llama_cpp(settings.pop("model_path"), **settings)
+        return InProcessBackend(
+            name,
+            generate,
+            get_token_counter().count,
+            model=model,
+            supports_json_schema=supports_json_schema,
+        )
+    raise ValueError(f"Unknown backend type {backend_type}")
+
+
+def get_backend(name=config.llm.backend):
+    """Return the process-wide backend with the given name from config.backends."""
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = create_backend(name)
+        return _backends[name]
+
+
+def set_backend(backend):
+    """Register a backend under its name, e.g. an InProcessBackend with a custom model."""
+    with _backends_lock:
+        _backends[backend.name] = backend
+
+
+class ResponseCache:
+    """
+    Completions keyed by (model, system prompt, user prompt hash, sampling params).
+    Entries live in SQLite and expire after ttl seconds. The least recently used
+    ones are evicted above max_entries. Recent hits are served from an
+    in-memory LRU without touching the disk.
+    """
+
+    def __init__(
+        self,
+        path=config.cache.path,
+        ttl=config.cache.ttl,
+        max_entries=config.cache.max_entries,
+        memory_entries=config.cache.memory_entries,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, completion TEXT NOT NULL, "
+                "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access "
+                "ON responses (last_access)"
+            )
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    @staticmethod
+    def make_key(
+        model,
+        system_prompt,
+        prompt,
+        sampling_params=None,
+        prompt_layout=None,
+        backend=None,
+    ):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        key = [model, system_prompt, prompt_hash, sampling_params or {}]
+        if prompt_layout not in (None, "system_first"):
+            key.append(prompt_layout)
+        if backend not in (None, "openai"):
+            key.append(backend)
+        key = json.dumps(
+            key,
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return (completion, prompt_tokens, completion_tokens) or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[3] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry[:3]
+                del self._memory[key]
+        with contextlib.closing(self._connect()) as connection, connection:
+            row = connection.execute(
+                "SELECT completion, prompt_tokens, completion_tokens, created_at "
+                "FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[3] > self.ttl:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+        with self._lock:
+            self._remember(key, row)
+        return row[:3]
+
+    def put(self, key, completion, prompt_tokens, completion_tokens):
+        # refusals, filtered replies and tool calls come without text
+        if not isinstance(completion, str):
+            return
+        now = time.time()
+        entry = (completion, prompt_tokens, completion_tokens, now)
+        with self._lock:
+            self._remember(key, entry)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key,) + entry + (now,),
+            )
+            connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            )
+            connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM responses")
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
 
 
 class LLM:
@@ -12,11 +409,25 @@ class LLM:
         token_usage_report_path,
         system_prompt=None,
         system_prompt_file=None,
-        model_name=config.llm.model,
+        model_name=None,
+        client=None,
+        agent_name=None,
+        sampling_params=None,
+        cache=None,
+        prompt_layout=config.llm.prompt_layout,
+        scheduler=None,
+        backend=None,
     ):
+        """
+        The backend is a Backend or a name in config.backends, a client is
+        wrapped into an OpenAI backend. Without an explicit backend or model,
+        config.llm.agents[agent_name] is used, then the default backend and its
+        model, then config.llm.model.
+        """
         assert (
             system_prompt or system_prompt_file
         ), "Either system_prompt or system_prompt_path must be provided"
+        assert client is None or backend is None, "Pass either client or backend"
         if system_prompt_file:
             system_prompt_path = os.path.join(
                 config.llm.prompts_dir, system_prompt_file
@@ -24,44 +435,295 @@ class LLM:
             with open(system_prompt_path, "r") as f:
                 system_prompt = f.read()
         self.system_prompt = system_prompt
+        overrides = config.llm.agents.get(agent_name, {}) if agent_name else {}
+        agent_backend = overrides.get("backend", config.llm.backend)
+        if client is not None:
+            backend = OpenAIBackend("openai", client)
+        if backend is None:
+            backend = agent_backend
+        if isinstance(backend, str):
+            backend = get_backend(backend)
+        self.backend = backend
+        # the OpenAI client of the backend, batch jobs need it for the files API
+        self.client = getattr(backend, "client", None)
+        if model_name is None:
+            # the model override belongs to the agent's backend, not to an explicit one
+            if overrides.get("model") and backend.name == agent_backend:
+                model_name = overrides["model"]
+            else:
+                model_name = backend.model or config.llm.model
         self.model_name = model_name
-        self.client = OpenAI(api_key=config.auth.openai_api_key)
+        self.agent_name = agent_name
         self.token_usage_report_path = token_usage_report_path
-        with open(self.token_usage_report_path, "r") as f:
-            self.token_usage_report = json.load(f)
-        if self.model_name not in self.token_usage_report:
-            self.token_usage_report[self.model_name] = {
-                "total_prompt_tokens": 0,
-                "total_completion_tokens": 0,
-            }
+        self.token_usage = get_token_usage_tracker(token_usage_report_path)
+        self.sampling_params = dict(sampling_params or {})
+        if not backend.supports_json_schema:
+            self.sampling_params.pop("response_format", None)
+        assert (
+            prompt_layout in PROMPT_LAYOUTS
+        ), f"prompt_layout should be one of {PROMPT_LAYOUTS}"
+        self.prompt_layout = prompt_layout
+        # cache=False disables caching for this instance
+        if cache is None and config.cache.enabled:
+            cache = get_response_cache()
+        self.cache = cache or None
+        # scheduler=False sends requests without rate limiting and retries
+        if scheduler is None and config.rate_limit.enabled and backend.rate_limited:
+            scheduler = get_scheduler()
+        self.scheduler = scheduler or None
+        self.last_stream_metrics = None
 
-    def get_response(self, prompt):
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": self.system_prompt},
+    def get_messages(self, prompt):
+        if self.prompt_layout == "transcript_first":
+            # The agent-specific instructions go last, so requests of all
+            # agents for the same transcript share everything before them
+            return [
+                {"role": "system", "content": SHARED_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt},
-            ],
+                {"role": "user", "content": self.system_prompt},
+            ]
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
+    def estimate_prompt_tokens(self, prompt):
+        # every message adds a few tokens of chat formatting
+        counter = get_token_counter(self.model_name)
+        messages = self.get_messages(prompt)
+        return sum(counter.count(m["content"]) + 4 for m in messages) + 3
+
+    def get_request_body(self, prompt):
+        """Parameters of the chat completion request, as sent to the API."""
+        return {
+            "model": self.model_name,
+            "messages": self.get_messages(prompt),
+            **self.sampling_params,
+        }
+
+    def get_cache_key(self, prompt):
+        return ResponseCache.make_key(
+            self.model_name,
+            self.system_prompt,
+            prompt,
+            self.sampling_params,
+            self.prompt_layout,
+            self.backend.name,
         )
-        self.report_token_usage(response)
-        completion = response.choices[0].message.content
+
+    def get_cached_response(self, key):
+        cached = self.cache.get(key)
+        if cached is not None:
+            _, prompt_tokens, completion_tokens = cached
+            self.token_usage.record(
+                self.model_name,
+                agent=self.agent_name,
+                backend=self.backend.name,
+                cache_hits=1,
+                saved_prompt_tokens=prompt_tokens,
+                saved_completion_tokens=completion_tokens,
+            )
+        return cached
+
+    def get_response(self, prompt):
+        completion, _, _, _ = self.get_response_with_usage(prompt)
         return completion
 
-    def report_token_usage(self, response):
+    def get_response_with_usage(self, prompt):
+        """
+        Return (completion, prompt_tokens, completion_tokens, from_cache) of
+        the request. The completion is None when the reply has no text, e.g.
+        a refusal.
+        """
+        if self.cache is not None:
+            key = self.get_cache_key(prompt)
+            cached = self.get_cached_response(key)
+            if cached is not None:
+                return (*cached, True)
+        response, latency = self.create_completion(prompt)
+        self.report_token_usage(response, latency_ms=round(latency * 1000))
+        completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         completion_tokens = response.usage.completion_tokens
-        self.token_usage_report[self.model_name]["total_prompt_tokens"] += prompt_tokens
-        self.token_usage_report[self.model_name][
-            "total_completion_tokens"
-        ] += completion_tokens
-        with open(self.token_usage_report_path, "w") as f:
-            json.dump(self.token_usage_report, f)
-
-    def show_token_usage_report(self):
-        prompt_tokens = self.token_usage_report[self.model_name]["total_prompt_tokens"]
-        completion_tokens = self.token_usage_report[self.model_name][
-            "total_completion_tokens"
-        ]
-        print(f"Total prompt tokens: {prompt_tokens}")
-        print(f"Total completion tokens: {completion_tokens}")
-        print(f"Total tokens: {prompt_tokens + completion_tokens}")
+        if self.cache is not None:
+            self.cache.put(key, completion, prompt_tokens, completion_tokens)
+        return completion, prompt_tokens, completion_tokens, False
+
+    def stream_response(self, prompt):
+        """
+        Yield the completion in pieces as they arrive. Usage, the time to first
+        token and the generation speed are recorded when the stream ends, also
+        when the caller stops reading early, and kept in last_stream_metrics.
+        Only completed streams are cached.
+        """
+        if self.cache is not None:
+            key = self.get_cache_key(prompt)
+            cached = self.get_cached_response(key)
+            if cached is not None:
+                yield cached[0]
+                return
+        start = time.perf_counter()
+        stream, _ = self.create_completion(prompt, stream=True)
+        pieces, usage, first_token_at = [], None, None
+        completed = False
+        try:
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                pieces.append(chunk.choices[0].delta.content)
+                yield pieces[-1]
+            completed = True
+        finally:
+            stream.close()
+            completion = "".join(pieces)
+            prompt_tokens, completion_tokens = self.record_stream_usage(
+                prompt, completion, usage, start, first_token_at
+            )
+        if completed and self.cache is not None:
+            self.cache.put(key, completion, prompt_tokens, completion_tokens)
+
+    def record_stream_usage(self, prompt, completion, usage, start, first_token_at):
+        """Record the usage and metrics of a finished stream, return its tokens."""
+        end = time.perf_counter()
+        if usage is None:
+            # the server ignored stream_options or the stream was not read to
+            # the end, count the tokens locally
+            prompt_tokens = self.estimate_prompt_tokens(prompt)
+            completion_tokens = get_token_counter(self.model_name).count(completion)
+        else:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+        if self.scheduler is not None:
+            # the scheduler released the request before the usage was known
+            self.scheduler.correct(
+                self.estimate_request_tokens(prompt), prompt_tokens + completion_tokens
+            )
+        first_token_at = first_token_at or end
+        self.last_stream_metrics = {
+            "time_to_first_token": first_token_at - start,
+            "tokens_per_second": completion_tokens / max(end - first_token_at, 1e-6),
+            "completion_tokens": completion_tokens,
+        }
+        self.record_usage(
+            prompt_tokens,
+            completion_tokens,
+            cached_tokens=self.get_cached_tokens(usage),
+            streams=1,
+            first_token_ms=round((first_token_at - start) * 1000),
+            stream_ms=round((end - first_token_at) * 1000),
+            streamed_completion_tokens=completion_tokens,
+            latency_ms=round((end - start) * 1000),
+        )
+        return prompt_tokens, completion_tokens
+
+    def estimate_request_tokens(self, prompt):
+        """Tokens a request is expected to use, as admitted by the scheduler."""
+        return (
+            self.estimate_prompt_tokens(prompt)
+            + config.budget.expected_completion_tokens
+        )
+
+    def create_completion(self, prompt, stream=False):
+        """Return the response and the time the backend took to answer."""
+        body = self.get_request_body(prompt)
+        if stream:
+            body.update(stream=True, stream_options={"include_usage": True})
+        timing = {}
+
+        def request():
+            start = time.perf_counter()
+            try:
+                return self.backend.create(body)
+            finally:
+                timing["latency"] = time.perf_counter() - start
+
+        def get_used_tokens(response):
+            return response.usage.prompt_tokens + response.usage.completion_tokens
+
+        if self.scheduler is None:
+            response = request()
+        else:
+            response = self.scheduler.call(
+                request,
+                tokens=self.estimate_request_tokens(prompt),
+                # the usage of a stream is only known once it has been read,
+                # stream_response() corrects the estimate then
+                get_used_tokens=None if stream else get_used_tokens,
+            )
+        return response, timing["latency"]
+
+    @staticmethod
+    def get_cached_tokens(usage):
+        details = getattr(usage, "prompt_tokens_details", None)
+        return getattr(details, "cached_tokens", None) or 0
+
+    def record_usage(self, prompt_tokens, completion_tokens, cached_tokens=0, **counts):
+        self.token_usage.record(
+            self.model_name,
+            agent=self.agent_name,
+            backend=self.backend.name,
+            requests=1,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_prompt_tokens=cached_tokens,
+            **counts,
+        )
+
+    def report_token_usage(self, response, **counts):
+        self.record_usage(
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens,
+            cached_tokens=self.get_cached_tokens(response.usage),
+            **counts,
+        )
+
+    def show_token_usage_report(self, group_by="model"):
+        for key, usage in self.token_usage.report(group_by).items():
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage["completion_tokens"]
+            print(f"{group_by.capitalize()}: {key}")
+            print(f"Requests: {usage['requests']}")
+            print(f"Total prompt tokens: {prompt_tokens}")
+            print(f"Total completion tokens: {completion_tokens}")
+            print(f"Total tokens: {prompt_tokens + completion_tokens}")
+            if usage["cached_prompt_tokens"]:
+                print(f"Provider-cached prompt tokens: {usage['cached_prompt_tokens']}")
+            saved = usage["saved_prompt_tokens"] + usage["saved_completion_tokens"]
+            if saved:
+                print(f"Cache hits: {usage['cache_hits']}")
+                print(f"Saved tokens: {saved}")
+            if usage["latency_ms"]:
+                latency = usage["latency_ms"] / max(usage["requests"], 1)
+                throughput = completion_tokens / (usage["latency_ms"] / 1000)
+                print(f"Average latency: {latency:.0f} ms")
+                print(f"Throughput: {throughput:.1f} completion tokens/s")
+            if usage["streams"]:
+                first_token = usage["first_token_ms"] / usage["streams"]
+                speed = usage["streamed_completion_tokens"] / max(
+                    usage["stream_ms"] / 1000, 1e-6
+                )
+                print(f"Streamed requests: {usage['streams']}")
+                print(f"Average time to first token: {first_token:.0f} ms")
+                print(f"Generation speed: {speed:.1f} tokens/s")
+
+
+if __name__ == "__main__":
+    import random
+
+    words = ["встреча", "проект", "сроки", "задача", "релиз", "команда", "ну", "да"]
+    lines = [
+        f"SPEAKER_{random.randint(0, 5):02d}: "
+        + " ".join(random.choice(words) for _ in range(random.randint(3, 40)))
+        for _ in range(20000)
+    ]
+    dialog = "\n".join(lines)
+    counter = TokenCounter()
+    for attempt in ("cold", "warm"):
+        start = time.perf_counter()
+        tokens = counter.count(dialog)
+        elapsed = time.perf_counter() - start
+        print(f"{attempt}: {tokens} tokens counted in {elapsed * 1000:.1f} ms")
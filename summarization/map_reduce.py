@@ -0,0 +1,246 @@
+import contextvars
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from asr.transcription import Transcription
+from config import config
+from summarization.agents import (
+    MergeShortSummaryAgent,
+    MergeStructuredSummaryAgent,
+    MergeTitleAgent,
+)
+from summarization.llm import estimate_tokens
+
+
+def get_turns(transcription: Transcription) -> List[str]:
+    return [f"{speaker}: {text}" for _, _, text, speaker in transcription.result]
+
+
+def split_long_turn(turn: str, max_tokens: int, count_tokens=estimate_tokens):
+    """
+    Split a single turn that does not fit into a chunk by words,
+    repeating the speaker label on every piece.
+    """
+    speaker, _, text = turn.partition(": ")
+    prefix = f"{speaker}: "
+    budget = max_tokens - count_tokens(prefix)
+    pieces, words, tokens = [], [], 0
+    for word in text.split():
+        word_tokens = count_tokens(word + " ")
+        if words and tokens + word_tokens > budget:
+            pieces.append(prefix + " ".join(words))
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        pieces.append(prefix + " ".join(words))
+    return pieces
+
+
+def split_dialog(
+    turns: List[str],
+    max_tokens: int = config.map_reduce.chunk_tokens,
+    count_tokens=estimate_tokens,
+) -> List[str]:
+    """
+    Group consecutive speaker turns into chunks of at most max_tokens.
+    Turns are never split unless a single turn exceeds the budget.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for turn in turns:
+        if count_tokens(turn) > max_tokens:
+            parts = split_long_turn(turn, max_tokens, count_tokens)
+        else:
+            parts = [turn]
+        for part in parts:
+            part_tokens = count_tokens(part) + 1
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def merge_keywords(
+    keyword_lists: List[List[str]], max_keywords: int = config.map_reduce.max_keywords
+) -> List[str]:
+    """Keep the keywords mentioned in most chunks, earlier chunks win ties."""
+    counts = Counter()
+    first_seen = {}
+    spelling = {}
+    for keywords in keyword_lists:
+        for keyword in keywords:
+            key = keyword.lower()
+            if not key:
+                continue
+            counts[key] += 1
+            first_seen.setdefault(key, len(first_seen))
+            spelling.setdefault(key, keyword)
+    ranked = sorted(counts, key=lambda key: (-counts[key], first_seen[key]))
+    return [spelling[key] for key in ranked[:max_keywords]]
+
+
+class MapReduceSummarizer:
+    """
+    Summarizes transcripts that do not fit into one request: the dialog is split
+    at speaker turns into token-budgeted chunks, the chunks are summarized
+    concurrently and the partial summaries are merged level by level.
+    """
+
+    def __init__(
+        self,
+        summarizer,
+        chunk_tokens=config.map_reduce.chunk_tokens,
+        max_workers=config.map_reduce.max_workers,
+        fan_in=config.map_reduce.fan_in,
+        count_tokens=estimate_tokens,
+    ):
+        self.summarizer = summarizer
+        self.chunk_tokens = chunk_tokens
+        self.max_workers = max_workers
+        assert fan_in >= 2, "fan_in should be at least 2"
+        self.fan_in = fan_in
+        self.count_tokens = count_tokens
+        self.timings = {}
+        token_usage_report_path = summarizer.token_usage_report_path
+        self.merge_short_summary_agent = MergeShortSummaryAgent(
+            token_usage_report_path,
+            client=summarizer.client,
+            backend=summarizer.backend,
+        )
+        self.merge_structured_summary_agent = MergeStructuredSummaryAgent(
+            token_usage_report_path,
+            client=summarizer.client,
+            backend=summarizer.backend,
+        )
+        self.merge_title_agent = MergeTitleAgent(
+            token_usage_report_path,
+            client=summarizer.client,
+            backend=summarizer.backend,
+        )
+
+    def _run_concurrently(self, tasks):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, agent.reply, text)
+                for agent, text in tasks
+            ]
+            return [future.result() for future in futures]
+
+    def map(self, chunks: List[str]) -> List[Dict]:
+        agents = {
+            "short_summary": self.summarizer.short_summary_agent,
+            "structured_summary": self.summarizer.structured_summary_agent,
+            "keywords": self.summarizer.keyword_agent,
+        }
+        if self.summarizer.keyword_extractor is not None:
+            # the keywords of the whole meeting are extracted locally
+            del agents["keywords"]
+        tasks = [(agent, chunk) for chunk in chunks for agent in agents.values()]
+        outputs = iter(self._run_concurrently(tasks))
+        return [{name: next(outputs) for name in agents} for _ in chunks]
+
+    @staticmethod
+    def _partial_to_text(partial):
+        return (
+            f"Краткое содержание: {partial['short_summary']}\n"
+            f"Саммари по темам: "
+            f"{json.dumps(partial['structured_summary'], ensure_ascii=False)}"
+        )
+
+    def _group(self, partials):
+        # at least two partials per group even over chunk_tokens, otherwise
+        # large partials would never be merged and the levels would not end
+        groups, current, current_tokens = [], [], 0
+        for partial in partials:
+            tokens = self.count_tokens(self._partial_to_text(partial))
+            if len(current) >= self.fan_in or (
+                len(current) >= 2 and current_tokens + tokens > self.chunk_tokens
+            ):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(partial)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _merge_tasks(self, group):
+        short_summaries = "\n\n".join(
+            f"Часть {i + 1}: {partial['short_summary']}"
+            for i, partial in enumerate(group)
+        )
+        structured_summaries = json.dumps(
+            [partial["structured_summary"] for partial in group],
+            ensure_ascii=False,
+            indent=1,
+        )
+        return [
+            (self.merge_short_summary_agent, short_summaries),
+            (self.merge_structured_summary_agent, structured_summaries),
+        ], short_summaries
+
+    def reduce(self, partials: List[Dict]) -> Dict:
+        keywords = merge_keywords([partial.get("keywords", []) for partial in partials])
+        level = 0
+        while True:
+            level += 1
+            start = time.perf_counter()
+            groups = self._group(partials)
+            tasks = []
+            for group in groups:
+                merge_tasks, short_summaries = self._merge_tasks(group)
+                tasks.extend(merge_tasks)
+            if len(groups) == 1:
+                # the last level also names the meeting from the same partial summaries
+                tasks.append((self.merge_title_agent, short_summaries))
+            outputs = self._run_concurrently(tasks)
+            self.timings[f"reduce_{level}"] = time.perf_counter() - start
+            if len(groups) == 1:
+                short_summary, structured_summary, title = outputs
+                return {
+                    "title": title,
+                    "short_summary": short_summary,
+                    "structured_summary": structured_summary,
+                    "keywords": keywords,
+                }
+            partials = [
+                {"short_summary": short, "structured_summary": structured}
+                for short, structured in zip(outputs[::2], outputs[1::2])
+            ]
+
+    def run(self, dialog_or_transcription, verbose=False) -> Dict:
+        self.timings = {}
+        start = time.perf_counter()
+        if isinstance(dialog_or_transcription, Transcription):
+            turns = get_turns(dialog_or_transcription)
+        else:
+            turns = dialog_or_transcription.split("\n")
+        chunks = split_dialog(turns, self.chunk_tokens, self.count_tokens)
+        if verbose:
+            print(f"Split the dialog into {len(chunks)} chunks")
+        if not chunks:
+            # nothing was said, so there is nothing to send
+            self.timings["total"] = time.perf_counter() - start
+            return {
+                "title": "",
+                "short_summary": "",
+                "structured_summary": [],
+                "keywords": [],
+            }
+        if len(chunks) == 1:
+            results = self.summarizer.run_agents(chunks[0])
+            self.timings["map"] = self.summarizer.timings["total"]
+            self.timings["total"] = time.perf_counter() - start
+            return results
+        partials = self.map(chunks)
+        self.timings["map"] = time.perf_counter() - start
+        results = self.reduce(partials)
+        self.timings["total"] = time.perf_counter() - start
+        return results
@@ -1,17 +1,29 @@
 import json
 import re
-from typing import Dict, List
+from typing import Any, Dict, List
 
 from summarization.output_validation import validate_structured_summary
 
 
+def strip_code_fence(text) -> str:
+    if text is None:
+        return ""
+    text = re.sub(r"^\s*```(?:json)?", "", text)
+    return re.sub(r"```\s*$", "", text).strip()
+
+
 def parse_structured_summary(text) -> List[Dict[str, List[str]]]:
-    text = re.sub(r'^```json', "", text)
-    text = re.sub(r'```$', "", text)
+    """
+    Accepts a bare list of topics or the {"topics": [...]} object returned
+    with a JSON schema. Returns [] when the text is not valid JSON.
+    """
     try:
-        return json.loads(text)
-    except:
+        data = json.loads(strip_code_fence(text))
+    except ValueError:
         return []
+    if isinstance(data, dict) and "topics" in data:
+        return data["topics"]
+    return data
 
 
 def process_keywords(keywords):
@@ -19,6 +31,84 @@ def process_keywords(keywords):
     return [kw.strip() for kw in kw_list]
 
 
+def parse_keywords(text) -> List[str]:
+    """
+    Accepts comma separated keywords or the {"keywords": [...]} object
+    returned with a JSON schema. Returns [] for broken JSON.
+    """
+    text = strip_code_fence(text)
+    if not text:
+        return []
+    if not text.startswith(("{", "[")):
+        return process_keywords(text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return []
+    if isinstance(data, dict):
+        data = data.get("keywords", [])
+    if not isinstance(data, list):
+        return []
+    return [kw.strip() for kw in data if isinstance(kw, str)]
+
+
+def parse_combined_summary(text) -> Dict[str, Any]:
+    try:
+        data = json.loads(strip_code_fence(text or ""))
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class IncrementalArrayParser:
+    """
+    Parses the objects of a JSON array while it is still being generated:
+    feed() takes the next piece of text and returns the objects closed in it.
+    The first array in the text is parsed, so it may be wrapped in an object
+    like {"topics": [...]}. Text before the JSON, such as a ```json fence, is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.array_depth = None
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+
+    def feed(self, text) -> List[Any]:
+        self.buffer += text
+        items = []
+        for i in range(self.position, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char in "[{":
+                if char == "[" and self.array_depth is None:
+                    self.array_depth = self.depth + 1
+                elif char == "{" and self.depth == self.array_depth:
+                    self.item_start = i
+                self.depth += 1
+            elif char in "]}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == self.array_depth and self.item_start is not None:
+                    try:
+                        items.append(json.loads(self.buffer[self.item_start : i + 1]))
+                    except ValueError:
+                        pass
+                    self.item_start = None
+        self.position = len(self.buffer)
+        return items
+
+
 if __name__ == "__main__":
     text = """
     ```json
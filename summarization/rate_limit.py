@@ -0,0 +1,258 @@
+import contextlib
+import contextvars
+import email.utils
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import openai
+
+from config import config
+
+PRIORITIES = ["interactive", "backfill"]
+
+current_priority = contextvars.ContextVar(
+    "current_priority", default=config.rate_limit.default_priority
+)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Schedule every LLM call made inside the block with the given priority."""
+    assert priority in PRIORITIES, f"priority should be one of {PRIORITIES}"
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Refills at rate_per_minute up to capacity. The level may go negative when
+    the actual usage of a request turns out larger than its estimate, which
+    delays the following requests instead of overshooting the budget.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(
+            self.capacity, self.level + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def time_until(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+def get_retry_after(error):
+    """Seconds from the Retry-After headers of an API error, or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                retry_at = email.utils.parsedate_to_datetime(value)
+                return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class RateLimitScheduler:
+    """
+    Shared by every LLM in the process. Requests wait until both the
+    requests-per-minute and the tokens-per-minute buckets allow them. Waiting
+    requests are admitted in priority order, interactive before backfill,
+    then first come first served. Rate limit, server and connection errors are
+    retried with jittered exponential backoff. A Retry-After header overrides
+    the backoff and pauses all requests, since the limit is shared.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=config.rate_limit.requests_per_minute,
+        tokens_per_minute=config.rate_limit.tokens_per_minute,
+        max_retries=config.rate_limit.max_retries,
+        base_delay=config.rate_limit.base_delay,
+        max_delay=config.rate_limit.max_delay,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._counter = itertools.count()
+        self._paused_until = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._condition:
+            self._stats = {
+                priority: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0}
+                for priority in PRIORITIES
+            }
+            self.in_flight = 0
+            self.retries = 0
+            self.failures = 0
+
+    def _delay(self, tokens):
+        return max(
+            self._paused_until - time.monotonic(),
+            self.requests.time_until(1),
+            self.tokens.time_until(tokens),
+        )
+
+    def acquire(self, tokens, priority=None):
+        """Block until the request may be sent, return the time spent waiting."""
+        priority = priority or current_priority.get()
+        assert priority in PRIORITIES, f"priority should be one of {PRIORITIES}"
+        ticket = (PRIORITIES.index(priority), next(self._counter))
+        start = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        delay = self._delay(tokens)
+                        if delay <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            break
+                    else:
+                        delay = None
+                    self._condition.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+            wait = time.monotonic() - start
+            stats = self._stats[priority]
+            stats["requests"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            self.in_flight += 1
+        return wait
+
+    def release(self, estimated_tokens, actual_tokens=None):
+        """Correct the token bucket with the usage reported by the API."""
+        with self._condition:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                self.tokens.consume(actual_tokens - estimated_tokens)
+            self._condition.notify_all()
+
+    def correct(self, estimated_tokens, actual_tokens):
+        """
+        Correct the token bucket after the request was released, e.g. with the
+        usage of a stream, which is only known once it has been read.
+        """
+        with self._condition:
+            self.tokens.consume(actual_tokens - estimated_tokens)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def backoff(self, attempt):
+        # "full jitter": spreads the retries of concurrent workers apart
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(self, func, tokens, priority=None, get_used_tokens=None):
+        """
+        Run func() within the budget. tokens is the estimated usage of the request,
+        get_used_tokens(result) returns the actual one.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens, priority)
+            used_tokens = None
+            try:
+                result = func()
+                if get_used_tokens is not None:
+                    used_tokens = get_used_tokens(result)
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    with self._condition:
+                        self.failures += 1
+                    raise
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    delay = min(retry_after, self.max_delay)
+                    self.pause(delay)
+                else:
+                    delay = self.backoff(attempt)
+                with self._condition:
+                    self.retries += 1
+            finally:
+                self.release(tokens, used_tokens)
+            time.sleep(delay)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "queue_depth": len(self._waiting),
+                "in_flight": self.in_flight,
+                "retries": self.retries,
+                "failures": self.failures,
+                "priorities": {
+                    priority: {
+                        "requests": stats["requests"],
+                        "avg_wait": stats["total_wait"] / max(stats["requests"], 1),
+                        "max_wait": stats["max_wait"],
+                    }
+                    for priority, stats in self._stats.items()
+                },
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, so all agents share one budget."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,241 @@
+import contextlib
+import json
+import textwrap
+from itertools import zip_longest
+from typing import Dict
+
+from asr.analytics import analytics_to_lines
+
+FORMATS = ["txt", "html", "json", "md"]
+
+TXT_TEMPLATE = """{title}
+Дата: {creation_date}
+Участники: {speakers}
+Ключевые слова: {keywords}
+Супер краткое содержание\n{short_summary}\n
+Саммари по темам\n{structured_summary}\n
+Статистика встречи\n{analytics}
+"""
+HTML_TEMPLATE = """
+        <html>
+        <meta charset="utf-8">
+        <body>
+        <h1>{title}</h1>
+        <b>Дата:</b> {creation_date}<br>
+        <b>Участники:</b> {speakers}<br>
+        <b>Ключевые слова:</b> {keywords}<br>
+        <b>Супер краткое содержание:</b><br>{short_summary}<br><br>
+        <b>Саммари по темам:</b><br>{structured_summary}
+        <b>Статистика встречи:</b><br>{analytics}<br>
+        """
+MD_TEMPLATE = """# {title}
+
+**Дата:** {creation_date}
+**Участники:** {speakers}
+**Ключевые слова:** {keywords}
+
+## Супер краткое содержание
+
+{short_summary}
+
+## Саммари по темам
+
+{structured_summary}
+
+## Статистика встречи
+
+{analytics}
+"""
+TRANSCRIPT_HTML_PREFIX = (
+    '<html><meta http-equiv="Content-Type" content="text/html; charset=UTF-8">'
+    "<body><b>Участники:</b> {legend}<br>"
+)
+# separator between turns and what goes around the transcript in each format
+TRANSCRIPT_SEPARATORS = {"txt": "\n", "html": "<br>", "json": ",", "md": "\n\n"}
+TRANSCRIPT_HEADERS = {
+    "txt": "\n\nРасшифровка\n",
+    "html": "<br><br><b>Расшифровка</b><br>",
+    "json": ',\n    "transcript": ',
+    "md": "\n## Расшифровка\n\n",
+}
+
+
+class SummaryRenderer:
+    """
+    Renders a Summary to txt, html, json and md. The transcript, the longest
+    part of every format, is walked once for all formats, and save() streams
+    all requested files in that single pass. Rendered fragments are memoized
+    until invalidate(), which Summary calls whenever it changes.
+    """
+
+    def __init__(self, summary):
+        self.summary = summary
+        self.invalidate()
+
+    def invalidate(self):
+        self._fields = {}
+        self._documents = {}
+        self._transcripts = None
+
+    def get_fields(self, transcript_format="dict"):
+        """Summary fields rendered for a format: "dict", "str" or "html"."""
+        if transcript_format not in self._fields:
+            summary = self.summary
+            transcription = summary.transcription
+            analytics = summary.get_analytics()
+            lines = analytics_to_lines(analytics)
+            if transcript_format == "html":
+                speakers = transcription.get_speaker_ledgend()
+                structured_summary = summary.structured_summary_to_html()
+                keywords = ", ".join(summary.keywords)
+                analytics = "<br>".join(lines)
+            elif transcript_format == "str":
+                speakers = ", ".join(transcription.speakers)
+                structured_summary = summary.structured_summary_to_str()
+                keywords = ", ".join(summary.keywords)
+                analytics = "\n".join(lines)
+            elif transcript_format == "md":
+                speakers = ", ".join(sorted(transcription.speakers))
+                structured_summary = self.structured_summary_to_md()
+                keywords = ", ".join(summary.keywords)
+                analytics = "\n".join(f"- {line}" for line in lines)
+            else:
+                speakers = transcription.speakers
+                structured_summary = summary.structured_summary
+                keywords = summary.keywords
+            self._fields[transcript_format] = {
+                "title": summary.title,
+                "creation_date": summary.get_creation_date(),
+                "keywords": keywords,
+                "speakers": speakers,
+                "short_summary": summary.short_summary,
+                "structured_summary": structured_summary,
+                "analytics": analytics,
+            }
+        return self._fields[transcript_format]
+
+    def structured_summary_to_md(self):
+        return "\n\n".join(
+            f"**{topic['topic']}**\n"
+            + "\n".join(f"- {point}" for point in topic["points"])
+            for topic in self.summary.structured_summary
+        )
+
+    def _head(self, fmt):
+        if fmt == "txt":
+            return TXT_TEMPLATE.format(**self.get_fields("str"))
+        if fmt == "html":
+            return HTML_TEMPLATE.format(**self.get_fields("html"))
+        if fmt == "md":
+            return MD_TEMPLATE.format(**self.get_fields("md"))
+        # the transcript is inserted before the closing brace
+        return json.dumps(self.get_fields("dict"), indent=4)[: -len("\n}")]
+
+    @staticmethod
+    def _tail(fmt):
+        return {"txt": "", "html": "</body></html>", "json": "\n}", "md": ""}[fmt]
+
+    def _transcript_prefix(self, fmt):
+        if fmt == "html":
+            return TRANSCRIPT_HTML_PREFIX.format(
+                legend=self.summary.transcription.get_speaker_ledgend()
+            )
+        return "[" if fmt == "json" else ""
+
+    @staticmethod
+    def _transcript_suffix(fmt, empty):
+        if fmt == "html":
+            return "</body></html>"
+        if fmt == "json":
+            return "]" if empty else "\n    ]"
+        return ""
+
+    def iter_turns(self):
+        """Yield the fragments of every turn in all formats."""
+        transcription = self.summary.transcription
+        speaker2color = transcription.speaker2color
+        for turn, row in zip_longest(transcription.result, self.summary.transcript):
+            fragments = {}
+            if turn is not None:
+                start, end, text, speaker = turn
+                color = speaker2color.get(speaker)
+                fragments["txt"] = f"{speaker} {start} - {end}: {text}"
+                fragments["html"] = (
+                    f"<span style='color:{color}'>{speaker}</span> "
+                    f"{start} - {end}: {text}"
+                )
+                fragments["md"] = f"**{speaker}** {start} - {end}: {text}"
+            if row is not None:
+                # the same layout json.dump(..., indent=4) gives the nested rows
+                fragments["json"] = "\n" + textwrap.indent(
+                    json.dumps(row, indent=4), " " * 8
+                )
+            yield fragments
+
+    def _walk(self, files=None):
+        """
+        Render the transcripts of all formats in one pass, writing them to
+        the open files as they are produced, and memoize them.
+        """
+        files = files or {}
+        parts = {fmt: [] for fmt in FORMATS}
+        for fmt, f in files.items():
+            f.write(self._transcript_prefix(fmt))
+        for fragments in self.iter_turns():
+            for fmt, fragment in fragments.items():
+                if fmt in files:
+                    if parts[fmt]:
+                        files[fmt].write(TRANSCRIPT_SEPARATORS[fmt])
+                    files[fmt].write(fragment)
+                parts[fmt].append(fragment)
+        for fmt, f in files.items():
+            f.write(self._transcript_suffix(fmt, not parts[fmt]))
+        self._transcripts = {
+            fmt: self._transcript_prefix(fmt)
+            + TRANSCRIPT_SEPARATORS[fmt].join(parts[fmt])
+            + self._transcript_suffix(fmt, not parts[fmt])
+            for fmt in FORMATS
+        }
+
+    def get_transcript(self, fmt):
+        if self._transcripts is None:
+            self._walk()
+        return self._transcripts[fmt]
+
+    def render(self, fmt, include_full_transcript=False):
+        assert fmt in FORMATS, f"Format should be one of {FORMATS}"
+        key = (fmt, include_full_transcript)
+        if key not in self._documents:
+            if fmt == "json" and not include_full_transcript:
+                document = json.dumps(self.get_fields("dict"), indent=4)
+            else:
+                document = self._head(fmt)
+                if include_full_transcript:
+                    document += TRANSCRIPT_HEADERS[fmt] + self.get_transcript(fmt)
+                document += self._tail(fmt)
+            self._documents[key] = document
+        return self._documents[key]
+
+    def save(self, paths: Dict[str, str], include_full_transcript=True):
+        """
+        Write the formats to {format: path}. Without a memoized transcript
+        all files are written during one walk over it.
+        """
+        for fmt, path in paths.items():
+            assert fmt in FORMATS, f"Format should be one of {FORMATS}"
+            assert path.endswith(f".{fmt}"), f"Output path must end with .{fmt}"
+        if not include_full_transcript or self._transcripts is not None:
+            for fmt, path in paths.items():
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(self.render(fmt, include_full_transcript))
+            return
+        with contextlib.ExitStack() as stack:
+            files = {
+                fmt: stack.enter_context(open(path, "w", encoding="utf-8"))
+                for fmt, path in paths.items()
+            }
+            for fmt, f in files.items():
+                f.write(self._head(fmt) + TRANSCRIPT_HEADERS[fmt])
+            self._walk(files)
+            for fmt, f in files.items():
+                f.write(self._tail(fmt))
@@ -1,25 +1,80 @@
+import contextvars
 import datetime
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Union
 
 from asr.transcription import Transcription, load_transcription_and_transcript
-from summarization.agents import (KeywordAgent, ShortSummaryAgent,
-                                  StructuredSummaryAgent, TitleAgent)
+from summarization.agents import (CombinedAgent, KeywordAgent,
+                                  ShortSummaryAgent, StructuredSummaryAgent,
+                                  TitleAgent)
+from summarization.compaction import compact_transcript
+from summarization.keywords import LocalKeywordExtractor
+from summarization.llm import BudgetExceededError, estimate_cost
+from summarization.map_reduce import MapReduceSummarizer, get_turns, split_dialog
+from summarization.rate_limit import request_priority
 from summarization.summary import Summary
+from summarization.token_usage import track_meeting
+from config import config
 
 
 class Summarizer:
-    def __init__(self, token_usage_report_path):
+    STRATEGIES = ["full", "compressed", "map_reduce"]
+
+    def __init__(
+        self,
+        token_usage_report_path,
+        client=None,
+        use_combined_agent=config.llm.use_combined_agent,
+        backend=None,
+        keyword_method=config.keywords.method,
+    ):
+        """
+        backend overrides the backend of every agent, e.g. backend="local"
+        keeps a sensitive meeting on the local inference server.
+        keyword_method="local" extracts the keywords without an LLM request.
+        """
+        assert keyword_method in ("llm", "local"), (
+            f"Unknown keyword method {keyword_method}"
+        )
         self.token_usage_report_path = token_usage_report_path
+        self.client = client
+        self.backend = backend
+        self.keyword_method = keyword_method
+        self.use_combined_agent = use_combined_agent
+        self.timings = {}
+        self.last_estimate = None
+        self.compaction_stats = None
         self.init_agents()
 
     def init_agents(self):
-        self.short_summary_agent = ShortSummaryAgent(self.token_usage_report_path)
+        self.short_summary_agent = ShortSummaryAgent(
+            self.token_usage_report_path, client=self.client, backend=self.backend
+        )
         self.structured_summary_agent = StructuredSummaryAgent(
-            self.token_usage_report_path
+            self.token_usage_report_path, client=self.client, backend=self.backend
+        )
+        self.keyword_agent = KeywordAgent(
+            self.token_usage_report_path, client=self.client, backend=self.backend
+        )
+        self.title_agent = TitleAgent(
+            self.token_usage_report_path, client=self.client, backend=self.backend
+        )
+        self.combined_agent = CombinedAgent(
+            self.token_usage_report_path, client=self.client, backend=self.backend
+        )
+        self.keyword_extractor = (
+            LocalKeywordExtractor() if self.keyword_method == "local" else None
         )
-        self.keyword_agent = KeywordAgent(self.token_usage_report_path)
-        self.title_agent = TitleAgent(self.token_usage_report_path)
+        self.map_reduce = MapReduceSummarizer(self)
+
+    @property
+    def llm_fields(self):
+        """The summary fields requested from the LLM."""
+        if self.keyword_extractor is not None:
+            return [name for name in CombinedAgent.FIELDS if name != "keywords"]
+        return list(CombinedAgent.FIELDS)
 
     def process_transcript(self, transcript: List[Dict[str, Any]]):
         dialog = "\n".join([f"{r['speaker']}: {r['text']}" for r in transcript])
@@ -41,28 +96,275 @@ class Summarizer:
         }
         return summary_data
 
+    def run_agents(
+        self,
+        dialog: str,
+        concurrent=True,
+        max_workers=config.llm.max_concurrency,
+        names=None,
+    ):
+        """
+        Run the independent agents of llm_fields (or only the named ones) on
+        the dialog and time each of them. The agents are independent, so in concurrent
+        mode a report costs about one round-trip instead of four.
+        """
+        agents = {
+            "title": self.title_agent,
+            "short_summary": self.short_summary_agent,
+            "structured_summary": self.structured_summary_agent,
+            "keywords": self.keyword_agent,
+        }
+        if names is None:
+            names = self.llm_fields
+        agents = {name: agents[name] for name in names}
+        self.timings = {}
+
+        def run(name):
+            start = time.perf_counter()
+            result = agents[name].reply(dialog)
+            self.timings[name] = time.perf_counter() - start
+            return result
+
+        start = time.perf_counter()
+        results = {}
+        if concurrent and self._should_warm_prefix_cache(agents):
+            # The provider caches a prefix only after a request with it has
+            # been processed, so one agent goes first and the rest hit the cache
+            first = next(iter(agents))
+            results[first] = run(first)
+            agents = {name: agent for name, agent in agents.items() if name != first}
+        if concurrent and max_workers > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(agents))
+            ) as executor:
+                # copy the caller's context so the meeting id reaches the threads
+                futures = {
+                    name: executor.submit(contextvars.copy_context().run, run, name)
+                    for name in agents
+                }
+                results.update(
+                    {name: future.result() for name, future in futures.items()}
+                )
+        else:
+            results.update({name: run(name) for name in agents})
+        self.timings["total"] = time.perf_counter() - start
+        return results
+
+    @staticmethod
+    def _should_warm_prefix_cache(agents):
+        return (
+            config.llm.warm_prefix_cache
+            and len(agents) > 1
+            and all(
+                agent.llm.prompt_layout == "transcript_first"
+                for agent in agents.values()
+            )
+        )
+
+    def run_combined_agent(
+        self, dialog: str, concurrent=True, max_workers=config.llm.max_concurrency
+    ):
+        """
+        Get all fields from one combined request and fall back to the
+        per-field agents only for the fields that failed validation.
+        """
+        start = time.perf_counter()
+        results = self.combined_agent.reply(dialog)
+        combined_time = time.perf_counter() - start
+        missing = [name for name in self.llm_fields if name not in results]
+        if missing:
+            results.update(
+                self.run_agents(
+                    dialog,
+                    concurrent=concurrent,
+                    max_workers=max_workers,
+                    names=missing,
+                )
+            )
+        else:
+            self.timings = {}
+        self.timings["combined"] = combined_time
+        self.timings["total"] = time.perf_counter() - start
+        return results
+
+    def get_dialog(self, transcription: Transcription, strategy="full"):
+        if strategy == "compressed":
+            dialog, self.compaction_stats = compact_transcript(transcription)
+            return dialog
+        return transcription.to_str(include_timestamps=False)
+
+    def estimate(self, transcription: Transcription, strategy="full"):
+        """
+        Estimate prompt tokens, completion tokens and cost of a strategy
+        with the local tokenizer, without sending anything.
+        """
+        expected_completion_tokens = config.budget.expected_completion_tokens
+        if strategy == "map_reduce":
+            chunks = split_dialog(
+                get_turns(transcription),
+                self.map_reduce.chunk_tokens,
+                self.map_reduce.count_tokens,
+            )
+            agents = [
+                self.short_summary_agent,
+                self.structured_summary_agent,
+            ]
+            if self.keyword_extractor is None:
+                agents.append(self.keyword_agent)
+            requests = [
+                agent.llm.estimate_prompt_tokens(chunk)
+                for chunk in chunks
+                for agent in agents
+            ]
+            # every reduce level merges groups of partial summaries,
+            # each partial is about two completions long
+            partials = len(chunks)
+            group_size = max(
+                1,
+                min(
+                    self.map_reduce.fan_in,
+                    self.map_reduce.chunk_tokens // (2 * expected_completion_tokens),
+                ),
+            )
+            while partials > 1:
+                groups = -(-partials // group_size)
+                merge_tokens = min(partials, group_size) * expected_completion_tokens
+                requests.extend([merge_tokens] * 2 * groups)
+                if groups == 1:
+                    requests.append(merge_tokens)
+                partials = groups
+        else:
+            dialog = self.get_dialog(transcription, strategy)
+            if self.use_combined_agent:
+                agents = [self.combined_agent]
+            else:
+                agents = [
+                    self.title_agent,
+                    self.short_summary_agent,
+                    self.structured_summary_agent,
+                ]
+                if self.keyword_extractor is None:
+                    agents.append(self.keyword_agent)
+            requests = [agent.llm.estimate_prompt_tokens(dialog) for agent in agents]
+        prompt_tokens = sum(requests)
+        completion_tokens = expected_completion_tokens * len(requests)
+        return {
+            "strategy": strategy,
+            "requests": len(requests),
+            # an empty transcript needs no map-reduce requests
+            "max_request_tokens": max(requests, default=0),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": estimate_cost(
+                self.title_agent.llm.model_name, prompt_tokens, completion_tokens
+            ),
+        }
+
+    @staticmethod
+    def fits_budget(estimate):
+        return (
+            estimate["max_request_tokens"] <= config.budget.max_request_tokens
+            and estimate["prompt_tokens"] <= config.budget.max_meeting_tokens
+            and estimate["cost"] <= config.budget.max_meeting_cost
+        )
+
+    def plan(self, transcription: Transcription, strategy="auto"):
+        """
+        Return the estimate of the first strategy that fits the per-meeting budget,
+        trying the full transcript, then the compressed one, then map-reduce.
+        """
+        assert strategy == "auto" or strategy in self.STRATEGIES, (
+            f"Unknown strategy {strategy}"
+        )
+        if strategy != "auto":
+            candidates = [strategy]
+        elif config.compaction.enabled:
+            candidates = ["compressed", "map_reduce"]
+        else:
+            candidates = self.STRATEGIES
+        estimates = []
+        for candidate in candidates:
+            estimate = self.estimate(transcription, candidate)
+            if self.fits_budget(estimate):
+                return estimate
+            estimates.append(estimate)
+        raise BudgetExceededError(
+            "No summarization strategy fits the budget: "
+            + "; ".join(
+                f"{e['strategy']}: {e['prompt_tokens']} prompt tokens, "
+                f"{e['max_request_tokens']} in the largest request, ${e['cost']:.4f}"
+                for e in estimates
+            )
+        )
+
     def summarize(
         self,
         transcription: Union[Transcription, List[Dict[str, Any]], str],
         verbose=False,
+        concurrent=True,
+        max_workers=config.llm.max_concurrency,
+        meeting_id=None,
+        strategy=config.llm.strategy,
+        priority=config.rate_limit.default_priority,
     ):
+        """
+        priority="backfill" lets requests of interactive reports go first.
+        strategy="full" sends the whole dialog to every agent,
+        strategy="compressed" sends the compacted dialog,
+        strategy="map_reduce" summarizes token-budgeted chunks and merges them.
+        strategy="auto" picks the first of them that fits config.budget,
+        the others are sent without estimating them.
+        """
+        assert strategy == "auto" or strategy in self.STRATEGIES, (
+            f"Unknown strategy {strategy}"
+        )
         transcription, _ = load_transcription_and_transcript(transcription)
-        dialog = transcription.to_str(include_timestamps=False)
-        title = self.title_agent.reply(dialog)
-        short_summary = self.short_summary_agent.reply(dialog)
-        if verbose:
-            print(f"Short summary: {short_summary}")
-        structured_summary = self.structured_summary_agent.reply(dialog)
-        if verbose:
-            print(f"Structured summary: {structured_summary}")
-        keywords = self.keyword_agent.reply(dialog)
+        self.last_estimate = None
+        if strategy == "auto":
+            self.last_estimate = self.plan(transcription, strategy)
+            strategy = self.last_estimate["strategy"]
+            if verbose:
+                print(
+                    f"Strategy: {strategy}, "
+                    f"estimated prompt tokens: {self.last_estimate['prompt_tokens']}, "
+                    f"estimated cost: ${self.last_estimate['cost']:.4f}"
+                )
+        self.compaction_stats = None
+        with track_meeting(meeting_id), request_priority(priority):
+            if strategy == "map_reduce":
+                results = self.map_reduce.run(transcription, verbose=verbose)
+                self.timings = self.map_reduce.timings
+            else:
+                dialog = self.get_dialog(transcription, strategy)
+                run = (
+                    self.run_combined_agent
+                    if self.use_combined_agent
+                    else self.run_agents
+                )
+                results = run(dialog, concurrent=concurrent, max_workers=max_workers)
+            if self.keyword_extractor is not None:
+                start = time.perf_counter()
+                results["keywords"] = self.keyword_extractor.extract(
+                    transcription, document_id=meeting_id
+                )
+                self.timings["keywords"] = time.perf_counter() - start
+        if verbose and self.compaction_stats:
+            stats = self.compaction_stats
+            print(
+                f"Compaction removed {stats['removed_tokens']} of "
+                f"{stats['original_tokens']} tokens"
+            )
         if verbose:
-            print(f"Keywords: {keywords}")
+            print(f"Short summary: {results['short_summary']}")
+            print(f"Structured summary: {results['structured_summary']}")
+            print(f"Keywords: {results['keywords']}")
+            timings = ", ".join(f"{name} {t:.2f}s" for name, t in self.timings.items())
+            print(f"Timings: {timings}")
         summary = Summary(
-            title=title,
-            short_summary=short_summary,
-            structured_summary=structured_summary,
-            keywords=keywords,
+            title=results["title"],
+            short_summary=results["short_summary"],
+            structured_summary=results["structured_summary"],
+            keywords=results["keywords"],
             transcription=transcription,
         )
         return summary
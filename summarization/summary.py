@@ -5,12 +5,14 @@ from typing import Any, Dict, List, Optional, Union
 
 sys.path.append("automatic_zoom_reports")
 
+from asr.analytics import meeting_analytics
 from asr.transcription import Transcription, load_transcription_and_transcript
 from summarization.output_validation import (
     validate,
     validate_keywords,
     validate_structured_summary,
 )
+from summarization.renderer import SummaryRenderer
 
 
 class Summary:
@@ -22,6 +24,8 @@ class Summary:
         keywords,
         transcription: Union[Transcription, List[Dict[str, Any]], str],
     ):
+        self._renderer = SummaryRenderer(self)
+        self._analytics = None
         self.title = title
         self.short_summary = short_summary
         validate(structured_summary, validate_structured_summary)
@@ -33,6 +37,27 @@ class Summary:
         )
         self._creation_date = Summary.init_creation_date()
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # rendered outputs are memoized until a field is reassigned
+        if not name.startswith("_"):
+            self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """Call after changing a field in place, e.g. appending a keyword."""
+        self._analytics = None
+        self._renderer.invalidate()
+
+    def get_analytics(self):
+        """Talk time, turns, interruptions and so on, see asr.analytics."""
+        if self._analytics is None:
+            self._analytics = meeting_analytics(self.transcription)
+        return self._analytics
+
+    def rename_speakers(self, name_mapping):
+        self.transcription.rename_speakers(name_mapping)
+        self.transcript = self.transcription.to_dict()
+
     @staticmethod
     def init_creation_date():
         return datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
@@ -57,98 +82,62 @@ class Summary:
     def to_dict(
         self, include_full_transcript: bool = True, transcript_format: str = "dict"
     ):
-        if transcript_format == "html":
-            speakers = self.transcription.get_speaker_ledgend()
-            structured_summary = self.structured_summary_to_html()
-            keywords = ", ".join(self.keywords)
-        elif transcript_format == "str":
-            speakers = ", ".join(self.transcription.speakers)
-            structured_summary = self.structured_summary_to_str()
-            keywords = ", ".join(self.keywords)
-        else:
-            speakers = self.transcription.speakers
-            structured_summary = self.structured_summary
-            keywords = self.keywords
-        data = {
-            "title": self.title,
-            "creation_date": self._creation_date,
-            "keywords": keywords,
-            "speakers": speakers,
-            "short_summary": self.short_summary,
-            "structured_summary": structured_summary,
-        }
+        data = dict(self._renderer.get_fields(transcript_format))
         if include_full_transcript:
             if transcript_format == "dict":
                 data["transcript"] = self.transcript
             elif transcript_format == "html":
-                data["transcript"] = self.transcription.to_html()
+                data["transcript"] = self._renderer.get_transcript("html")
             elif transcript_format == "str":
-                data["transcript"] = self.transcription.to_str()
+                data["transcript"] = self._renderer.get_transcript("txt")
         return data
 
     def to_str(self, include_full_transcript: bool = False):
-        summary_template = """{title}
-Дата: {creation_date}
-Участники: {speakers}
-Ключевые слова: {keywords}
-Супер краткое содержание\n{short_summary}\n
-Саммари по темам\n{structured_summary}
-"""
-        if include_full_transcript:
-            summary_template += "\n\nРасшифровка\n{transcript}"
-        format_args = self.to_dict(
-            include_full_transcript=include_full_transcript, transcript_format="str"
-        )
-        summary = summary_template.format(**format_args)
-        return summary
+        return self._renderer.render("txt", include_full_transcript)
 
     def to_html(self, include_full_transcript: bool = False):
-        summary_template = """
-        <html>
-        <meta charset="utf-8">
-        <body>
-        <h1>{title}</h1>
-        <b>Дата:</b> {creation_date}<br>
-        <b>Участники:</b> {speakers}<br>
-        <b>Ключевые слова:</b> {keywords}<br>
-        <b>Супер краткое содержание:</b><br>{short_summary}<br><br>
-        <b>Саммари по темам:</b><br>{structured_summary}
-        """
-        if include_full_transcript:
-            summary_template += "<br><br><b>Расшифровка</b><br>{transcript}"
-        summary_template += "</body></html>"
-        format_args = self.to_dict(
-            include_full_transcript=include_full_transcript, transcript_format="html"
-        )
-        summary = summary_template.format(**format_args)
-        return summary
+        return self._renderer.render("html", include_full_transcript)
+
+    def to_markdown(self, include_full_transcript: bool = False):
+        return self._renderer.render("md", include_full_transcript)
 
     def __repr__(self):
         return self.to_str(include_full_transcript=False)
 
-    def save_json(self, output_path: str = "summary.txt"):
-        assert output_path.endswith(".json"), "Output path must end with .json"
-        with open(output_path, "w") as f:
-            json.dump(self.to_dict(), f, indent=4)
-        print(f"Summary saved to {output_path}")
+    def save(self, paths: Dict[str, str]):
+        """
+        Save several formats at once, e.g. {"html": "summary.html", "md": "summary.md"},
+        rendering the transcript once for all of them.
+        """
+        self._renderer.save(paths)
+        for path in paths.values():
+            print(f"Summary saved to {path}")
+
+    def save_json(self, output_path: str = "summary.json"):
+        self.save({"json": output_path})
 
     def save_txt(self, output_path: str = "summary.txt"):
-        assert output_path.endswith(".txt"), "Output path must end with .txt"
-        with open(output_path, "w") as f:
-            f.write(self.to_str(include_full_transcript=True))
-        print(f"Summary saved to {output_path}")
+        self.save({"txt": output_path})
 
-    def save_html(self, output_path: str = "summary.txt"):
-        assert output_path.endswith(".html"), "Output path must end with .html"
-        with open(output_path, "w") as f:
-            f.write(self.to_html(include_full_transcript=True))
-        print(f"Summary saved to {output_path}")
+    def save_html(self, output_path: str = "summary.html"):
+        self.save({"html": output_path})
+
+    def save_md(self, output_path: str = "summary.md"):
+        self.save({"md": output_path})
 
     @classmethod
     def from_dict(self, data):
-        if "creation_date" not in data:
-            data["creation_date"] = Summary.init_creation_date()
-        return Summary(**data)
+        data = dict(data)
+        creation_date = data.pop("creation_date", None)
+        # derived from the transcript
+        data.pop("speakers", None)
+        data.pop("analytics", None)
+        if "transcript" in data:
+            data["transcription"] = data.pop("transcript")
+        summary = Summary(**data)
+        if creation_date is not None:
+            summary._creation_date = creation_date
+        return summary
 
     @classmethod
     def from_json(self, path):
@@ -216,6 +205,9 @@ if __name__ == "__main__":
     )
 
     print(summary)
-    summary.save_html("summarization/results/summary.html")
-    summary.save_txt("summarization/results/summary.txt")
-    summary.save_json("summarization/results/summary.json")
+    summary.save(
+        {
+            fmt: f"summarization/results/summary.{fmt}"
+            for fmt in ("html", "txt", "json", "md")
+        }
+    )
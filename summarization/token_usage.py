@@ -0,0 +1,232 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+from config import config
+
+# Counters stored for every LLM call. New counters are appended here and added
+# to existing databases as columns on open
+USAGE_FIELDS = [
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "cache_hits",
+    "saved_prompt_tokens",
+    "saved_completion_tokens",
+    "cached_prompt_tokens",
+    # streamed requests: summed time to first token and generation time in ms,
+    # averages and tokens per second are derived in reports
+    "streams",
+    "first_token_ms",
+    "stream_ms",
+    "streamed_completion_tokens",
+    # summed request time, gives the average latency and throughput per backend
+    "latency_ms",
+]
+GROUP_BY_COLUMNS = {
+    "model": "model",
+    "agent": "agent",
+    "meeting": "meeting_id",
+    "backend": "backend",
+}
+
+current_meeting_id = contextvars.ContextVar("current_meeting_id", default=None)
+
+
+@contextlib.contextmanager
+def track_meeting(meeting_id):
+    """Attribute every LLM call made inside the block to meeting_id."""
+    token = current_meeting_id.set(meeting_id)
+    try:
+        yield
+    finally:
+        current_meeting_id.reset(token)
+
+
+class TokenUsageTracker:
+    """
+    In-process accumulator shared by all agents that report to the same path.
+    record() only puts the event on a queue. A background thread appends the
+    queued events to an SQLite log in one transaction, so concurrent
+    workers never overwrite each other's totals. When report_path ends with
+    .json, per-model totals are also written to it atomically after each flush.
+    """
+
+    def __init__(
+        self,
+        report_path,
+        flush_interval=config.llm.token_usage_flush_interval,
+    ):
+        self.report_path = report_path
+        if report_path.endswith(".json"):
+            self.db_path = os.path.splitext(report_path)[0] + ".sqlite"
+            self.json_path = report_path
+        else:
+            self.db_path = report_path
+            self.json_path = None
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._init_db()
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        is_new = not os.path.isfile(self.db_path)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS token_usage ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+                "model TEXT NOT NULL, agent TEXT, meeting_id TEXT, backend TEXT)"
+            )
+            columns = {
+                row[1] for row in connection.execute("PRAGMA table_info(token_usage)")
+            }
+            if "backend" not in columns:
+                # databases created before backends were introduced
+                connection.execute("ALTER TABLE token_usage ADD COLUMN backend TEXT")
+            for field in USAGE_FIELDS:
+                if field not in columns:
+                    connection.execute(
+                        f"ALTER TABLE token_usage ADD COLUMN {field} "
+                        "INTEGER NOT NULL DEFAULT 0"
+                    )
+            if is_new:
+                self._import_json_report(connection)
+
+    def _import_json_report(self, connection):
+        # Keep the totals accumulated by the old per-agent JSON report
+        if not self.json_path or not os.path.isfile(self.json_path):
+            return
+        try:
+            with open(self.json_path, "r") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return
+        for model, totals in report.items():
+            connection.execute(
+                "INSERT INTO token_usage "
+                "(created_at, model, prompt_tokens, completion_tokens) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    time.time(),
+                    model,
+                    totals.get("total_prompt_tokens", 0),
+                    totals.get("total_completion_tokens", 0),
+                ),
+            )
+
+    def record(self, model, agent=None, meeting_id=None, backend=None, **counts):
+        unknown = set(counts) - set(USAGE_FIELDS)
+        assert not unknown, f"Unknown usage fields: {unknown}"
+        if meeting_id is None:
+            meeting_id = current_meeting_id.get()
+        self._queue.put((time.time(), model, agent, meeting_id, backend, counts))
+
+    def flush(self):
+        with self._flush_lock:
+            events = []
+            while True:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not events:
+                return 0
+            columns = ["created_at", "model", "agent", "meeting_id", "backend"]
+            columns += USAGE_FIELDS
+            rows = [
+                (created_at, model, agent, meeting_id, backend)
+                + tuple(counts.get(field, 0) for field in USAGE_FIELDS)
+                for created_at, model, agent, meeting_id, backend, counts in events
+            ]
+            with contextlib.closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    f"INSERT INTO token_usage ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    rows,
+                )
+            if self.json_path:
+                self._write_json_report()
+            return len(events)
+
+    def _write_json_report(self):
+        report = {
+            model: {
+                "total_prompt_tokens": totals["prompt_tokens"],
+                "total_completion_tokens": totals["completion_tokens"],
+            }
+            for model, totals in self._query("model").items()
+        }
+        json_dir = os.path.dirname(self.json_path) or "."
+        with tempfile.NamedTemporaryFile(
+            "w", dir=json_dir, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(report, f, indent=4)
+        os.replace(f.name, self.json_path)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Failed to flush token usage: {e}")
+
+    def _query(self, group_by, **filters):
+        column = GROUP_BY_COLUMNS[group_by]
+        sums = ", ".join(f"SUM({field})" for field in USAGE_FIELDS)
+        where = " AND ".join(f"{GROUP_BY_COLUMNS[k]} = ?" for k in filters)
+        sql = f"SELECT {column}, {sums} FROM token_usage"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" GROUP BY {column}"
+        with contextlib.closing(self._connect()) as connection:
+            rows = connection.execute(sql, tuple(filters.values())).fetchall()
+        return {key: dict(zip(USAGE_FIELDS, values)) for key, *values in rows}
+
+    def report(self, group_by="model", **filters):
+        """
+        Return summed usage grouped by "model", "agent", "meeting" or "backend",
+        optionally filtered, e.g. report("agent", meeting="2024-05-01").
+        """
+        assert (
+            group_by in GROUP_BY_COLUMNS
+        ), f"group_by should be one of {list(GROUP_BY_COLUMNS)}"
+        self.flush()
+        return self._query(group_by, **filters)
+
+    def close(self):
+        if not self._closed.is_set():
+            self._closed.set()
+            self.flush()
+            atexit.unregister(self.close)
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_token_usage_tracker(report_path):
+    """Return the tracker shared by all LLMs in the process that report to report_path."""
+    key = os.path.abspath(report_path)
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = TokenUsageTracker(report_path)
+        return _trackers[key]
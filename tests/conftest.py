@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from summarization import llm
+from summarization.backends import InProcessBackend
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep the response cache and reports of every test in its own directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(llm, "_response_cache", None)
+
+
+@pytest.fixture
+def token_usage_path(tmp_path):
+    # absolute, since the usage trackers flush at exit from another directory
+    return str(tmp_path / "token_usage.json")
+
+
+class FakeModel:
+    """
+    A generate() function for InProcessBackend that answers every agent in
+    the format it expects and remembers the requests.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, messages, stream=False, **params):
+        self.requests.append(messages)
+        system_prompt = messages[0]["content"]
+        if "json" in system_prompt:
+            reply = json.dumps(
+                [{"topic": "Релиз", "points": ["Сроки", "Ответственные"]}],
+                ensure_ascii=False,
+            )
+        elif "ключевых слов" in system_prompt:
+            reply = "релиз, сервер, бюджет"
+        else:
+            reply = "Обсуждение релиза"
+        return iter([reply]) if stream else reply
+
+
+@pytest.fixture
+def fake_model():
+    return FakeModel()
+
+
+@pytest.fixture
+def fake_backend(fake_model):
+    return InProcessBackend("fake", fake_model, lambda text: len(text.split()))
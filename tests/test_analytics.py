@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from asr.analytics import compute_analytics, speaker_blocks
+
+
+def brute_force_blocks(starts, ends, speakers):
+    blocks = []
+    for speaker in sorted(set(speakers)):
+        intervals = sorted(
+            (start, end)
+            for start, end, s in zip(starts, ends, speakers)
+            if s == speaker
+        )
+        merged = [list(intervals[0])]
+        for start, end in intervals[1:]:
+            if start > merged[-1][1]:
+                merged.append([start, end])
+            else:
+                merged[-1][1] = max(merged[-1][1], end)
+        blocks.extend((start, end, speaker) for start, end in merged)
+    return blocks
+
+
+def as_blocks(starts, ends, speakers):
+    return list(zip(starts.tolist(), ends.tolist(), speakers.tolist()))
+
+
+@pytest.mark.parametrize(
+    "starts, ends, speakers",
+    [
+        # the block starting at the earliest time belongs to the last speaker
+        ([29.87, 67.199, 19.952], [33.53, 68.259, 26.242], [3, 3, 3]),
+        ([0.0, 1.0, 0.5, 3.0], [2.0, 1.5, 4.0, 3.5], [2, 2, 1, 0]),
+        # touching intervals of one speaker merge
+        ([0.0, 1.0, 5.0], [1.0, 2.0, 6.0], [1, 1, 1]),
+    ],
+)
+def test_speaker_blocks(starts, ends, speakers):
+    blocks = speaker_blocks(
+        np.array(starts), np.array(ends), np.array(speakers, dtype=np.int64)
+    )
+    assert as_blocks(*blocks) == brute_force_blocks(starts, ends, speakers)
+
+
+def test_speaker_blocks_random():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        n = int(rng.integers(1, 20))
+        starts = np.round(rng.uniform(0, 100, n), int(rng.integers(0, 4)))
+        ends = starts + np.round(rng.uniform(0.01, 10, n), 2)
+        speakers = rng.integers(0, 4, n)
+        blocks = speaker_blocks(starts, ends, speakers)
+        expected = brute_force_blocks(starts.tolist(), ends.tolist(), speakers.tolist())
+        assert as_blocks(*blocks) == expected
+
+
+def test_talk_time_and_overlap():
+    analytics = compute_analytics(
+        [0.0, 4.0],
+        [5.0, 10.0],
+        [0, 1],
+        [10, 12],
+        [0.0, 2.0, 4.0],
+        [3.0, 5.0, 10.0],
+        [0, 0, 1],
+        ["Анна", "Иван"],
+    )
+    assert analytics["speakers"]["Анна"]["talk_time"] == 5.0
+    assert analytics["speakers"]["Иван"]["talk_time"] == 6.0
+    assert analytics["overlap_ratio"] == pytest.approx(1 / 10)
+    assert analytics["interruptions"] == 1
@@ -0,0 +1,116 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from summarization.agents import StructuredSummaryAgent
+from summarization.backends import OpenAIBackend
+from summarization.llm import LLM, create_backend
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions like an OpenAI-compatible server."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        reply = json.dumps(
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "Ответ сервера"},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 12,
+                    "completion_tokens": 3,
+                    "total_tokens": 15,
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_llm(token_usage_path, **kwargs):
+    return LLM(
+        token_usage_path,
+        "Тебе дана расшифровка встречи.",
+        cache=False,
+        scheduler=False,
+        **kwargs,
+    )
+
+
+def test_openai_compatible_backend_talks_to_a_local_server(
+    stub_server, token_usage_path
+):
+    backend = create_backend(
+        "stub",
+        {
+            "type": "openai_compatible",
+            "base_url": f"http://127.0.0.1:{stub_server.server_port}/v1",
+            "api_key": "local",
+            "model": "stub-model",
+            "timeout": 5,
+        },
+    )
+    assert not backend.rate_limited
+    llm = make_llm(token_usage_path, backend=backend)
+    assert llm.model_name == "stub-model"
+    assert llm.get_response("Привет всем") == "Ответ сервера"
+    [(path, body)] = stub_server.requests
+    assert path == "/v1/chat/completions"
+    assert body["model"] == "stub-model"
+    assert "Привет всем" in body["messages"][-1]["content"]
+    usage = llm.token_usage.report("backend")["stub"]
+    assert (usage["requests"], usage["prompt_tokens"]) == (1, 12)
+
+
+def test_in_process_backend_records_usage_under_its_name(
+    fake_backend, fake_model, token_usage_path
+):
+    llm = make_llm(token_usage_path, backend=fake_backend)
+    assert llm.get_response("Привет всем") == "Обсуждение релиза"
+    assert len(fake_model.requests) == 1
+    usage = llm.token_usage.report("backend")["fake"]
+    assert usage["requests"] == 1
+    assert usage["prompt_tokens"] > 0
+
+
+def test_json_schema_is_dropped_for_backends_without_it(fake_backend, token_usage_path):
+    agent = StructuredSummaryAgent(token_usage_path, backend=fake_backend)
+    assert "response_format" not in agent.llm.sampling_params
+
+
+def test_client_and_backend_are_exclusive(fake_backend, token_usage_path):
+    client = object()
+    with pytest.raises(AssertionError):
+        make_llm(token_usage_path, client=client, backend=fake_backend)
+    llm = make_llm(token_usage_path, client=client)
+    assert isinstance(llm.backend, OpenAIBackend)
+    assert llm.client is client
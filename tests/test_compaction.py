@@ -0,0 +1,98 @@
+from asr.transcription import Transcription
+from summarization.compaction import (
+    collapse_repeated_ngrams,
+    collapse_repeated_sentences,
+    compact_transcript,
+    get_filler_pattern,
+    remove_fillers,
+)
+
+
+def make_transcription(turns):
+    texts, speakers = [], []
+    for i, (speaker, text) in enumerate(turns):
+        texts.append((i * 10.0, i * 10.0 + 9, text))
+        speakers.append((i * 10.0, i * 10.0 + 9, speaker))
+    return Transcription(texts, speakers)
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_fillers_are_removed_with_their_commas():
+    text, removed = remove_fillers(
+        "Мы, эээ, успеем к хмм релизу.", get_filler_pattern()
+    )
+    assert text == "Мы успеем к релизу."
+    assert removed == 2
+
+
+def test_phrases_that_may_be_fillers_are_kept():
+    pattern = get_filler_pattern()
+    for text in ["Это самое важное решение.", "Как бы нам успеть к релизу?"]:
+        assert remove_fillers(text, pattern) == (text, 0)
+
+
+def test_repeated_ngrams_are_collapsed():
+    text, collapsed = collapse_repeated_ngrams("я думаю что я думаю что мы успеем")
+    assert text == "я думаю что мы успеем"
+    assert collapsed == 1
+
+
+def test_single_words_and_numbers_are_not_collapsed():
+    assert collapse_repeated_ngrams("очень очень важно") == ("очень очень важно", 0)
+    assert collapse_repeated_ngrams("20 20 процентов") == ("20 20 процентов", 0)
+    assert collapse_repeated_ngrams("рост 20 процентов 20 процентов") == (
+        "рост 20 процентов 20 процентов",
+        0,
+    )
+
+
+def test_hallucination_loops_are_collapsed():
+    text, collapsed = collapse_repeated_sentences(
+        "Спасибо за внимание. Спасибо за внимание. Спасибо за внимание."
+    )
+    assert text == "Спасибо за внимание."
+    assert collapsed == 2
+
+
+def test_speakers_are_aliased_with_a_legend():
+    dialog, stats = compact_transcript(
+        make_transcription(
+            [
+                ("SPEAKER_00", "Успеем к релизу?"),
+                ("SPEAKER_01", "Да."),
+                ("SPEAKER_00", "Тогда начинаем."),
+            ]
+        ),
+        count_tokens=count_words,
+    )
+    assert dialog.split("\n") == [
+        "Участники: A - SPEAKER_00, B - SPEAKER_01",
+        "A: Успеем к релизу?",
+        "B: Да.",
+        "A: Тогда начинаем.",
+    ]
+    assert stats["dropped_turns"] == 0
+
+
+def test_backchannels_are_dropped_only_when_asked():
+    turns = [
+        ("SPEAKER_00", "Переносим релиз на пятницу."),
+        ("SPEAKER_01", "Угу."),
+        ("SPEAKER_00", "И обновляем сервер."),
+    ]
+    dialog, kept_stats = compact_transcript(
+        make_transcription(turns), count_tokens=count_words
+    )
+    assert "B: Угу." in dialog
+    dialog, stats = compact_transcript(
+        make_transcription(turns), drop_backchannels=True, count_tokens=count_words
+    )
+    # the turns left adjacent are merged
+    assert dialog.split("\n")[1:] == [
+        "A: Переносим релиз на пятницу. И обновляем сервер."
+    ]
+    assert stats["dropped_turns"] == 1
+    assert stats["removed_tokens"] > kept_stats["removed_tokens"]
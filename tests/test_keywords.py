@@ -0,0 +1,27 @@
+from summarization.keywords import LocalKeywordExtractor, looks_like_verb
+
+
+def test_verbs_are_not_keywords_without_pymorphy(tmp_path):
+    extractor = LocalKeywordExtractor(
+        idf_path=str(tmp_path / "idf.sqlite"), max_keywords=10, lemmatize=False
+    )
+    keywords = extractor.extract(
+        "Анна: Обсудим бюджет релиза, потом запустить сервер.\n"
+        "Иван: Бюджет согласовали? Сервер перезапускается, проверяем режим.\n"
+        "Анна: Бюджет в проекте, сервер обновится завтра."
+    )
+    assert {"бюджет", "сервер", "режим", "релиза"} <= set(keywords)
+    assert not {
+        "обсудим",
+        "запустить",
+        "перезапускается",
+        "проверяем",
+        "обновится",
+    } & set(keywords)
+
+
+def test_common_nouns_do_not_look_like_verbs():
+    for noun in ["бюджете", "канал", "правила", "режим", "память", "проблем"]:
+        assert not looks_like_verb(noun), noun
+    for verb in ["обсудим", "сделаем", "начнём", "обсудить", "говорят", "решается"]:
+        assert looks_like_verb(verb), verb
@@ -0,0 +1,57 @@
+from asr.transcription import Transcription
+from summarization.map_reduce import MapReduceSummarizer, split_dialog
+from summarization.summarizer import Summarizer
+
+
+def make_transcription(n_turns):
+    texts = [(i * 10.0, i * 10.0 + 9, f"реплика номер {i}") for i in range(n_turns)]
+    speakers = [(i * 10.0, i * 10.0 + 9, f"SPEAKER_0{i % 2}") for i in range(n_turns)]
+    return Transcription(texts, speakers)
+
+
+def make_summarizer(backend, token_usage_path):
+    return Summarizer(token_usage_path, backend=backend, keyword_method="llm")
+
+
+def test_split_dialog_keeps_turns_within_budget():
+    turns = [f"SPEAKER_00: {'слово ' * 5}".strip() for _ in range(10)]
+    chunks = split_dialog(turns, max_tokens=20, count_tokens=lambda t: len(t.split()))
+    assert "\n".join(chunks).split("\n") == turns
+    assert all(len(chunk.split()) <= 20 for chunk in chunks)
+
+
+def test_empty_transcript_sends_no_requests(fake_backend, fake_model, token_usage_path):
+    summarizer = make_summarizer(fake_backend, token_usage_path)
+    results = summarizer.map_reduce.run(make_transcription(0))
+    assert results == {
+        "title": "",
+        "short_summary": "",
+        "structured_summary": [],
+        "keywords": [],
+    }
+    assert fake_model.requests == []
+    assert summarizer.estimate(make_transcription(0), "map_reduce")["requests"] == 0
+
+
+def test_one_chunk_is_summarized_without_merging(
+    fake_backend, fake_model, token_usage_path
+):
+    summarizer = make_summarizer(fake_backend, token_usage_path)
+    results = summarizer.map_reduce.run(make_transcription(4))
+    # title, short summary, structured summary and keywords, no merge requests
+    assert len(fake_model.requests) == 4
+    assert results["title"] == "Обсуждение релиза"
+    assert results["keywords"] == ["релиз", "сервер", "бюджет"]
+
+
+def test_chunks_are_merged(fake_backend, fake_model, token_usage_path):
+    summarizer = make_summarizer(fake_backend, token_usage_path)
+    map_reduce = MapReduceSummarizer(
+        summarizer, chunk_tokens=10, fan_in=2, count_tokens=lambda t: len(t.split())
+    )
+    results = map_reduce.run(make_transcription(6))
+    assert results["title"] == "Обсуждение релиза"
+    assert results["structured_summary"] == [
+        {"topic": "Релиз", "points": ["Сроки", "Ответственные"]}
+    ]
+    assert any(name.startswith("reduce_") for name in map_reduce.timings)
@@ -0,0 +1,48 @@
+from summarization.llm import LLM, ResponseCache
+from summarization.rate_limit import RateLimitScheduler
+
+
+def make_llm(backend, token_usage_path, tmp_path, scheduler=False):
+    return LLM(
+        token_usage_path,
+        "Тебе дана расшифровка встречи.",
+        backend=backend,
+        cache=ResponseCache(str(tmp_path / "cache.sqlite")),
+        scheduler=scheduler,
+    )
+
+
+def test_stream_corrects_the_rate_limit_estimate(
+    fake_backend, token_usage_path, tmp_path, monkeypatch
+):
+    scheduler = RateLimitScheduler(requests_per_minute=1000, tokens_per_minute=10**6)
+    corrections = []
+    monkeypatch.setattr(
+        scheduler, "correct", lambda *tokens: corrections.append(tokens)
+    )
+    llm = make_llm(fake_backend, token_usage_path, tmp_path, scheduler=scheduler)
+    assert "".join(llm.stream_response("Привет всем")) == "Обсуждение релиза"
+    usage = llm.token_usage.report()[llm.model_name]
+    assert corrections == [
+        (
+            llm.estimate_request_tokens("Привет всем"),
+            usage["prompt_tokens"] + usage["completion_tokens"],
+        )
+    ]
+    assert scheduler.in_flight == 0
+
+
+def test_stream_read_in_part_is_recorded_but_not_cached(
+    fake_backend, token_usage_path, tmp_path
+):
+    llm = make_llm(fake_backend, token_usage_path, tmp_path)
+    stream = llm.stream_response("Привет всем")
+    assert next(stream) == "Обсуждение релиза"
+    stream.close()
+    usage = llm.token_usage.report()[llm.model_name]
+    assert usage["streams"] == 1
+    assert usage["completion_tokens"] > 0
+    assert llm.cache.get(llm.get_cache_key("Привет всем")) is None
+
+    assert "".join(llm.stream_response("Привет всем")) == "Обсуждение релиза"
+    assert llm.cache.get(llm.get_cache_key("Привет всем"))[0] == "Обсуждение релиза"
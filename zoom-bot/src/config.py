@@ -40,6 +40,16 @@ if not DISPLAY_NAME or len(DISPLAY_NAME) < 3:
 TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
 CSV_DELIMITER = ';'
 
+# Scheduler configuration
+# How often meetings.csv is checked for changes, in seconds
+CSV_POLL_INTERVAL = int(os.getenv('CSV_POLL_INTERVAL', '10'))
+# How long before the start the bot joins a meeting, in seconds
+JOIN_ADVANCE = int(os.getenv('JOIN_ADVANCE', '60'))
+# Threads for meeting lifecycles, a hung meeting holds one of them
+MEETING_WORKERS = int(os.getenv('MEETING_WORKERS', '4'))
+# How long a meeting waits for the previous one to finish joining, in seconds
+JOIN_LOCK_TIMEOUT = int(os.getenv('JOIN_LOCK_TIMEOUT', '300'))
+
 # FFmpeg configuration
 FFMPEG_CMD_TEMPLATE = (
     "ffmpeg -nostats -loglevel {loglevel} -f pulse -ac 2 -i 1 "
@@ -0,0 +1,111 @@
+import logging
+import threading
+from typing import Optional
+from datetime import datetime, timedelta
+
+from src.config import JOIN_LOCK_TIMEOUT
+from src.meeting import MeetingInfo, MeetingManager
+from src.utils.telegram import notifier
+
+class MeetingLifecycle:
+    """
+    Жизненный цикл одной встречи: подключение, запись, остановка по
+    истечении длительности или по завершению встречи организатором
+    и завершение. Выполняется в потоке исполнителя планировщика
+    """
+    
+    # Встреча, которой сейчас принадлежит клиент Zoom
+    _zoom_owner: Optional['MeetingLifecycle'] = None
+    _zoom_lock = threading.Lock()
+    # Подключение управляет интерфейсом Zoom, поэтому новая встреча ждет,
+    # пока остановленная выйдет из подключения, но не дольше JOIN_LOCK_TIMEOUT
+    _join_lock = threading.Lock()
+    
+    def __init__(self, meeting: MeetingInfo):
+        self.meeting = meeting
+        self.deadline = datetime.now() + timedelta(seconds=meeting.duration)
+        self.manager = MeetingManager()
+        self.state = 'pending'
+        self.stop_reason: Optional[str] = None
+    
+    @property
+    def done(self) -> bool:
+        return self.state in ('done', 'failed')
+    
+    def stop(self, reason: str) -> None:
+        """
+        Просит встречу завершиться. Если встреча еще подключается,
+        подключение прервется на следующем шаге до запуска записи,
+        а завершение выполнится, когда оно вернет управление
+        
+        Args:
+            reason: Причина остановки для логов и уведомлений
+        """
+        if self.done or self.stop_reason is not None:
+            return
+        self.stop_reason = reason
+        self.manager.ended.set()
+    
+    def run(self) -> None:
+        """Выполняет жизненный цикл встречи"""
+        if self.stop_reason is not None:
+            # Встречу остановили, пока она ждала свободного потока
+            self.state = 'done'
+            logging.info(
+                f"Meeting {self.meeting.description} skipped: {self.stop_reason}"
+            )
+            return
+        
+        with self._zoom_lock:
+            MeetingLifecycle._zoom_owner = self
+        
+        try:
+            self.state = 'joining'
+            if not self._join_lock.acquire(timeout=JOIN_LOCK_TIMEOUT):
+                # Предыдущая встреча зависла при подключении
+                raise TimeoutError(
+                    f"previous meeting is still joining after {JOIN_LOCK_TIMEOUT}s"
+                )
+            try:
+                joined = self.manager.join_meeting(
+                    self.meeting, stop_event=self.manager.ended
+                )
+            finally:
+                self._join_lock.release()
+            if not joined:
+                if self.stop_reason is None:
+                    self.state = 'failed'
+                return
+            
+            self.state = 'recording'
+            remaining = (self.deadline - datetime.now()).total_seconds()
+            if self.manager.ended.wait(timeout=max(remaining, 0)):
+                reason = "meeting ended by host"
+            else:
+                reason = "duration elapsed"
+            if self.stop_reason is None:
+                self.stop_reason = reason
+        
+        except Exception as e:
+            logging.error(f"Meeting {self.meeting.description} failed: {str(e)}")
+            self.state = 'failed'
+        
+        finally:
+            self.finalize()
+    
+    def finalize(self) -> None:
+        """Останавливает запись и закрывает Zoom, если его еще не заняла другая встреча"""
+        with self._zoom_lock:
+            owns_zoom = MeetingLifecycle._zoom_owner is self
+            if owns_zoom:
+                MeetingLifecycle._zoom_owner = None
+        
+        self.manager.end_meeting(exit_zoom=owns_zoom)
+        if self.state != 'failed':
+            self.state = 'done'
+            logging.info(
+                f"Meeting {self.meeting.description} finished: {self.stop_reason}"
+            )
+            notifier.send_message(
+                f"Meeting '{self.meeting.description}' finished: {self.stop_reason}."
+            )
@@ -29,17 +29,27 @@ class MeetingManager:
         self.recorder = Recorder()
         self.ongoing_meeting = False
         self.video_panel_hidden = False
+        # Устанавливается, когда встреча завершена организатором или ботом
+        self.ended = threading.Event()
         
-    def join_meeting(self, meeting: MeetingInfo) -> bool:
+    def join_meeting(
+        self,
+        meeting: MeetingInfo,
+        stop_event: Optional[threading.Event] = None
+    ) -> bool:
         """
-        Присоединяется к встрече Zoom
+        Присоединяется к встрече Zoom. Между шагами подключения проверяется
+        stop_event, и если он установлен, запись не запускается
         
         Args:
             meeting: Информация о встрече
+            stop_event: Событие остановки встречи
             
         Returns:
             True если успешно присоединились, False в противном случае
         """
+        if self._join_stopped(meeting, stop_event):
+            return False
         logging.info(f"Joining meeting: {meeting.description}")
         
         # Подготавливаем окружение
@@ -57,6 +67,8 @@ class MeetingManager:
             
         # Ждем загрузки Zoom
         time.sleep(5)
+        if self._join_stopped(meeting, stop_event):
+            return False
         
         # Присоединяемся к встрече
         if is_url:
@@ -67,13 +79,19 @@ class MeetingManager:
         if not joined:
             notifier.send_message(f"Failed to join meeting {meeting.description}!")
             return False
+        if self._join_stopped(meeting, stop_event):
+            return False
             
         # Настраиваем аудио
         if not self._setup_audio():
             return False
+        if self._join_stopped(meeting, stop_event):
+            return False
             
         # Настраиваем отображение
         self._setup_display()
+        if self._join_stopped(meeting, stop_event):
+            return False
         
         # Запускаем запись
         self._start_recording(meeting)
@@ -87,6 +105,17 @@ class MeetingManager:
         
         return True
         
+    def _join_stopped(
+        self,
+        meeting: MeetingInfo,
+        stop_event: Optional[threading.Event]
+    ) -> bool:
+        """Проверяет, не остановили ли встречу во время подключения"""
+        if stop_event is not None and stop_event.is_set():
+            logging.info(f"Stopped joining meeting: {meeting.description}")
+            return True
+        return False
+        
     def _start_zoom(self, meeting_id: str, is_url: bool, env: Dict[str, str]) -> bool:
         """Запускает клиент Zoom"""
         command = f'zoom --url="{meeting_id}"' if is_url else "zoom"
@@ -210,6 +239,7 @@ class MeetingManager:
                     description="Meeting ended notification"
                 ):
                     self.ongoing_meeting = False
+                    self.ended.set()
                     logging.info("Meeting ended by host")
                     
                 time.sleep(10)
@@ -219,8 +249,15 @@ class MeetingManager:
         thread.daemon = True
         thread.start()
         
-    def end_meeting(self) -> None:
-        """Завершает встречу"""
+    def end_meeting(self, exit_zoom: bool = True) -> None:
+        """
+        Завершает встречу
+        
+        Args:
+            exit_zoom: Закрыть ли клиент Zoom
+        """
         self.ongoing_meeting = False
+        self.ended.set()
         self.recorder.stop_recording()
-        exit_process_by_name("zoom") 
\ No newline at end of file
+        if exit_zoom:
+            exit_process_by_name("zoom") 
\ No newline at end of file
@@ -1,13 +1,28 @@
 import csv
+import heapq
+import itertools
 import logging
-import schedule
-import time
-from typing import List, Optional
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 
-from src.config import CSV_PATH, CSV_DELIMITER
-from src.meeting import MeetingInfo, MeetingManager
+from src.config import (
+    CSV_PATH,
+    CSV_DELIMITER,
+    CSV_POLL_INTERVAL,
+    JOIN_ADVANCE,
+    MEETING_WORKERS
+)
+from src.lifecycle import MeetingLifecycle
+from src.meeting import MeetingInfo
+
+WEEKDAYS = [
+    'monday', 'tuesday', 'wednesday', 'thursday',
+    'friday', 'saturday', 'sunday'
+]
 
 @dataclass
 class ScheduledMeeting:
@@ -19,13 +34,102 @@ class ScheduledMeeting:
     duration: int  # в минутах
     description: str
     record: bool
+    
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        """
+        Ключ встречи в расписании. Встреча с тем же ключом, но другими
+        остальными полями считается измененной, а не новой
+        """
+        return (self.weekday.lower(), self.time, self.id)
+    
+    def next_start(self, after: datetime) -> datetime:
+        """
+        Вычисляет ближайшее начало встречи, к которому еще не пора подключаться
+        
+        Args:
+            after: Момент, после которого ищется подключение
+        
+        Returns:
+            Время начала встречи
+        """
+        weekday = WEEKDAYS.index(self.weekday.lower())
+        start_time = datetime.strptime(self.time, '%H:%M').time()
+        start = datetime.combine(after.date(), start_time) + timedelta(
+            days=(weekday - after.weekday()) % 7
+        )
+        while start - timedelta(seconds=JOIN_ADVANCE) <= after:
+            start += timedelta(weeks=1)
+        return start
+    
+    def current_start(self, now: datetime) -> Optional[datetime]:
+        """
+        Вычисляет начало встречи, которая уже идет или к которой уже
+        пора подключаться
+        
+        Args:
+            now: Текущее время
+        
+        Returns:
+            Время начала встречи или None, если такой встречи нет
+        """
+        start = self.next_start(
+            now - timedelta(minutes=self.duration, seconds=JOIN_ADVANCE)
+        )
+        if start - timedelta(seconds=JOIN_ADVANCE) <= now:
+            return start
+        return None
 
 class MeetingScheduler:
-    """Класс для планирования встреч"""
+    """
+    Класс для планирования встреч. Подключения хранятся в куче по времени,
+    планировщик спит до ближайшего из них или до проверки meetings.csv.
+    Сами встречи идут в потоках исполнителя, поэтому зависшая встреча
+    не задерживает расписание
+    """
     
     def __init__(self):
-        self.meeting_manager = MeetingManager()
+        self.executor = ThreadPoolExecutor(
+            max_workers=MEETING_WORKERS,
+            thread_name_prefix='meeting'
+        )
+        self.lifecycles: List[Tuple[MeetingLifecycle, Future]] = []
+        self.meetings: Dict[Tuple[str, str, str], ScheduledMeeting] = {}
+        # (время подключения, номер задачи, ключ встречи, время начала)
+        self._timeline: List[Tuple[datetime, int, Tuple[str, str, str], datetime]] = []
+        # актуальный номер задачи каждой встречи, остальные записи кучи устарели
+        self._jobs: Dict[Tuple[str, str, str], int] = {}
+        self._job_ids = itertools.count()
+        self._csv_stat: Optional[Tuple[int, int]] = None
+        self._wakeup = threading.Event()
+        self._stopped = False
+    
+    def read_meetings(self) -> List[ScheduledMeeting]:
+        """
+        Читает встречи из CSV файла, ошибки не перехватываются
         
+        Returns:
+            Список запланированных встреч
+        """
+        meetings = []
+        with open(CSV_PATH, mode='r') as csv_file:
+            reader = csv.DictReader(csv_file, delimiter=CSV_DELIMITER)
+            for row in reader:
+                meeting = ScheduledMeeting(
+                    weekday=row['weekday'],
+                    time=row['time'],
+                    id=row['id'],
+                    password=row['password'],
+                    duration=int(row['duration']),
+                    description=row['description'],
+                    record=row['record'].lower() == 'true'
+                )
+                if meeting.weekday.lower() not in WEEKDAYS:
+                    raise ValueError(f"Unknown weekday {meeting.weekday}")
+                datetime.strptime(meeting.time, '%H:%M')
+                meetings.append(meeting)
+        return meetings
+    
     def load_meetings(self) -> List[ScheduledMeeting]:
         """
         Загружает встречи из CSV файла
@@ -33,115 +137,267 @@ class MeetingScheduler:
         Returns:
             Список запланированных встреч
         """
-        meetings = []
         try:
-            with open(CSV_PATH, mode='r') as csv_file:
-                reader = csv.DictReader(csv_file, delimiter=CSV_DELIMITER)
-                for row in reader:
-                    meeting = ScheduledMeeting(
-                        weekday=row['weekday'],
-                        time=row['time'],
-                        id=row['id'],
-                        password=row['password'],
-                        duration=int(row['duration']),
-                        description=row['description'],
-                        record=row['record'].lower() == 'true'
-                    )
-                    meetings.append(meeting)
+            return self.read_meetings()
         except Exception as e:
             logging.error(f"Failed to load meetings: {str(e)}")
+            return []
+    
+    def _schedule(self, meeting: ScheduledMeeting, after: datetime) -> None:
+        """Добавляет ближайшее подключение к встрече в кучу"""
+        self._push(meeting, meeting.next_start(after))
+    
+    def _push(self, meeting: ScheduledMeeting, start: datetime) -> None:
+        """Добавляет в кучу подключение к встрече, начинающейся в start"""
+        job_id = next(self._job_ids)
+        self._jobs[meeting.key] = job_id
+        heapq.heappush(
+            self._timeline,
+            (start - timedelta(seconds=JOIN_ADVANCE), job_id, meeting.key, start)
+        )
+    
+    def _is_stale(self, job: Tuple) -> bool:
+        _, job_id, key, _ = job
+        return self._jobs.get(key) != job_id
+    
+    def reconcile(self, meetings: List[ScheduledMeeting]) -> None:
+        """
+        Приводит расписание к списку встреч. Записи кучи удаленных и
+        измененных встреч просто устаревают, а уже идущие встречи
+        в куче не хранятся, поэтому правки их не прерывают. К добавленной
+        встрече, которая уже идет или вот-вот начнется, планировщик
+        подключается сразу, в том числе при запуске
+        
+        Args:
+            meetings: Новый список встреч
+        """
+        now = datetime.now()
+        new_meetings = {
+            meeting.key: meeting for meeting in meetings if meeting.record
+        }
+        removed = self.meetings.keys() - new_meetings.keys()
+        for key in removed:
+            del self.meetings[key]
+            del self._jobs[key]
+        
+        added = changed = 0
+        for key, meeting in new_meetings.items():
+            is_new = key not in self.meetings
+            if is_new:
+                added += 1
+            elif self.meetings[key] != meeting:
+                changed += 1
+            else:
+                continue
+            self.meetings[key] = meeting
             
-        return meetings
+            start = meeting.current_start(now) if is_new else None
+            if start is not None and not self._is_joined(meeting):
+                # Время подключения уже прошло, pop_due заберет его сразу
+                self._push(meeting, start)
+            else:
+                self._schedule(meeting, now)
+        
+        logging.info(
+            f"Schedule updated: {added} added, {len(removed)} removed, "
+            f"{changed} changed, {len(self.meetings)} meetings in total"
+        )
+    
+    def _is_joined(self, meeting: ScheduledMeeting) -> bool:
+        """Есть ли незавершенный жизненный цикл этой встречи"""
+        return any(
+            lifecycle.meeting.id == meeting.id and not lifecycle.done
+            for lifecycle, _ in self.lifecycles
+        )
+    
+    def check_csv(self) -> bool:
+        """
+        Перечитывает CSV файл, если он изменился. Если файл пропал или
+        не читается, расписание остается прежним
+        
+        Returns:
+            True если расписание обновлено
+        """
+        try:
+            stat = os.stat(CSV_PATH)
+        except OSError as e:
+            if self._csv_stat is not None:
+                logging.error(f"Failed to check meetings: {str(e)}")
+                self._csv_stat = None
+            return False
+        
+        csv_stat = (stat.st_mtime_ns, stat.st_size)
+        if csv_stat == self._csv_stat:
+            return False
+        self._csv_stat = csv_stat
         
+        try:
+            meetings = self.read_meetings()
+        except Exception as e:
+            logging.error(f"Failed to load meetings, keeping the schedule: {str(e)}")
+            return False
+        self.reconcile(meetings)
+        return True
+    
     def setup_schedule(self) -> None:
         """Настраивает расписание встреч"""
-        meetings = self.load_meetings()
-        count = 0
-        
-        for meeting in meetings:
-            if meeting.record:
-                # Планируем на минуту раньше для подготовки
-                schedule_time = (
-                    datetime.strptime(meeting.time, '%H:%M') -
-                    timedelta(minutes=1)
-                ).strftime('%H:%M')
-                
-                # Создаем задачу для планировщика
-                getattr(schedule.every(), meeting.weekday.lower()).at(
-                    schedule_time
-                ).do(
-                    self.join_scheduled_meeting,
-                    meeting=meeting
-                )
-                count += 1
-                
-        logging.info(f"Added {count} meetings to schedule")
+        self._csv_stat = None
+        if not self.check_csv():
+            logging.error(f"Failed to load meetings from {CSV_PATH}")
+    
+    def next_run(self) -> Optional[datetime]:
+        """Время ближайшего подключения"""
+        while self._timeline and self._is_stale(self._timeline[0]):
+            heapq.heappop(self._timeline)
+        return self._timeline[0][0] if self._timeline else None
+    
+    def pop_due(self, now: datetime) -> List[Tuple[ScheduledMeeting, datetime]]:
+        """
+        Забирает из кучи подключения, время которых наступило, и планирует
+        следующие
+        
+        Args:
+            now: Текущее время
         
-    def join_scheduled_meeting(self, meeting: ScheduledMeeting) -> None:
+        Returns:
+            Список встреч и времени их начала
+        """
+        due = []
+        while self._timeline and self._timeline[0][0] <= now:
+            job = heapq.heappop(self._timeline)
+            if self._is_stale(job):
+                continue
+            _, _, key, start = job
+            meeting = self.meetings[key]
+            self._schedule(meeting, start)
+            
+            # Например, после сна машины
+            if now >= start + timedelta(minutes=meeting.duration):
+                logging.warning(f"Missed meeting: {meeting.description}")
+                continue
+            due.append((meeting, start))
+        return due
+    
+    def start_meeting(self, meeting_info: MeetingInfo) -> MeetingLifecycle:
+        """
+        Запускает жизненный цикл встречи в исполнителе. Клиент Zoom один,
+        поэтому идущие встречи останавливаются
+        
+        Args:
+            meeting_info: Информация о встрече
+        
+        Returns:
+            Жизненный цикл встречи
+        """
+        for lifecycle, _ in self.lifecycles:
+            lifecycle.stop(f"replaced by {meeting_info.description}")
+        if len(self.lifecycles) >= MEETING_WORKERS:
+            logging.warning(
+                f"{len(self.lifecycles)} meetings have not finished yet, "
+                f"{meeting_info.description} may wait for a free worker"
+            )
+        
+        lifecycle = MeetingLifecycle(meeting_info)
+        future = self.executor.submit(lifecycle.run)
+        # Будим планировщик, чтобы он убрал завершенную встречу
+        future.add_done_callback(lambda _: self._wakeup.set())
+        self.lifecycles.append((lifecycle, future))
+        return lifecycle
+    
+    def reap_meetings(self) -> Optional[datetime]:
+        """
+        Убирает завершенные встречи и останавливает те, что идут дольше
+        своей длительности, например зависли при подключении
+        
+        Returns:
+            Ближайшее время окончания идущих встреч
+        """
+        now = datetime.now()
+        running = []
+        for lifecycle, future in self.lifecycles:
+            if future.done():
+                if future.exception():
+                    logging.error(
+                        f"Meeting {lifecycle.meeting.description} failed: "
+                        f"{str(future.exception())}"
+                    )
+                continue
+            if now >= lifecycle.deadline:
+                lifecycle.stop("duration elapsed")
+            running.append((lifecycle, future))
+        self.lifecycles = running
+        
+        deadlines = [
+            lifecycle.deadline for lifecycle, _ in running
+            if lifecycle.deadline > now
+        ]
+        return min(deadlines) if deadlines else None
+    
+    def join_scheduled_meeting(
+        self,
+        meeting: ScheduledMeeting,
+        start: Optional[datetime] = None
+    ) -> MeetingLifecycle:
         """
         Присоединяется к запланированной встрече
         
         Args:
             meeting: Запланированная встреча
+            start: Время начала встречи, запись остановится через duration
+                минут после него. По умолчанию через duration минут от сейчас
+        
+        Returns:
+            Жизненный цикл встречи
         """
+        duration = meeting.duration * 60  # конвертируем в секунды
+        if start is not None:
+            end_date = start + timedelta(seconds=duration)
+            duration = int((end_date - datetime.now()).total_seconds())
+        
         meeting_info = MeetingInfo(
             id=meeting.id,
             password=meeting.password,
-            duration=meeting.duration * 60,  # конвертируем в секунды
+            duration=duration,
             description=meeting.description
         )
-        self.meeting_manager.join_meeting(meeting_info)
-        
-    def join_ongoing_meeting(self) -> None:
-        """Присоединяется к текущей встрече если она есть"""
-        meetings = self.load_meetings()
-        curr_date = datetime.now()
-        
-        for meeting in meetings:
-            if not meeting.record:
-                continue
-                
-            # Проверяем день недели
-            if meeting.weekday.lower() != curr_date.strftime('%A').lower():
-                continue
-                
-            # Парсим время начала
-            start_time = datetime.strptime(meeting.time, '%H:%M').time()
-            start_date = curr_date.replace(
-                hour=start_time.hour,
-                minute=start_time.minute,
-                second=0,
-                microsecond=0
-            )
-            
-            # Вычисляем время окончания
-            end_date = start_date + timedelta(minutes=meeting.duration)
-            
-            # Проверяем идет ли встреча сейчас
-            if start_date <= curr_date <= end_date:
-                # Вычисляем оставшуюся длительность
-                remaining_duration = (end_date - curr_date).total_seconds()
-                
-                meeting_info = MeetingInfo(
-                    id=meeting.id,
-                    password=meeting.password,
-                    duration=int(remaining_duration),
-                    description=meeting.description
-                )
-                self.meeting_manager.join_meeting(meeting_info)
-                break
-                
+        return self.start_meeting(meeting_info)
+    
+    def stop(self) -> None:
+        """Останавливает планировщик и идущие встречи"""
+        self._stopped = True
+        self._wakeup.set()
+    
     def run(self) -> None:
-        """Запускает планировщик"""
+        """
+        Запускает планировщик. Он просыпается только к ближайшему
+        подключению, к окончанию идущих встреч и раз в CSV_POLL_INTERVAL
+        секунд для проверки CSV файла
+        """
         self.setup_schedule()
-        self.join_ongoing_meeting()
         
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        while not self._stopped:
+            self._wakeup.clear()
+            self.check_csv()
+            for meeting, start in self.pop_due(datetime.now()):
+                self.join_scheduled_meeting(meeting, start)
+            
+            timeout = CSV_POLL_INTERVAL
+            next_end = self.reap_meetings()
+            if next_end:
+                timeout = min(
+                    timeout,
+                    max((next_end - datetime.now()).total_seconds(), 0)
+                )
             
-            # Показываем время до следующей встречи
-            next_run = schedule.next_run()
+            next_run = self.next_run()
             if next_run:
                 remaining = next_run - datetime.now()
-                print(f"Next meeting in {remaining}", end="\r", flush=True) 
\ No newline at end of file
+                timeout = min(timeout, max(remaining.total_seconds(), 0))
+                # Показываем время до следующей встречи
+                print(f"Next meeting in {remaining}", end="\r", flush=True)
+            
+            self._wakeup.wait(timeout)
+        
+        for lifecycle, _ in self.lifecycles:
+            lifecycle.stop("scheduler stopped")
+        self.executor.shutdown(wait=False)
@@ -57,7 +57,8 @@ def exit_process_by_name(name: str) -> None:
 def run_process(
     command: str,
     shell: bool = True,
-    preexec_fn: Optional[callable] = None
+    preexec_fn: Optional[callable] = None,
+    env: Optional[Dict[str, str]] = None
 ) -> Optional[psutil.Process]:
     """
     Запускает новый процесс
@@ -66,6 +67,7 @@ def run_process(
         command: Команда для запуска
         shell: Использовать ли shell
         preexec_fn: Функция для выполнения в дочернем процессе
+        env: Переменные окружения процесса
         
     Returns:
         Объект процесса или None в случае ошибки
@@ -77,7 +79,8 @@ def run_process(
             shell=shell,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            preexec_fn=preexec_fn
+            preexec_fn=preexec_fn,
+            env=env
         )
         return process
     except Exception as e:
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+# src импортирует модули управления интерфейсом и процессами
+pytest.importorskip('psutil')
+pytest.importorskip('pyautogui')
+
+from src import lifecycle as lifecycle_module
+from src.lifecycle import MeetingLifecycle
+from src.meeting import MeetingInfo
+
+
+class FakeManager:
+    def __init__(self):
+        self.ended = threading.Event()
+        self.joined = []
+        self.exited_zoom = None
+
+    def join_meeting(self, meeting, stop_event=None):
+        self.joined.append(meeting)
+        return True
+
+    def end_meeting(self, exit_zoom=True):
+        self.exited_zoom = exit_zoom
+
+
+@pytest.fixture(autouse=True)
+def fake_manager(monkeypatch):
+    monkeypatch.setattr(lifecycle_module, 'MeetingManager', FakeManager)
+    monkeypatch.setattr(lifecycle_module.notifier, 'send_message', lambda text: True)
+
+
+def make_lifecycle(duration=0):
+    return MeetingLifecycle(
+        MeetingInfo(id='123', password='', duration=duration, description='Планерка')
+    )
+
+
+def test_meeting_finishes_after_its_duration():
+    lifecycle = make_lifecycle()
+    lifecycle.run()
+    assert lifecycle.state == 'done'
+    assert lifecycle.stop_reason == 'duration elapsed'
+    assert lifecycle.manager.exited_zoom
+
+
+def test_hung_join_of_previous_meeting_fails_the_next_one(monkeypatch):
+    monkeypatch.setattr(lifecycle_module, 'JOIN_LOCK_TIMEOUT', 0.1)
+    # предыдущая встреча зависла при подключении
+    assert MeetingLifecycle._join_lock.acquire(timeout=1)
+    try:
+        lifecycle = make_lifecycle()
+        lifecycle.run()
+    finally:
+        MeetingLifecycle._join_lock.release()
+    assert lifecycle.state == 'failed'
+    assert lifecycle.manager.joined == []
+
+
+def test_stopped_meeting_is_skipped():
+    lifecycle = make_lifecycle(duration=60)
+    lifecycle.stop('replaced by Ретро')
+    lifecycle.run()
+    assert lifecycle.state == 'done'
+    assert lifecycle.manager.joined == []
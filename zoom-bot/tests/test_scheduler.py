@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+# src импортирует модули управления интерфейсом и процессами
+pytest.importorskip('psutil')
+pytest.importorskip('pyautogui')
+
+from src import scheduler as scheduler_module
+from src.config import JOIN_ADVANCE
+from src.scheduler import MeetingScheduler, ScheduledMeeting
+
+# Понедельник
+NOW = datetime(2024, 1, 15, 10, 30)
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'datetime', FrozenDatetime)
+    scheduler = MeetingScheduler()
+    yield scheduler
+    scheduler.executor.shutdown(wait=False)
+
+
+def make_meeting(time, weekday='monday', duration=60, description='Планерка'):
+    return ScheduledMeeting(
+        weekday=weekday,
+        time=time,
+        id='123',
+        password='',
+        duration=duration,
+        description=description,
+        record=True
+    )
+
+
+def test_current_start():
+    meeting = make_meeting('10:00')
+    start = datetime(2024, 1, 15, 10, 0)
+    assert meeting.current_start(NOW) == start
+    assert meeting.current_start(start - timedelta(seconds=JOIN_ADVANCE)) == start
+    assert meeting.current_start(start - timedelta(seconds=JOIN_ADVANCE + 1)) is None
+    assert meeting.current_start(start + timedelta(minutes=60)) is None
+
+
+def test_ongoing_meeting_is_joined_at_once(scheduler):
+    meeting = make_meeting('10:00')
+    scheduler.reconcile([meeting])
+    assert scheduler.pop_due(NOW) == [(meeting, datetime(2024, 1, 15, 10, 0))]
+    # следующее подключение через неделю
+    assert scheduler.next_run() == datetime(2024, 1, 22, 10, 0) - timedelta(
+        seconds=JOIN_ADVANCE
+    )
+
+
+def test_meeting_about_to_start_is_joined_at_once(scheduler):
+    start = NOW + timedelta(seconds=JOIN_ADVANCE // 2)
+    meeting = make_meeting(start.strftime('%H:%M'))
+    scheduler.reconcile([meeting])
+    assert scheduler.pop_due(NOW) == [(meeting, start.replace(second=0))]
+
+
+def test_ended_meeting_waits_for_next_week(scheduler):
+    meeting = make_meeting('08:00')
+    scheduler.reconcile([meeting])
+    assert scheduler.pop_due(NOW) == []
+    assert scheduler.next_run() == datetime(2024, 1, 22, 8, 0) - timedelta(
+        seconds=JOIN_ADVANCE
+    )
+
+
+def test_joined_meeting_is_not_joined_again(scheduler):
+    lifecycle = SimpleNamespace(meeting=SimpleNamespace(id='123'), done=False)
+    scheduler.lifecycles = [(lifecycle, None)]
+    scheduler.reconcile([make_meeting('10:00')])
+    assert scheduler.pop_due(NOW) == []
+
+
+def test_changed_meeting_is_rescheduled(scheduler):
+    scheduler.reconcile([make_meeting('12:00')])
+    changed = make_meeting('12:00', duration=90, description='Ретро')
+    scheduler.reconcile([changed])
+    join_at = datetime(2024, 1, 15, 12, 0) - timedelta(seconds=JOIN_ADVANCE)
+    assert scheduler.next_run() == join_at
+    assert scheduler.pop_due(join_at) == [(changed, datetime(2024, 1, 15, 12, 0))]
+
+
+def test_removed_meeting_is_not_joined(scheduler):
+    scheduler.reconcile([make_meeting('12:00')])
+    scheduler.reconcile([])
+    assert scheduler.next_run() is None
+    assert scheduler.pop_due(datetime(2024, 1, 15, 12, 0)) == []